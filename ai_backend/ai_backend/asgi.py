@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+aiapi 的接口都是异步视图，部署时使用 ASGI 服务器，例如：
+    uvicorn ai_backend.asgi:application --port 8001
 """
 
 import os
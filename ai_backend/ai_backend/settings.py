@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -29,8 +30,34 @@ ALLOWED_HOSTS = []
 
 OPENAI_API_KEY = "你的OpenAI_API_Key"
 
+# 上游提供方：openai，或本地模拟模型 fake（压测、离线测试用，可通过环境变量 GPT_PROVIDER=fake 切换）
+GPT_PROVIDER = os.environ.get('GPT_PROVIDER', 'openai')
+# 模拟模型参数：首 token 延迟中位数（秒）与对数正态离散度、错误率、每秒输出字数、随机种子
+GPT_FAKE_LATENCY_MEDIAN = float(os.environ.get('GPT_FAKE_LATENCY_MEDIAN', 0.8))
+GPT_FAKE_LATENCY_SIGMA = float(os.environ.get('GPT_FAKE_LATENCY_SIGMA', 0.5))
+GPT_FAKE_ERROR_RATE = float(os.environ.get('GPT_FAKE_ERROR_RATE', 0))
+GPT_FAKE_TOKENS_PER_SECOND = float(os.environ.get('GPT_FAKE_TOKENS_PER_SECOND', 50))
+GPT_FAKE_SEED = int(os.environ.get('GPT_FAKE_SEED', 0))
+
 GPT_API_BASE_URL = "https://api.openai.com/v1"  # 推荐用官方API
 GPT_API_KEY = "你的OpenAI_API_Key"  # 如果你的测试API需要key就填，否则留空
+# 单个进程同时进行的上游请求数上限，以及单次请求超时（秒）
+GPT_MAX_CONCURRENCY = 100
+GPT_API_TIMEOUT = 60
+# 容错：429/5xx 和网络错误的重试次数与退避时间（秒）
+GPT_MAX_RETRIES = 2
+GPT_RETRY_BASE_DELAY = 0.5
+GPT_RETRY_MAX_DELAY = 8
+# 请求超过近期 p95 耗时仍未返回时发出对冲请求（会增加上游调用量，默认关闭）
+GPT_HEDGE_ENABLED = False
+GPT_HEDGE_MIN_SAMPLES = 20
+# 连续失败多少次后熔断，熔断多少秒后放行探测请求
+GPT_CIRCUIT_FAILURE_THRESHOLD = 5
+GPT_CIRCUIT_RESET_TIMEOUT = 30
+# 相同请求合并：配置 Redis 后跨进程合并，等待其它进程结果的最长秒数，以及结果在 Redis 中保留的秒数
+GPT_SINGLEFLIGHT_REDIS_URL = None  # 例如 'redis://127.0.0.1:6379/1'
+GPT_SINGLEFLIGHT_WAIT = 60
+GPT_SINGLEFLIGHT_RESULT_TTL = 5
 
 # Application definition
 
@@ -0,0 +1,71 @@
+"""
+异步调用上游大模型接口
+
+具体的提供方（OpenAI 或本地模拟模型）见 providers.py；这里负责并发限制、相同请求合并和容错。
+全局信号量限制同时进行的上游请求数，单个进程即可承载数百个并发的批改/答疑请求。
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+
+from . import singleflight
+from .providers import get_provider
+from .resilience import breaker, call_with_resilience
+
+# Semaphore 绑定事件循环，按循环分别创建
+_semaphores = {}
+
+
+def max_concurrency():
+    return getattr(settings, 'GPT_MAX_CONCURRENCY', 100)
+
+
+def get_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        for other in [l for l in _semaphores if l.is_closed()]:
+            _semaphores.pop(other)
+        semaphore = _semaphores[loop] = asyncio.Semaphore(max_concurrency())
+    return semaphore
+
+
+async def call_gpt_api(messages):
+    """
+    调用 GPT API 返回回复文本；经过熔断、重试和对冲处理，熔断时抛出 CircuitOpenError。
+    同时到达的相同请求合并为一次上游调用
+    """
+    provider = get_provider()
+
+    async def request():
+        async with get_semaphore():
+            return await provider.complete(messages)
+
+    key = singleflight.request_key({"provider": provider.name, "model": provider.model, "messages": messages})
+    try:
+        return await singleflight.do(key, lambda: call_with_resilience(request))
+    except Exception as e:
+        logging.error(f"调用GPT API失败: {e}")
+        raise
+
+
+async def stream_gpt_api(messages):
+    """
+    流式调用 GPT API，逐段返回生成的文本；生成期间一直占用一个并发名额。
+    已经输出的内容无法撤回，因此流式请求不重试，只参与熔断统计
+    """
+    probe = breaker.before_call()
+    try:
+        async with get_semaphore():
+            async for delta in get_provider().stream(messages):
+                yield delta
+    except Exception:
+        breaker.record_failure()
+        raise
+    else:
+        breaker.record_success()
+    finally:
+        # 被取消或客户端提前断开时没有结论，释放探测名额
+        if probe:
+            breaker.release_probe()
@@ -0,0 +1,182 @@
+"""
+上游大模型提供方
+
+call_gpt_api / stream_gpt_api 通过 get_provider() 取得当前提供方，由 GPT_PROVIDER 选择：
+- openai：调用 OpenAI 兼容的 chat/completions 接口；
+- fake：本地模拟模型，不需要 API Key 和网络，延迟分布、错误率和输出速度可配置，
+  同一 prompt 第 n 次调用的输出和耗时固定，用于压测和离线测试批改吞吐。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+
+import httpx
+from django.conf import settings
+
+from .resilience import UpstreamError
+
+
+class OpenAIProvider:
+    name = 'openai'
+    model = 'gpt-3.5-turbo'
+
+    def __init__(self):
+        # AsyncClient 绑定事件循环，按循环分别创建；同一循环内共用 keep-alive 连接池
+        self.clients = {}
+
+    def get_client(self):
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            for other in [l for l in self.clients if l.is_closed()]:
+                self.clients.pop(other)
+            max_connections = getattr(settings, 'GPT_MAX_CONCURRENCY', 100)
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(getattr(settings, 'GPT_API_TIMEOUT', 60), connect=5),
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=20),
+            )
+            self.clients[loop] = client
+        return client
+
+    def request_args(self, messages, stream=False):
+        url = f"{getattr(settings, 'GPT_API_BASE_URL', 'https://api.openai.com/v1')}/chat/completions"
+        headers = {
+            "Content-Type": "application/json",
+        }
+        api_key = getattr(settings, "GPT_API_KEY", None) or getattr(settings, "OPENAI_API_KEY", None)
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+
+        data = {
+            "model": self.model,
+            "messages": messages
+        }
+        if stream:
+            data["stream"] = True
+        return url, headers, data
+
+    async def complete(self, messages):
+        url, headers, data = self.request_args(messages)
+        resp = await self.get_client().post(url, headers=headers, json=data)
+        if resp.status_code != 200:
+            logging.error(f"GPT API返回非200: {resp.status_code}, 内容: {resp.text}")
+            raise UpstreamError(f"GPT API错误: {resp.status_code}, 内容: {resp.text}", resp.status_code)
+        try:
+            return resp.json()["choices"][0]["message"]["content"]
+        except Exception:
+            logging.error(f"GPT API返回内容无法解析为JSON: {resp.text}")
+            raise UpstreamError(f"GPT API返回内容无法解析为JSON: {resp.text}")
+
+    async def stream(self, messages):
+        url, headers, data = self.request_args(messages, stream=True)
+        async with self.get_client().stream('POST', url, headers=headers, json=data) as resp:
+            if resp.status_code != 200:
+                text = (await resp.aread()).decode('utf-8', 'replace')
+                logging.error(f"GPT API返回非200: {resp.status_code}, 内容: {text}")
+                raise UpstreamError(f"GPT API错误: {resp.status_code}, 内容: {text}", resp.status_code)
+            async for line in resp.aiter_lines():
+                line = line.strip()
+                if not line.startswith('data:'):
+                    continue
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    break
+                delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+BATCH_ITEM_RE = re.compile(r'【题号 (\d+)】满分([\d.]+)分')
+MAX_SCORE_RE = re.compile(r'满分([\d.]+)分')
+
+
+class FakeProvider:
+    """
+    本地模拟模型：按 prompt 类型生成可被解析的回复（单题评分、批量评分 JSON、答疑文本）。
+    耗时 = 首 token 延迟（对数正态分布，中位数 GPT_FAKE_LATENCY_MEDIAN 秒、离散度 GPT_FAKE_LATENCY_SIGMA）
+          + 输出字数 / GPT_FAKE_TOKENS_PER_SECOND；
+    以 GPT_FAKE_ERROR_RATE 的概率返回 503
+    """
+    name = 'fake'
+    model = 'fake'
+
+    def __init__(self):
+        self.counts = {}
+
+    def rng(self, messages):
+        # 同一 prompt 的第 n 次调用使用固定的随机序列：结果可复现，重试时又不会重复同一个错误
+        raw = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+        n = self.counts[digest] = self.counts.get(digest, 0) + 1
+        return random.Random(f"{getattr(settings, 'GPT_FAKE_SEED', 0)}:{digest}:{n}")
+
+    def first_token_delay(self, rng):
+        median = getattr(settings, 'GPT_FAKE_LATENCY_MEDIAN', 0.8)
+        if median <= 0:
+            return 0
+        return rng.lognormvariate(0, getattr(settings, 'GPT_FAKE_LATENCY_SIGMA', 0.5)) * median
+
+    def token_delay(self):
+        tokens_per_second = getattr(settings, 'GPT_FAKE_TOKENS_PER_SECOND', 50)
+        return 1 / tokens_per_second if tokens_per_second else 0
+
+    def reply(self, messages, rng):
+        prompt = messages[-1]["content"]
+        items = BATCH_ITEM_RE.findall(prompt)
+        if items:
+            return json.dumps([
+                {"id": int(index), "score": self.score(rng, max_score), "comment": "模拟评语"}
+                for index, max_score in items
+            ], ensure_ascii=False)
+        match = MAX_SCORE_RE.search(prompt)
+        if match:
+            return f"分数: {self.score(rng, match.group(1))}\n评语: 模拟评语"
+        return "这是本地模拟模型的回答：" + "先回顾相关概念，再一步步推理。" * rng.randint(1, 4)
+
+    def score(self, rng, max_score):
+        return round(float(max_score) * rng.uniform(0.4, 1), 1)
+
+    def maybe_fail(self, rng):
+        if rng.random() < getattr(settings, 'GPT_FAKE_ERROR_RATE', 0):
+            raise UpstreamError("模拟上游错误: 503", 503)
+
+    async def complete(self, messages):
+        rng = self.rng(messages)
+        await asyncio.sleep(self.first_token_delay(rng))
+        self.maybe_fail(rng)
+        content = self.reply(messages, rng)
+        await asyncio.sleep(len(content) * self.token_delay())
+        return content
+
+    async def stream(self, messages):
+        rng = self.rng(messages)
+        await asyncio.sleep(self.first_token_delay(rng))
+        self.maybe_fail(rng)
+        delay = self.token_delay()
+        for token in self.reply(messages, rng):
+            await asyncio.sleep(delay)
+            yield token
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'fake': FakeProvider,
+}
+_providers = {}
+
+
+def get_provider():
+    name = getattr(settings, 'GPT_PROVIDER', 'openai')
+    provider = _providers.get(name)
+    if provider is None:
+        if name not in PROVIDERS:
+            raise ValueError(f"未知的 GPT_PROVIDER: {name}")
+        provider = _providers[name] = PROVIDERS[name]()
+    return provider
+
+
+def reset():
+    _providers.clear()
@@ -0,0 +1,230 @@
+"""
+上游大模型调用的容错层
+
+- 重试：仅对可重试的状态码（429/5xx 等）和网络错误，按带抖动的指数退避重试；
+- 对冲请求：请求耗时超过近期 p95 仍未返回时，再发一个相同请求，取先成功的结果；
+- 熔断：连续失败达到阈值后一段时间内直接拒绝，让调用方把任务放回待批改队列，
+  冷却后放行一个探测请求，成功则恢复。
+
+状态保存在进程内，每个 ASGI worker 各自熔断。
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+from django.conf import settings
+
+RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"AI服务熔断中，{retry_after:.0f}秒后重试")
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    if isinstance(error, UpstreamError):
+        return error.retryable
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+def backoff_delay(attempt):
+    """
+    第 attempt 次重试前的等待时间：在 [0, min(上限, 基数 * 2^attempt)] 内均匀取值（full jitter）
+    """
+    base = getattr(settings, 'GPT_RETRY_BASE_DELAY', 0.5)
+    cap = getattr(settings, 'GPT_RETRY_MAX_DELAY', 8)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+        self.total_opens = 0
+
+    @property
+    def failure_threshold(self):
+        return getattr(settings, 'GPT_CIRCUIT_FAILURE_THRESHOLD', 5)
+
+    @property
+    def reset_timeout(self):
+        return getattr(settings, 'GPT_CIRCUIT_RESET_TIMEOUT', 30)
+
+    def retry_after(self):
+        """
+        熔断打开且仍在冷却期时返回剩余秒数，否则返回 None
+        """
+        if self.state != 'open':
+            return None
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        return remaining if remaining > 0 else None
+
+    def before_call(self):
+        """
+        熔断打开时抛出 CircuitOpenError；冷却结束后只放行一个探测请求，返回本次调用是否为探测请求
+        """
+        if self.state == 'open':
+            remaining = self.retry_after()
+            if remaining:
+                raise CircuitOpenError(remaining)
+            self.state = 'half_open'
+        if self.state == 'half_open':
+            if self.probing:
+                raise CircuitOpenError(1)
+            self.probing = True
+            return True
+        return False
+
+    def release_probe(self):
+        """
+        探测请求未得出结果就结束（被取消、流式输出被提前关闭）时释放探测名额，下一个请求重新探测
+        """
+        if self.state == 'half_open':
+            self.probing = False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.total_opens += 1
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        data = {'state': self.state, 'consecutive_failures': self.failures, 'total_opens': self.total_opens}
+        if self.retry_after():
+            data['retry_after'] = round(self.retry_after(), 1)
+        return data
+
+
+class LatencyTracker:
+    """
+    记录最近的成功请求耗时，用于计算对冲请求的触发阈值
+    """
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+breaker = CircuitBreaker()
+latency = LatencyTracker()
+stats = {'calls': 0, 'retries': 0, 'hedged': 0, 'hedge_wins': 0, 'failures': 0}
+
+
+def hedge_delay():
+    """
+    发出对冲请求前等待的秒数；未开启或样本不足时返回 None
+    """
+    if not getattr(settings, 'GPT_HEDGE_ENABLED', False):
+        return None
+    if len(latency.samples) < getattr(settings, 'GPT_HEDGE_MIN_SAMPLES', 20):
+        return None
+    return latency.percentile(0.95)
+
+
+async def hedged(make_request):
+    delay = hedge_delay()
+    first = asyncio.ensure_future(make_request())
+    if delay is None:
+        return await first
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    stats['hedged'] += 1
+    second = asyncio.ensure_future(make_request())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        stats['hedge_wins'] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_resilience(make_request):
+    """
+    带熔断、重试和对冲的上游调用；make_request 为返回协程的无参函数，失败时抛出 UpstreamError 等异常
+    """
+    probe = breaker.before_call()
+    try:
+        stats['calls'] += 1
+        max_retries = getattr(settings, 'GPT_MAX_RETRIES', 2)
+        for attempt in range(max_retries + 1):
+            started = time.monotonic()
+            try:
+                result = await hedged(make_request)
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.record_success()
+                    raise
+                if attempt == max_retries:
+                    stats['failures'] += 1
+                    breaker.record_failure()
+                    raise
+                stats['retries'] += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            latency.add(time.monotonic() - started)
+            breaker.record_success()
+            return result
+    finally:
+        if probe:
+            breaker.release_probe()
+
+
+def reset():
+    breaker.reset()
+    latency.samples.clear()
+    stats.update(dict.fromkeys(stats, 0))
+
+
+def snapshot():
+    return {
+        'circuit': breaker.snapshot(),
+        'latency_p50': latency.percentile(0.5),
+        'latency_p95': latency.percentile(0.95),
+        **stats,
+    }
@@ -0,0 +1,137 @@
+"""
+相同请求合并（single-flight）
+
+全班同时打开同一份作业时，会有大量完全相同的答疑/批改 prompt 同时到达。
+按请求内容的哈希合并：同一时刻相同的请求只向上游发一次，其余请求等待并共享结果（或异常）。
+
+- 进程内：同一事件循环中的相同请求共享一个 asyncio.Task；
+- 跨进程（可选，配置 GPT_SINGLEFLIGHT_REDIS_URL 后启用）：用 Redis 锁选出一个进程调用上游，
+  结果短时间写入 Redis，其它进程轮询读取；Redis 不可用时退化为各进程自行调用。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # 未安装 redis 时只做进程内合并
+    aioredis = None
+    RedisError = Exception
+
+LOCK_PREFIX = 'aiapi:sf:lock:'
+RESULT_PREFIX = 'aiapi:sf:result:'
+POLL_INTERVAL = 0.05
+
+# Task 和 Redis 连接都绑定事件循环，按循环分别保存
+_flights = {}
+_redis_clients = {}
+stats = {'leaders': 0, 'coalesced': 0, 'shared_across_processes': 0}
+
+
+def request_key(data):
+    """
+    请求体（模型 + messages 等）的哈希
+    """
+    raw = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def get_redis():
+    url = getattr(settings, 'GPT_SINGLEFLIGHT_REDIS_URL', None)
+    if not url or aioredis is None:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _redis_clients.get(loop)
+    if client is None:
+        for other in [l for l in _redis_clients if l.is_closed()]:
+            _redis_clients.pop(other)
+        client = _redis_clients[loop] = aioredis.Redis.from_url(url)
+    return client
+
+
+async def do(key, call):
+    """
+    合并执行 call（返回协程的无参函数）：相同 key 的并发调用只执行一次，共享结果或异常。
+    调用方被取消不会影响正在进行的上游请求
+    """
+    flights = _flights.setdefault(asyncio.get_running_loop(), {})
+    task = flights.get(key)
+    if task is None:
+        stats['leaders'] += 1
+        task = flights[key] = asyncio.ensure_future(run(key, call))
+
+        def finished(done):
+            if flights.get(key) is done:
+                flights.pop(key)
+            if not done.cancelled():
+                done.exception()  # 所有等待方都已离开时避免“异常未被读取”的警告
+
+        task.add_done_callback(finished)
+    else:
+        stats['coalesced'] += 1
+    return await asyncio.shield(task)
+
+
+async def run(key, call):
+    client = get_redis()
+    if client is None:
+        return await call()
+    return await run_shared(client, key, call)
+
+
+async def run_shared(client, key, call):
+    """
+    跨进程合并：抢到锁的进程调用上游并写回结果，其余进程等待结果；
+    等待超时或 Redis 出错时自行调用
+    """
+    lock_key, result_key = LOCK_PREFIX + key, RESULT_PREFIX + key
+    timeout = getattr(settings, 'GPT_SINGLEFLIGHT_WAIT', 60)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            cached = await client.get(result_key)
+            if cached is not None:
+                stats['shared_across_processes'] += 1
+                return json.loads(cached)
+            if await client.set(lock_key, 1, nx=True, px=int(timeout * 1000)):
+                break
+            if loop.time() >= deadline:
+                return await call()
+            await asyncio.sleep(POLL_INTERVAL)
+    except RedisError as e:
+        logging.warning(f"single-flight Redis 不可用，直接调用上游: {e}")
+        return await call()
+
+    try:
+        result = await call()
+    except Exception:
+        await release(client, lock_key)
+        raise
+    try:
+        await client.set(result_key, json.dumps(result, ensure_ascii=False),
+                         ex=getattr(settings, 'GPT_SINGLEFLIGHT_RESULT_TTL', 5))
+    except RedisError as e:
+        logging.warning(f"single-flight 结果写入 Redis 失败: {e}")
+    await release(client, lock_key)
+    return result
+
+
+async def release(client, lock_key):
+    try:
+        await client.delete(lock_key)
+    except RedisError as e:
+        logging.warning(f"single-flight 释放锁失败: {e}")
+
+
+def reset():
+    _flights.clear()
+    stats.update(dict.fromkeys(stats, 0))
+
+
+def snapshot():
+    return {'in_flight': sum(len(f) for f in _flights.values()), **stats}
@@ -1,3 +1,402 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.test import AsyncClient, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import llm, providers, resilience, singleflight
+from .views import pack_grade_items, parse_grade_content, format_batch_item, BATCH_PROMPT_HEADER
+
+
+def grade_items(n, answer='学生答案'):
+    return [
+        {'question': f'题目{i}', 'answer': answer, 'reference_answer': '参考答案', 'max_score': 10}
+        for i in range(n)
+    ]
+
+
+class GradePromptTest(TestCase):
+    def test_parse_grade_content(self):
+        self.assertEqual(parse_grade_content('分数: 8.5\n评语: 思路清晰'), (8.5, '思路清晰'))
+        self.assertEqual(parse_grade_content('无法评分'), (0, ''))
+
+    def test_pack_respects_budget_and_order(self):
+        items = grade_items(10, answer='很长的答案' * 40)
+        item_cost = len(format_batch_item(0, items[0])) + 150
+        budget = len(BATCH_PROMPT_HEADER) + item_cost * 3 + 10
+        batches = pack_grade_items(items, budget=budget, max_items=20)
+        self.assertEqual([i for batch in batches for i in batch], list(range(10)))
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 3, 1])
+        self.assertEqual([len(b) for b in pack_grade_items(grade_items(5), max_items=2)], [2, 2, 1])
+
+
+    def test_single_grade_is_clamped_to_max_score(self):
+        client = APIClient()
+        for reply, expected in (('分数: 99\n评语: 满分', 8), ('分数: -3\n评语: 差', 0)):
+            with mock.patch('aiapi.views.call_gpt_api', return_value=reply):
+                response = client.post('/api/grade/', {'question': 'q', 'answer': 'a', 'max_score': 8}, format='json')
+            self.assertEqual(response.json()['score'], expected)
+
+class GradeBatchViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, items):
+        return self.client.post('/api/grade_batch/', {'items': items}, format='json')
+
+    def test_items_packed_into_one_llm_call(self):
+        reply = json.dumps([{'id': i, 'score': i, 'comment': f'评语{i}'} for i in range(5)], ensure_ascii=False)
+        with mock.patch('aiapi.views.call_gpt_api', return_value=f'```json\n{reply}\n```') as call:
+            response = self.post(grade_items(5))
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(response.json()['results'], [{'score': i, 'comment': f'评语{i}'} for i in range(5)])
+
+    def test_unparsed_items_are_retried_individually(self):
+        def fake_llm(messages):
+            prompt = messages[0]['content']
+            if '【题号' in prompt:
+                # 漏掉第 1 题，第 2 题分数超出满分
+                return json.dumps([{'id': 0, 'score': 6, 'comment': '好'}, {'id': 2, 'score': 99, 'comment': '满分'}])
+            if '题目1' in prompt:
+                raise Exception('超时')
+            return '分数: 3\n评语: 一般'
+
+        with mock.patch('aiapi.views.call_gpt_api', side_effect=fake_llm) as call:
+            results = self.post(grade_items(3)).json()['results']
+        self.assertEqual(call.call_count, 2)
+        self.assertEqual(results[0], {'score': 6, 'comment': '好'})
+        self.assertEqual(results[1]['score'], 0)
+        self.assertEqual(results[1]['error'], '超时')
+        self.assertEqual(results[2]['score'], 10)
+
+    def test_invalid_body(self):
+        self.assertEqual(self.client.post('/api/grade_batch/', {'items': 'x'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/grade_batch/', {'items': ['x']}, format='json').status_code, 400)
+
+
+def mock_upstream(handler):
+    real_client = httpx.AsyncClient
+    providers.reset()
+    llm._semaphores.clear()
+    resilience.reset()
+    singleflight.reset()
+    return mock.patch('aiapi.providers.httpx.AsyncClient', side_effect=lambda **kwargs: real_client(
+        transport=httpx.MockTransport(handler), **kwargs
+    ))
+
+
+@override_settings(GPT_API_KEY='test-key')
+class AskStreamViewTest(TestCase):
+    async def stream(self, body, status_code=200):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return httpx.Response(status_code, content=body.encode('utf-8'))
+
+        with mock_upstream(handler):
+            response = await AsyncClient().post(
+                '/api/ask_stream/', {'question': '什么是质数'}, content_type='application/json'
+            )
+            content = ''.join([chunk.decode('utf-8') async for chunk in response.streaming_content])
+        self.assertTrue(requests[0]['stream'])
+        return response, content
+
+    async def test_provider_tokens_are_forwarded_as_events(self):
+        chunk = lambda text: 'data: ' + json.dumps({'choices': [{'delta': {'content': text}}]}, ensure_ascii=False)
+        response, body = await self.stream('\n'.join([chunk('质数'), '', chunk('是'), ': keep-alive', 'data: [DONE]']))
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        self.assertEqual(body, (
+            'data: {"delta": "质数"}\n\n'
+            'data: {"delta": "是"}\n\n'
+            'event: done\ndata: {}\n\n'
+        ))
+
+    async def test_provider_error_ends_stream_with_error_event(self):
+        _, body = await self.stream('rate limited', status_code=429)
+        self.assertTrue(body.startswith('event: error\n'))
+        self.assertIn('429', body)
+
+
+@override_settings(GPT_API_KEY='test-key')
+class ConcurrencyTest(TestCase):
+    async def test_upstream_calls_share_client_and_respect_semaphore(self):
+        in_flight = []
+        peak = []
+
+        async def handler(request):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.02)
+            in_flight.pop()
+            return httpx.Response(200, json={'choices': [{'message': {'content': '分数: 3\n评语: 可以'}}]})
+
+        with self.settings(GPT_MAX_CONCURRENCY=3), mock_upstream(handler) as client_class:
+            client = AsyncClient()
+            responses = await asyncio.gather(*(
+                client.post('/api/grade/', {'question': f'q{i}', 'answer': 'a'}, content_type='application/json')
+                for i in range(8)
+            ))
+        self.assertEqual([r.json()['score'] for r in responses], [3] * 8)
+        self.assertEqual(max(peak), 3)
+        # 同一事件循环内共用一个连接池
+        self.assertEqual(client_class.call_count, 1)
+
+
+@override_settings(
+    GPT_API_KEY='test-key', GPT_RETRY_BASE_DELAY=0, GPT_MAX_RETRIES=2,
+    GPT_CIRCUIT_FAILURE_THRESHOLD=2, GPT_CIRCUIT_RESET_TIMEOUT=30,
+)
+class ResilienceTest(TestCase):
+    def setUp(self):
+        resilience.reset()
+
+    def tearDown(self):
+        resilience.reset()
+
+    def upstream(self, *statuses, delays=None):
+        """
+        依次返回给定状态码；200 时返回一段固定评分
+        """
+        calls = []
+
+        async def handler(request):
+            index = len(calls)
+            calls.append(index)
+            if delays:
+                await asyncio.sleep(delays[min(index, len(delays) - 1)])
+            status = statuses[min(index, len(statuses) - 1)]
+            if status != 200:
+                return httpx.Response(status, text='busy')
+            return httpx.Response(200, json={'choices': [{'message': {'content': f'分数: {index}\n评语: 第{index}次'}}]})
+
+        return calls, mock_upstream(handler)
+
+    async def grade(self):
+        return await AsyncClient().post('/api/grade/', {'question': 'q', 'answer': 'a'}, content_type='application/json')
+
+    async def test_retryable_statuses_are_retried(self):
+        calls, upstream = self.upstream(429, 503, 200)
+        with upstream:
+            response = await self.grade()
+        self.assertEqual((response.status_code, response.json()['score']), (200, 2))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(resilience.stats['retries'], 2)
+
+    async def test_client_errors_are_not_retried(self):
+        calls, upstream = self.upstream(400)
+        with upstream:
+            response = await self.grade()
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(resilience.breaker.state, 'closed')
+
+    async def test_breaker_opens_fails_fast_and_recovers(self):
+        calls, upstream = self.upstream(500, 500, 500, 500, 500, 500, 200)
+        with upstream:
+            self.assertEqual((await self.grade()).status_code, 502)
+            self.assertEqual((await self.grade()).status_code, 502)
+            self.assertEqual(len(calls), 6)
+
+            response = await self.grade()
+            self.assertEqual(response.status_code, 503)
+            self.assertGreater(int(response['Retry-After']), 0)
+            batch = await AsyncClient().post(
+                '/api/grade_batch/', {'items': grade_items(2)}, content_type='application/json'
+            )
+            self.assertEqual(batch.status_code, 503)
+            self.assertEqual(len(calls), 6)
+            status = (await AsyncClient().get('/api/status/')).json()
+            self.assertEqual((status['circuit']['state'], status['failures']), ('open', 2))
+
+            # 冷却结束后放行探测请求，成功即恢复
+            resilience.breaker.opened_at -= 30
+            self.assertEqual((await self.grade()).status_code, 200)
+        self.assertEqual(resilience.breaker.state, 'closed')
+
+    async def test_cancelled_probe_releases_half_open_breaker(self):
+        resilience.breaker.state = 'open'
+        resilience.breaker.opened_at = time.monotonic() - 60
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.ensure_future(resilience.call_with_resilience(hang))
+        await started.wait()
+        with self.assertRaises(resilience.CircuitOpenError):
+            await resilience.call_with_resilience(hang)
+        probe.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await probe
+        self.assertEqual((resilience.breaker.state, resilience.breaker.probing), ('half_open', False))
+
+        # 下一个请求重新探测，成功即恢复
+        async def ok():
+            return 'ok'
+
+        self.assertEqual(await resilience.call_with_resilience(ok), 'ok')
+        self.assertEqual(resilience.breaker.state, 'closed')
+
+    async def test_stream_closed_early_releases_probe(self):
+        async def handler(request):
+            return httpx.Response(200, text='data: {"choices": [{"delta": {"content": "一"}}]}\n\n' * 3)
+
+        upstream = mock_upstream(handler)
+        resilience.breaker.state = 'open'
+        resilience.breaker.opened_at = time.monotonic() - 60
+        with upstream, override_settings(GPT_API_KEY='test-key'):
+            stream = llm.stream_gpt_api([{'role': 'user', 'content': 'q'}])
+            self.assertEqual(await stream.__anext__(), '一')
+            await stream.aclose()
+        self.assertEqual((resilience.breaker.state, resilience.breaker.probing), ('half_open', False))
+
+    @override_settings(GPT_HEDGE_ENABLED=True, GPT_HEDGE_MIN_SAMPLES=5)
+    async def test_slow_request_is_hedged(self):
+        calls, upstream = self.upstream(200, delays=[1, 0])
+        for _ in range(5):
+            resilience.latency.add(0.01)
+        with upstream:
+            response = await self.grade()
+        self.assertEqual(response.json()['score'], 1)
+        self.assertEqual((resilience.stats['hedged'], resilience.stats['hedge_wins']), (1, 1))
+
+
+class FakeRedis:
+    """
+    进程间共享的 Redis 的最小替身，只实现 single-flight 用到的命令
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+@override_settings(GPT_API_KEY='test-key', GPT_MAX_RETRIES=0)
+class SingleFlightTest(TestCase):
+    def upstream(self, status=200):
+        calls = []
+
+        async def handler(request):
+            calls.append(json.loads(request.content)['messages'][0]['content'])
+            index = len(calls)
+            await asyncio.sleep(0.05)
+            if status != 200:
+                return httpx.Response(status, text='bad request')
+            return httpx.Response(200, json={'choices': [{'message': {'content': f'回答{index}'}}]})
+
+        return calls, mock_upstream(handler)
+
+    async def ask_all(self, questions):
+        client = AsyncClient()
+        return await asyncio.gather(*(
+            client.post('/api/ask/', {'question': q}, content_type='application/json') for q in questions
+        ))
+
+    async def test_identical_concurrent_requests_share_one_call(self):
+        calls, upstream = self.upstream()
+        with upstream:
+            responses = await self.ask_all(['什么是质数'] * 10 + ['什么是合数'])
+        self.assertEqual(len(calls), 2)
+        answers = [r.json()['answer'] for r in responses]
+        self.assertEqual(len(set(answers[:10])), 1)
+        self.assertNotEqual(answers[10], answers[0])
+        self.assertEqual((singleflight.stats['leaders'], singleflight.stats['coalesced']), (2, 9))
+        self.assertEqual(singleflight.snapshot()['in_flight'], 0)
+
+        # 请求结束后不再合并
+        with upstream:
+            await self.ask_all(['什么是质数'])
+        self.assertEqual(len(calls), 3)
+
+    async def test_failure_is_shared(self):
+        calls, upstream = self.upstream(status=400)
+        with upstream:
+            responses = await self.ask_all(['什么是质数'] * 5)
+        self.assertEqual([r.status_code for r in responses], [502] * 5)
+        self.assertEqual(len(calls), 1)
+
+    async def test_redis_shares_result_across_processes(self):
+        redis = FakeRedis()
+        upstream_calls = []
+
+        async def leader_call():
+            upstream_calls.append('leader')
+            await asyncio.sleep(0.1)
+            return '共享的回答'
+
+        async def follower_call():
+            upstream_calls.append('follower')
+            return '不应调用'
+
+        leader = asyncio.ensure_future(singleflight.run_shared(redis, 'k', leader_call))
+        await asyncio.sleep(0)
+        follower = await singleflight.run_shared(redis, 'k', follower_call)
+        self.assertEqual((await leader, follower), ('共享的回答', '共享的回答'))
+        self.assertEqual(upstream_calls, ['leader'])
+        self.assertNotIn(singleflight.LOCK_PREFIX + 'k', redis.data)
+
+
+@override_settings(
+    GPT_PROVIDER='fake', GPT_FAKE_LATENCY_MEDIAN=0, GPT_FAKE_TOKENS_PER_SECOND=0,
+    GPT_FAKE_ERROR_RATE=0, GPT_MAX_RETRIES=0,
+)
+class FakeProviderTest(TestCase):
+    def setUp(self):
+        providers.reset()
+        resilience.reset()
+        singleflight.reset()
+
+    async def grade(self, max_score=10):
+        response = await AsyncClient().post(
+            '/api/grade/', {'question': 'q', 'answer': 'a', 'max_score': max_score}, content_type='application/json'
+        )
+        return response.status_code, response.json()
+
+    async def test_grading_is_deterministic_and_parseable(self):
+        first = await self.grade()
+        second = await self.grade()
+        providers.reset()
+        self.assertEqual(await self.grade(), first)
+        self.assertEqual(first[0], 200)
+        self.assertTrue(4 <= first[1]['score'] <= 10)
+        self.assertNotEqual(first, second)
+
+        batch = (await AsyncClient().post(
+            '/api/grade_batch/', {'items': grade_items(6)}, content_type='application/json'
+        )).json()
+        self.assertEqual(batch['llm_calls'], 1)
+        self.assertTrue(all('error' not in r and 4 <= r['score'] <= 10 for r in batch['results']))
+
+    @override_settings(GPT_FAKE_ERROR_RATE=1)
+    async def test_error_rate(self):
+        self.assertEqual((await self.grade())[0], 502)
+
+    @override_settings(GPT_FAKE_LATENCY_MEDIAN=0.02, GPT_FAKE_LATENCY_SIGMA=0)
+    async def test_latency_and_stream(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await self.grade()
+        self.assertGreaterEqual(loop.time() - started, 0.02)
+
+        response = await AsyncClient().post(
+            '/api/ask_stream/', {'question': '什么是质数'}, content_type='application/json'
+        )
+        body = ''.join([chunk.decode('utf-8') async for chunk in response.streaming_content])
+        self.assertIn('data: {"delta": "这"}\n\n', body)
+        self.assertTrue(body.endswith('event: done\ndata: {}\n\n'))
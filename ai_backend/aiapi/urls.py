@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import GradeView, AskView
+from .views import GradeView, GradeBatchView, AskView, AskStreamView, StatusView
 
 urlpatterns = [
     path('grade/', GradeView.as_view()),
+    path('grade_batch/', GradeBatchView.as_view()),
     path('ask/', AskView.as_view()),
+    path('ask_stream/', AskStreamView.as_view()),
+    path('status/', StatusView.as_view()),
 ]
\ No newline at end of file
@@ -1,54 +1,64 @@
+import asyncio
+import json
 import logging
-from django.shortcuts import render
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-import openai
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-import requests
-
-openai.api_key = getattr(settings, "OPENAI_API_KEY", "你的OpenAI_API_Key")
-
-def call_gpt_api(messages):
-    url = f"{getattr(settings, 'GPT_API_BASE_URL', 'https://api.openai.com/v1')}/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-    }
-    api_key = getattr(settings, "GPT_API_KEY", None) or getattr(settings, "OPENAI_API_KEY", None)
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
-
-    data = {
-        "model": "gpt-3.5-turbo",
-        "messages": messages
-    }
+
+from .llm import call_gpt_api, stream_gpt_api
+from .resilience import CircuitOpenError, breaker
+from . import resilience, singleflight
+
+
+def read_json(request):
     try:
-        resp = requests.post(url, headers=headers, json=data, timeout=60)
-        if resp.status_code != 200:
-            logging.error(f"GPT API返回非200: {resp.status_code}, 内容: {resp.text}")
-            raise Exception(f"GPT API错误: {resp.status_code}, 内容: {resp.text}")
-        try:
-            return resp.json()["choices"][0]["message"]["content"]
-        except Exception as e:
-            logging.error(f"GPT API返回内容无法解析为JSON: {resp.text}")
-            raise Exception(f"GPT API返回内容无法解析为JSON: {resp.text}")
-    except Exception as e:
-        logging.error(f"调用GPT API失败: {e}")
-        raise
-
-class GradeView(APIView):
-    def post(self, request):
-        question = request.data.get('question')
-        answer = request.data.get('answer')
-        reference = request.data.get('reference_answer', '')
-        # 新增：支持动态分值
-        max_score = request.data.get('max_score', 5)
-        try:
-            max_score_val = float(max_score)
-        except Exception:
-            max_score_val = 5
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AIView(View):
+    """
+    异步接口基类：只接受 JSON 请求体，上游调用期间不占用工作线程
+    """
+    http_method_names = ['post']
+
+
+def unavailable_response(error):
+    """
+    上游不可用：熔断时返回 503 和建议的重试间隔，其它失败返回 502，由调用方稍后重试
+    """
+    if isinstance(error, CircuitOpenError):
+        response = JsonResponse({"error": str(error), "retry_after": round(error.retry_after)}, status=503)
+        response['Retry-After'] = str(max(1, round(error.retry_after)))
+        return response
+    return JsonResponse({"error": f"AI服务调用失败: {error}"}, status=502)
+
+
+class StatusView(View):
+    """
+    容错层状态：熔断器状态、近期延迟分位数、重试/对冲计数和相同请求合并计数（当前进程）
+    """
+    http_method_names = ['get']
+
+    def get(self, request):
+        return JsonResponse({**resilience.snapshot(), 'singleflight': singleflight.snapshot()})
+
 
-        prompt = f"""你是一名老师，请根据以下题目和参考答案，对学生的答案进行评分（满分{max_score_val}分）并给出评语。
+def parse_max_score(value):
+    try:
+        return float(value)
+    except Exception:
+        return 5
+
+
+def build_grade_prompt(question, reference, answer, max_score):
+    return f"""你是一名老师，请根据以下题目和参考答案，对学生的答案进行评分（满分{max_score}分）并给出评语。
                 题目：{question}
                 参考答案：{reference}
                 学生答案：{answer}
@@ -56,28 +66,225 @@ class GradeView(APIView):
                 分数: x.x
                 评语: ..."""
 
-        try:
-            content = call_gpt_api([{"role": "user", "content": prompt}])
-            lines = content.split('\n')
-            score = None
-            comment = ""
-            for line in lines:
-                if "分数" in line:
-                    try:
-                        score = float(line.split(":")[1].strip())
-                    except Exception:
-                        score = 0
-                elif "评语" in line:
-                    comment = line.split(":", 1)[1].strip()
-            if score is None:
+
+def parse_grade_content(content):
+    """
+    从“分数: / 评语:”格式的回复中解析出 (score, comment)
+    """
+    score = None
+    comment = ""
+    for line in content.split('\n'):
+        if "分数" in line:
+            try:
+                score = float(line.split(":")[1].strip())
+            except Exception:
                 score = 0
-            return Response({"score": score, "comment": comment})
+        elif "评语" in line:
+            comment = line.split(":", 1)[1].strip()
+    if score is None:
+        score = 0
+    return score, comment
+
+
+async def grade_one(item):
+    content = await call_gpt_api([{"role": "user", "content": build_grade_prompt(
+        item["question"], item["reference_answer"], item["answer"], item["max_score"]
+    )}])
+    return parse_grade_content(content)
+
+
+class GradeView(AIView):
+    async def post(self, request):
+        data = read_json(request)
+        if data is None:
+            return JsonResponse({"error": "请求体必须是 JSON 对象"}, status=400)
+        item = {
+            "question": data.get('question'),
+            "answer": data.get('answer'),
+            "reference_answer": data.get('reference_answer', ''),
+            # 新增：支持动态分值
+            "max_score": parse_max_score(data.get('max_score', 5)),
+        }
+        try:
+            score, comment = await grade_one(item)
         except Exception as e:
-            return Response({"score": 0, "comment": f"AI批改失败: {str(e)}"}, status=200)
+            return unavailable_response(e)
+        return JsonResponse({"score": clamp_score(score, item["max_score"]), "comment": comment})
+
+
+# 批量批改：单个 prompt 的字符预算，以及每道题为模型输出预留的字符数
+GRADE_BATCH_PROMPT_CHARS = getattr(settings, "GRADE_BATCH_PROMPT_CHARS", 6000)
+GRADE_BATCH_OUTPUT_CHARS_PER_ITEM = 150
+# 单个 prompt 最多包含的题数，过多时模型容易漏题或串题
+GRADE_BATCH_MAX_ITEMS = getattr(settings, "GRADE_BATCH_MAX_ITEMS", 20)
+
+BATCH_PROMPT_HEADER = """你是一名老师，请根据每道题的题目和参考答案，对学生的答案逐一评分并给出简短评语。
+只输出一个 JSON 数组，不要输出其它内容，数组中每个元素对应一道题，格式为：
+{"id": 题号, "score": 分数, "comment": "评语"}
+分数不能超过该题满分。
+"""
+
+
+def format_batch_item(index, item):
+    return (
+        f"【题号 {index}】满分{item['max_score']}分\n"
+        f"题目：{item['question']}\n"
+        f"参考答案：{item['reference_answer']}\n"
+        f"学生答案：{item['answer']}\n"
+    )
 
-class AskView(APIView):
-    def post(self, request):
-        question = request.data.get('question')
+
+def pack_grade_items(items, budget=None, max_items=None):
+    """
+    按字符预算把题目装入尽量少的 prompt，返回每个 prompt 包含的题目下标列表（保持原顺序）
+    """
+    budget = budget or GRADE_BATCH_PROMPT_CHARS
+    max_items = max_items or GRADE_BATCH_MAX_ITEMS
+    batches = []
+    current, used = [], len(BATCH_PROMPT_HEADER)
+    for index, item in enumerate(items):
+        cost = len(format_batch_item(index, item)) + GRADE_BATCH_OUTPUT_CHARS_PER_ITEM
+        if current and (used + cost > budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], len(BATCH_PROMPT_HEADER)
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(items, indexes):
+    return BATCH_PROMPT_HEADER + '\n'.join(format_batch_item(i, items[i]) for i in indexes)
+
+
+def parse_batch_content(content, indexes):
+    """
+    解析批量批改回复，返回 {题号: (score, comment)}；缺失或格式不对的题号不出现在结果中
+    """
+    start, end = content.find('['), content.rfind(']')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        rows = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    expected = set(indexes)
+    parsed = {}
+    for row in rows:
+        try:
+            index = int(row["id"])
+            score = float(row["score"])
+        except (TypeError, KeyError, ValueError):
+            continue
+        if index in expected and index not in parsed:
+            parsed[index] = (score, str(row.get("comment", "")))
+    return parsed
+
+
+def clamp_score(score, max_score):
+    return min(max(score, 0), max_score)
+
+
+class GradeBatchView(AIView):
+    """
+    批量批改主观题：请求体 {"items": [{question, answer, reference_answer, max_score}, ...]}，
+    返回 {"results": [{score, comment}, ...]}，顺序与 items 一致；
+    各 prompt 并发请求，批量结果中解析不到的题会单独重试，仍失败的题带上 error 字段
+    """
+
+    async def post(self, request):
+        raw_items = (read_json(request) or {}).get('items')
+        if not isinstance(raw_items, list):
+            return JsonResponse({"error": "items 必须是数组"}, status=400)
+        if not all(isinstance(item, dict) for item in raw_items):
+            return JsonResponse({"error": "items 中的每一项必须是对象"}, status=400)
+        if breaker.retry_after():
+            return unavailable_response(CircuitOpenError(breaker.retry_after()))
+        items = [{
+            "question": item.get('question'),
+            "answer": item.get('answer'),
+            "reference_answer": item.get('reference_answer', ''),
+            "max_score": parse_max_score(item.get('max_score', 5)),
+        } for item in raw_items]
+
+        llm_calls = 0
+
+        async def grade_batch(indexes):
+            nonlocal llm_calls
+            if len(indexes) == 1:
+                return {}
+            try:
+                llm_calls += 1
+                content = await call_gpt_api([{"role": "user", "content": build_batch_prompt(items, indexes)}])
+                return parse_batch_content(content, indexes)
+            except Exception as e:
+                logging.error(f"批量批改失败，改为逐题批改: {e}")
+                return {}
+
+        async def grade_single(index):
+            nonlocal llm_calls
+            llm_calls += 1
+            try:
+                return await grade_one(items[index])
+            except Exception as e:
+                return e
+
+        batches = pack_grade_items(items)
+        parsed = {}
+        for batch_parsed in await asyncio.gather(*(grade_batch(indexes) for indexes in batches)):
+            parsed.update(batch_parsed)
+        missing = [index for index in range(len(items)) if index not in parsed]
+        parsed.update(zip(missing, await asyncio.gather(*(grade_single(index) for index in missing))))
+
+        results = []
+        for index, item in enumerate(items):
+            if isinstance(parsed[index], Exception):
+                error = str(parsed[index])
+                results.append({"score": 0, "comment": f"AI批改失败: {error}", "error": error})
+            else:
+                score, comment = parsed[index]
+                results.append({"score": clamp_score(score, item["max_score"]), "comment": comment})
+        return JsonResponse({"results": results, "llm_calls": llm_calls})
+
+
+class AskView(AIView):
+    async def post(self, request):
+        question = (read_json(request) or {}).get('question')
+        prompt = f"请用简明易懂的语言回答学生的问题：{question}"
+        try:
+            answer = await call_gpt_api([{"role": "user", "content": prompt}])
+        except Exception as e:
+            return unavailable_response(e)
+        return JsonResponse({"answer": answer})
+
+
+def sse_event(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class AskStreamView(AIView):
+    """
+    流式回答：以 Server-Sent Events 逐段转发模型输出，
+    每段为 data: {"delta": "..."}，结束时发送 event: done，出错时发送 event: error
+    """
+
+    async def post(self, request):
+        question = (read_json(request) or {}).get('question')
         prompt = f"请用简明易懂的语言回答学生的问题：{question}"
-        answer = call_gpt_api([{"role": "user", "content": prompt}])
-        return Response({"answer": answer})
+
+        async def events():
+            try:
+                async for delta in stream_gpt_api([{"role": "user", "content": prompt}]):
+                    yield sse_event({"delta": delta})
+            except Exception as e:
+                yield sse_event({"error": str(e)}, 'error')
+                return
+            yield sse_event({}, 'done')
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream; charset=utf-8')
+        response['Cache-Control'] = 'no-cache'
+        # 关闭 nginx 缓冲，保证首个 token 立即送达
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,177 @@
+"""
+AI 服务（ai_backend）客户端
+
+所有调用共用一个带连接池的 requests.Session，并强制设置连接/读取超时；
+主观题批改通过有界线程池并发发出，结果按题目顺序返回。
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import grading_cache
+
+
+class AIServiceUnavailable(Exception):
+    """
+    AI 服务不可用（熔断、超时、上游出错等），调用方应把任务留到之后重试，而不是记 0 分
+    """
+
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+
+
+def max_workers():
+    return getattr(settings, 'AI_GRADING_MAX_WORKERS', 8)
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers())
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_executor():
+    # 进程内共享的有界线程池，限制同时发往 AI 服务的请求数
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max_workers(), thread_name_prefix='ai-grading')
+    return _executor
+
+
+def ai_url(path):
+    return getattr(settings, 'AI_BACKEND_URL', 'http://127.0.0.1:8001').rstrip('/') + path
+
+
+def post(path, payload, timeout=None):
+    try:
+        response = get_session().post(
+            ai_url(path), json=payload, timeout=timeout or getattr(settings, 'AI_REQUEST_TIMEOUT', (3, 60))
+        )
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise AIServiceUnavailable(str(e)) from e
+
+
+def grade_answer(question, answer, reference_answer, max_score):
+    """
+    批改单道主观题，返回 {"score": ..., "comment": ...}；AI 服务不可用时抛出 AIServiceUnavailable
+    """
+    return post('/api/grade/', {
+        "question": question,
+        "answer": answer,
+        "reference_answer": reference_answer,
+        "max_score": max_score,
+    })
+
+
+def grade_item(item):
+    return grade_answer(**item)
+
+
+def grade_many(items):
+    """
+    并发批改多道主观题，items 为 grade_answer 的参数字典列表；
+    先查批改缓存，结果与 items 顺序一致；任一题无法批改时抛出 AIServiceUnavailable
+    """
+    return grading_cache.cached_grade(items, grade_many_uncached)
+
+
+def grade_many_uncached(items):
+    if len(items) <= 1:
+        return [grade_item(item) for item in items]
+    return list(get_executor().map(grade_item, items))
+
+
+def grade_chunk(items):
+    results = post(
+        '/api/grade_batch/', {"items": items},
+        timeout=getattr(settings, 'AI_BATCH_REQUEST_TIMEOUT', (3, 300))
+    ).get("results")
+    if not isinstance(results, list) or len(results) != len(items):
+        raise AIServiceUnavailable("批量批改返回数量不一致")
+    return results
+
+
+def grade_batch(items):
+    """
+    通过 /api/grade_batch/ 批量批改，供夜间批改任务使用：
+    先查批改缓存，未命中的每 AI_GRADE_BATCH_SIZE 题一个请求，请求之间并发，结果与 items 顺序一致；
+    个别题失败时对应结果带 error 字段，整个请求失败时抛出 AIServiceUnavailable
+    """
+    return grading_cache.cached_grade(items, grade_batch_uncached)
+
+
+def grade_batch_uncached(items):
+    size = getattr(settings, 'AI_GRADE_BATCH_SIZE', 50)
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    if len(chunks) <= 1:
+        return [result for chunk in chunks for result in grade_chunk(chunk)]
+    return [result for results in get_executor().map(grade_chunk, chunks) for result in results]
+
+
+def ask(question):
+    """
+    向 AI 提问，返回回答文本
+    """
+    return post('/api/ask/', {"question": question})["answer"]
+
+
+def iter_sse(response):
+    """
+    解析 Server-Sent Events 响应，逐个返回 (event, data)
+    """
+    event, data = 'message', []
+    for line in response.iter_lines():
+        line = line.decode('utf-8')
+        if not line:
+            if data:
+                yield event, json.loads('\n'.join(data))
+            event, data = 'message', []
+        elif line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data.append(line[len('data:'):].strip())
+
+
+def ask_stream(question):
+    """
+    流式提问，逐段返回回答文本；AI 服务不可用或中途出错时抛出 AIServiceUnavailable
+    """
+    try:
+        response = get_session().post(
+            ai_url('/api/ask_stream/'), json={"question": question}, stream=True,
+            headers={'Accept': 'text/event-stream'},
+            timeout=getattr(settings, 'AI_REQUEST_TIMEOUT', (3, 60)),
+        )
+    except requests.RequestException as e:
+        raise AIServiceUnavailable(str(e)) from e
+    try:
+        if not response.ok:
+            raise AIServiceUnavailable(f"AI服务返回 {response.status_code}")
+        for event, data in iter_sse(response):
+            if event == 'error':
+                raise AIServiceUnavailable(data.get('error', 'AI服务出错'))
+            if event == 'done':
+                return
+            yield data.get('delta', '')
+        raise AIServiceUnavailable('AI服务连接中断')
+    except requests.RequestException as e:
+        raise AIServiceUnavailable(str(e)) from e
+    finally:
+        response.close()
@@ -0,0 +1,120 @@
+"""
+作业判分
+
+客观题的标准答案先编译为答案键：选项统一为去空格、大写的记号集合（frozenset），
+选项都是单个字母时另有位掩码（A=1, B=2, C=4 ...）。答案键按 (题型, 标准答案) 缓存，
+题目的标准答案改动后自然得到新的键；判分只需把学生答案规范化后比较。
+即时批改（提交接口）和夜间批量批改都通过 grade_submission 判分，结果一致。
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+OBJECTIVE_TYPES = ('single', 'multiple')
+# 多选答案的分隔符：中英文逗号、顿号、分号和空白
+SEPARATORS = re.compile(r'[,，、;；\s]+')
+
+AnswerKey = namedtuple('AnswerKey', ['tokens', 'mask'])
+GradedItem = namedtuple('GradedItem', ['score', 'comment', 'correct'])
+GradedSubmission = namedtuple('GradedSubmission', ['total_score', 'explanations', 'items'])
+
+
+def answer_tokens(question_type, answer):
+    """
+    把答案规范化为记号集合：选项列表逐项处理；字符串在多选题中按 "A,C" 形式拆分，单选题整体作为一个选项
+    """
+    if isinstance(answer, (list, tuple)):
+        parts = [str(x) for x in answer]
+    elif answer is None:
+        parts = []
+    elif question_type == 'multiple':
+        parts = SEPARATORS.split(str(answer))
+    else:
+        parts = [str(answer)]
+    return frozenset(p.strip().upper() for p in parts if p.strip())
+
+
+def option_mask(tokens):
+    """
+    选项都是单个字母时返回位掩码，否则返回 None
+    """
+    mask = 0
+    for token in tokens:
+        if len(token) != 1 or not 'A' <= token <= 'Z':
+            return None
+        mask |= 1 << (ord(token) - ord('A'))
+    return mask
+
+
+def hashable(answer):
+    return tuple(hashable(x) for x in answer) if isinstance(answer, (list, tuple)) else answer
+
+
+@lru_cache(maxsize=4096)
+def compile_answer(question_type, answer):
+    tokens = answer_tokens(question_type, answer)
+    return AnswerKey(tokens, option_mask(tokens))
+
+
+def answer_key(question):
+    """
+    题目的答案键（按标准答案内容缓存）
+    """
+    answer = hashable(question.answer)
+    try:
+        return compile_answer(question.question_type, answer)
+    except TypeError:  # 标准答案中含 dict 等不可哈希的值时不缓存
+        return compile_answer.__wrapped__(question.question_type, answer)
+
+
+def grade_objective(q, ans):
+    """
+    客观题判分：比较规范化后的选项集合（不区分大小写和顺序）；单选只能选一个选项
+    """
+    if q.question_type not in OBJECTIVE_TYPES:
+        return False
+    tokens = answer_tokens(q.question_type, ans)
+    if q.question_type == 'single' and len(tokens) != 1:
+        return False
+    return tokens == answer_key(q).tokens
+
+
+def grade_submission(items):
+    """
+    给一份提交判分。items 为 [(question, answer, ai_result), ...]，
+    主观题的 ai_result 为 AI 批改结果 {"score", "comment"}，客观题传 None。
+    返回 GradedSubmission(总分, 扣分说明, 每题的 GradedItem)
+    """
+    total_score = 0
+    explanations = []
+    graded = []
+    for q, ans, ai_result in items:
+        if q.question_type == 'subjective':
+            score = ai_result.get("score", 0)
+            comment = ai_result.get("comment", "")
+            correct = score == q.score
+            if score < q.score:
+                explanations.append(f"题目：{q.text}，AI评语：{comment}")
+        else:
+            correct = grade_objective(q, ans)
+            score = q.score if correct else 0
+            comment = "正确" if correct else "错误"
+            if not correct:
+                explanations.append(f"题目：{q.text}，你的答案：{ans}，正确答案：{q.answer}")
+        graded.append(GradedItem(score, comment, correct))
+        total_score += score
+    return GradedSubmission(total_score, explanations, graded)
+
+
+def grade_submissions(submissions):
+    """
+    批量判分：submissions 为多份提交的 items 列表，按顺序返回各自的 GradedSubmission
+    """
+    return [grade_submission(items) for items in submissions]
+
+
+def is_ai_failure(result):
+    """
+    AI 批改结果是否为失败（限流、超时、解析失败等）
+    """
+    return 'error' in result or str(result.get('comment', '')).startswith('AI批改失败')
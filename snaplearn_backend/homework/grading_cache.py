@@ -0,0 +1,129 @@
+"""
+主观题 AI 批改结果缓存
+
+同一道题的相同答案（忽略大小写、空白和标点差异）只请求一次 AI，结果存入数据库，
+重启后仍然有效；条目超过 AI_GRADING_CACHE_TTL 秒过期（查询时忽略），
+定时任务删除过期条目，并在总数超过 AI_GRADING_CACHE_MAX_ENTRIES 时按最近使用时间淘汰。
+"""
+import hashlib
+import json
+import time
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .grading import is_ai_failure
+from .models import GradingCacheEntry
+
+
+def grading_model():
+    return getattr(settings, 'AI_GRADING_MODEL', 'gpt-3.5-turbo')
+
+
+def normalize_answer(answer):
+    """
+    规范化学生答案：全角转半角、转小写，去掉空白和标点
+    """
+    if not isinstance(answer, str):
+        answer = json.dumps(answer, ensure_ascii=False, sort_keys=True)
+    answer = unicodedata.normalize('NFKC', answer).lower()
+    return ''.join(ch for ch in answer if unicodedata.category(ch)[0] not in 'PZC')
+
+
+def cache_key(item):
+    raw = json.dumps([
+        item['question'],
+        item['reference_answer'],
+        normalize_answer(item['answer']),
+        float(item['max_score']),
+        grading_model(),
+    ], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def lookup(keys):
+    """
+    批量查询未过期的缓存，返回 {key: {"score", "comment"}}，并累计命中次数
+    """
+    ttl = getattr(settings, 'AI_GRADING_CACHE_TTL', 30 * 24 * 3600)
+    entries = list(GradingCacheEntry.objects.filter(
+        key__in=keys, created_at__gte=timezone.now() - timedelta(seconds=ttl)
+    ).values('key', 'score', 'comment'))
+    if entries:
+        GradingCacheEntry.objects.filter(key__in=[e['key'] for e in entries]).update(
+            hits=F('hits') + 1, last_used_at=timezone.now()
+        )
+    return {e['key']: {'score': e['score'], 'comment': e['comment']} for e in entries}
+
+
+def store(results, latency_ms):
+    """
+    写入 {key: result}，忽略批改失败的结果；淘汰由定时任务执行，不在批改路径上扫描全表
+    """
+    now = timezone.now()
+    GradingCacheEntry.objects.bulk_create([
+        GradingCacheEntry(
+            key=key, model=grading_model(), score=result.get('score', 0), comment=result.get('comment', ''),
+            latency_ms=latency_ms, created_at=now, last_used_at=now,
+        )
+        for key, result in results.items() if not is_ai_failure(result)
+    ], update_conflicts=True, unique_fields=['key'],
+        update_fields=['model', 'score', 'comment', 'latency_ms', 'hits', 'created_at', 'last_used_at'])
+
+
+def evict():
+    """
+    删除过期条目和超出上限的最久未使用条目，返回删除数
+    """
+    ttl = getattr(settings, 'AI_GRADING_CACHE_TTL', 30 * 24 * 3600)
+    max_entries = getattr(settings, 'AI_GRADING_CACHE_MAX_ENTRIES', 100000)
+    deleted, _ = GradingCacheEntry.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()
+    stale = GradingCacheEntry.objects.order_by('-last_used_at', '-id').values_list('id', flat=True)[max_entries:]
+    stale_ids = list(stale)
+    if stale_ids:
+        deleted += GradingCacheEntry.objects.filter(id__in=stale_ids).delete()[0]
+    return deleted
+
+
+def cached_grade(items, grade_fn):
+    """
+    带缓存的批改：命中的题直接取缓存，其余（同一批中重复的答案只算一次）交给 grade_fn，
+    结果与 items 顺序一致
+    """
+    if not items:
+        return []
+    keys = [cache_key(item) for item in items]
+    results = lookup(set(keys))
+    pending = {}
+    for key, item in zip(keys, items):
+        if key not in results and key not in pending:
+            pending[key] = item
+    if pending:
+        started = time.monotonic()
+        graded = grade_fn(list(pending.values()))
+        latency_ms = int((time.monotonic() - started) * 1000 / len(pending))
+        fresh = dict(zip(pending, graded))
+        store(fresh, latency_ms)
+        results.update(fresh)
+    return [dict(results[key]) for key in keys]
+
+
+def stats():
+    """
+    缓存统计（基于当前保留的条目）：每个条目对应一次 AI 调用，hits 为之后省下的调用次数
+    """
+    totals = GradingCacheEntry.objects.aggregate(
+        total_hits=Sum('hits'), saved_latency_ms=Sum(F('hits') * F('latency_ms'))
+    )
+    entries = GradingCacheEntry.objects.count()
+    hits = totals['total_hits'] or 0
+    lookups = hits + entries
+    return {
+        'entries': entries,
+        'hits': hits,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0,
+        'saved_latency_ms': totals['saved_latency_ms'] or 0,
+    }
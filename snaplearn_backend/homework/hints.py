@@ -0,0 +1,50 @@
+"""
+AI 解题思路缓存
+
+同一道题的提示对所有学生相同，按题目缓存在 QuestionHint 中；
+缓存以提示词的哈希校验，题目内容或提示词模板变化后重新生成。
+"""
+import hashlib
+
+from django.conf import settings
+
+from .models import QuestionHint
+from . import ai_client
+
+
+def hint_prompt(question_text):
+    # 只输出解题思路
+    return f"请只给出解题思路，不要直接给答案。题目：{question_text}"
+
+
+def hint_hash(question_text):
+    raw = f"{getattr(settings, 'AI_GRADING_MODEL', '')}\n{hint_prompt(question_text)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def cached_hint(question):
+    """
+    返回仍然有效的缓存提示，没有或已失效时返回 None
+    """
+    try:
+        hint = question.hint
+    except QuestionHint.DoesNotExist:
+        return None
+    return hint.hint if hint.text_hash == hint_hash(question.text) else None
+
+
+def store_hint(question, hint):
+    QuestionHint.objects.update_or_create(
+        question=question, defaults={'text_hash': hint_hash(question.text), 'hint': hint}
+    )
+
+
+def get_hint(question):
+    """
+    优先取缓存，未命中时请求 AI 并写入缓存
+    """
+    hint = cached_hint(question)
+    if hint is None:
+        hint = ai_client.ask(hint_prompt(question.text))
+        store_hint(question, hint)
+    return hint
@@ -0,0 +1,183 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from homework import grading_cache, tasks
+from homework.models import GradingCacheEntry, Homework, Question, StudentAnswer, StudentHomeworkResult
+from users.models import CustomUser
+from videos.models import Video
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Command(BaseCommand):
+    help = (
+        '用合成的学生提交端到端压测批改链路，报告吞吐量和延迟分位数（结束后删除合成数据）。'
+        'AI 服务可用 GPT_PROVIDER=fake 启动，离线运行且不产生费用'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=100)
+        parser.add_argument('--mode', choices=['submit', 'batch'], default='submit',
+                            help='submit：经提交接口即时批改；batch：按夜间批改任务分批批改')
+        parser.add_argument('--concurrency', type=int, default=8, help='同时提交的学生数 / 并行批改的 worker 数')
+        parser.add_argument('--objective', type=int, default=2, help='每份作业的客观题数')
+        parser.add_argument('--subjective', type=int, default=3, help='每份作业的主观题数')
+        parser.add_argument('--distinct-answers', type=int, default=0,
+                            help='主观题答案的种类数，用于模拟重复答案命中批改缓存；0 表示每份答案都不同')
+        parser.add_argument('--min-throughput', type=float, default=0,
+                            help='吞吐量（份/秒）低于该值时以非零状态退出，用于发现批改性能退化')
+        parser.add_argument('--respect-discount-window', action='store_true',
+                            help='submit 模式下遵守优惠时段（时段外提交转为待批改），默认忽略时段压测即时批改路径')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stdout.write(f"AI 服务：{getattr(settings, 'AI_BACKEND_URL', '')}，模式：{options['mode']}")
+        self.suffix, self.students, self.questions = None, [], []
+        try:
+            self.seed()
+            if options['mode'] == 'submit':
+                latencies, errors, elapsed = self.replay_submissions()
+            else:
+                latencies, errors, elapsed = self.replay_batches()
+        finally:
+            self.cleanup()
+        throughput = self.report(latencies, errors, elapsed)
+        if throughput < options['min_throughput']:
+            raise CommandError(f"吞吐量 {throughput:.2f} 份/秒 低于 {options['min_throughput']} 份/秒")
+
+    def seed(self):
+        n = self.options['submissions']
+        suffix = self.suffix = random.randint(0, 10 ** 9)
+        self.stdout.write(f'生成 {n} 份合成提交...')
+        self.teacher = CustomUser.objects.create_user(
+            username=f'loadtest_t{suffix}', email='loadtest_t@example.com', is_verified_teacher=True
+        )
+        self.students = CustomUser.objects.bulk_create([
+            CustomUser(username=f'loadtest_s{suffix}_{i}', email=f'loadtest_s{i}@example.com') for i in range(n)
+        ])
+        video = Video.objects.create(title='loadtest', teacher=self.teacher, video_file='videos/loadtest.mp4')
+        self.homework = Homework.objects.create(title='loadtest', teacher=self.teacher, video=video)
+        questions = [
+            Question(homework=self.homework, question_type='single', text=f'客观题{i}',
+                     options=['A', 'B', 'C', 'D'], answer='A', score=5)
+            for i in range(self.options['objective'])
+        ] + [
+            Question(homework=self.homework, question_type='subjective', text=f'主观题{i}：简述你的理解',
+                     answer='参考答案', score=10)
+            for i in range(self.options['subjective'])
+        ]
+        self.questions = Question.objects.bulk_create(questions)
+
+    def answers(self, index):
+        distinct = self.options['distinct_answers']
+        variant = index % distinct if distinct else index
+        return [
+            random.choice('AB') if q.question_type != 'subjective' else f'学生答案{variant}：{q.text}'
+            for q in self.questions
+        ]
+
+    def run_concurrently(self, fn, jobs):
+        """
+        在线程池中执行 fn(job)，返回 (每个任务的耗时列表, 失败数, 总耗时)
+        """
+        def timed(job):
+            started = time.perf_counter()
+            try:
+                ok = fn(job)
+            except Exception as e:
+                self.stderr.write(f'失败：{e}')
+                ok = False
+            finally:
+                connection.close()
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.options['concurrency']) as pool:
+            results = list(pool.map(timed, jobs))
+        elapsed = time.perf_counter() - started
+        return [seconds for seconds, _ in results], sum(1 for _, ok in results if not ok), elapsed
+
+    def replay_submissions(self):
+        hosts = [h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')]
+        host = hosts[0] if hosts else 'localhost'
+
+        def submit(index):
+            client = APIClient(SERVER_NAME=host)
+            client.force_authenticate(self.students[index])
+            response = client.post(
+                f'/homework/submit_by_video/{self.homework.video_id}/', {'answers': self.answers(index)}, format='json'
+            )
+            # AI 服务不可用时提交会转为待批改，计为失败
+            return response.status_code == 200 and response.data.get('status') != 'pending'
+
+        # 压测即时批改路径，默认不受优惠时段限制
+        with override_settings(GRADING_IGNORE_DISCOUNT_WINDOW=not self.options['respect_discount_window']):
+            return self.run_concurrently(submit, range(len(self.students)))
+
+    def replay_batches(self):
+        now = timezone.now()
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(question=q, student=student, answer=answer, graded=False)
+            for i, student in enumerate(self.students)
+            for q, answer in zip(self.questions, self.answers(i))
+        ], batch_size=1000)
+        results = StudentHomeworkResult.objects.bulk_create([
+            StudentHomeworkResult(homework=self.homework, student=student, status='grading',
+                                  claimed_at=now, submitted_at=now)
+            for student in self.students
+        ])
+        # 只领取合成数据，不会批改库中真实的待批改作业
+        size = getattr(settings, 'GRADING_CHUNK_SIZE', 20)
+        ids = [r.id for r in results]
+        chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+
+        def grade(chunk):
+            return tasks.grade_homework_results(chunk, now) == len(chunk)
+
+        latencies, failed_chunks, elapsed = self.run_concurrently(grade, chunks)
+        self.stdout.write(f'批次：{len(chunks)}（每批 {size} 份），未全部完成的批次：{failed_chunks}')
+        not_graded = StudentHomeworkResult.objects.filter(id__in=ids).exclude(status='graded').count()
+        return latencies, not_graded, elapsed
+
+    def cleanup(self):
+        cache_keys = [
+            grading_cache.cache_key({
+                "question": q.text, "answer": answer, "reference_answer": q.answer, "max_score": q.score
+            })
+            for i in range(len(self.students))
+            for q, answer in zip(self.questions, self.answers(i)) if q.question_type == 'subjective'
+        ]
+        GradingCacheEntry.objects.filter(key__in=cache_keys).delete()
+        # 删除用户会级联删除视频、作业、题目、答案和成绩；按用户名前缀删除，生成中途失败时也能清理干净
+        if self.suffix is not None:
+            CustomUser.objects.filter(
+                Q(username=f'loadtest_t{self.suffix}') | Q(username__startswith=f'loadtest_s{self.suffix}_')
+            ).delete()
+
+    def report(self, latencies, errors, elapsed):
+        n = self.options['submissions']
+        throughput = (n - errors) / elapsed if elapsed else 0
+        unit = '每份提交' if self.options['mode'] == 'submit' else '每批'
+        self.stdout.write(self.style.MIGRATE_HEADING('=== 压测结果 ==='))
+        self.stdout.write(f'提交数：{n}，并发：{self.options["concurrency"]}，失败：{errors}')
+        self.stdout.write(f'总耗时：{elapsed:.2f} s，吞吐量：{throughput:.2f} 份/秒')
+        self.stdout.write(
+            f'{unit}延迟：p50 {percentile(latencies, 0.5) * 1000:.0f} ms，'
+            f'p95 {percentile(latencies, 0.95) * 1000:.0f} ms，'
+            f'p99 {percentile(latencies, 0.99) * 1000:.0f} ms'
+        )
+        return throughput
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from homework import totals
+
+
+class Command(BaseCommand):
+    help = '核对已批改作业的总分是否等于各题最近一次答案得分之和，并批量修复偏差'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--homework', type=int, default=None, help='只核对该作业')
+        parser.add_argument('--batch-size', type=int, default=None, help='每次核对的成绩数')
+        parser.add_argument('--dry-run', action='store_true', help='只报告偏差，不修复')
+
+    def handle(self, *args, **options):
+        checked, drifted = totals.reconcile(
+            options['homework'], batch_size=options['batch_size'], dry_run=options['dry_run']
+        )
+        action = '发现' if options['dry_run'] else '修复'
+        self.stdout.write(f'核对 {checked} 份成绩，{action} {drifted} 份总分偏差')
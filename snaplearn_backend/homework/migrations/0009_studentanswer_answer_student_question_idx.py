@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 20:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0008_alter_studenthomeworkresult_total_score'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentanswer',
+            index=models.Index(fields=['student', 'question'], name='answer_student_question_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 20:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0009_studentanswer_answer_student_question_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model', models.CharField(max_length=64)),
+                ('score', models.FloatField()),
+                ('comment', models.TextField(blank=True)),
+                ('latency_ms', models.IntegerField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='grading_cache_used_idx'), models.Index(fields=['created_at'], name='grading_cache_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0010_gradingcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studenthomeworkresult',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0011_studenthomeworkresult_claimed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('window_end', models.DateTimeField()),
+                ('status', models.CharField(choices=[('running', '批改中'), ('finished', '已清空'), ('closed', '时段结束')], default='running', max_length=16)),
+                ('concurrency', models.FloatField(default=1)),
+                ('dispatched_chunks', models.IntegerField(default=0)),
+                ('completed_chunks', models.IntegerField(default=0)),
+                ('graded_results', models.IntegerField(default=0)),
+                ('failed_items', models.IntegerField(default=0)),
+                ('chunk_seconds', models.FloatField(default=0)),
+                ('seen_chunks', models.IntegerField(default=0)),
+                ('seen_failed_items', models.IntegerField(default=0)),
+                ('seen_chunk_seconds', models.FloatField(default=0)),
+                ('backlog', models.IntegerField(default=0)),
+                ('projected_finish_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0012_gradingrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionHint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64)),
+                ('hint', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='hint', to='homework.question')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0013_questionhint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homework',
+            name='questions_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
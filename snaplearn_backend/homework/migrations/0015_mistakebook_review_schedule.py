@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 21:10
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0014_homework_questions_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mistakebook',
+            name='due_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='mistakebook',
+            name='ease',
+            field=models.FloatField(default=2.5),
+        ),
+        migrations.AddField(
+            model_name='mistakebook',
+            name='interval_days',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mistakebook',
+            name='repetitions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='mistakebook',
+            index=models.Index(fields=['student', 'due_at'], name='mistake_student_due_idx'),
+        ),
+    ]
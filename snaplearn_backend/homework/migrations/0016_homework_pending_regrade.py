@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homework', '0015_mistakebook_review_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homework',
+            name='regrade_question_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='homework',
+            name='regrade_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -9,6 +13,11 @@ class Homework(models.Model):
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='homeworks')
     created_at = models.DateTimeField(auto_now_add=True)
     video = models.OneToOneField('videos.Video', on_delete=models.CASCADE, related_name='homework', null=True, blank=True)
+    # 题目每次增删改时递增，作为学生端题目缓存的版本号
+    questions_version = models.PositiveIntegerField(default=0)
+    # 修改标准答案后待重新判分的题目；regrade_requested_at 非空表示重新判分尚未完成，由定时任务补投
+    regrade_question_ids = models.JSONField(default=list, blank=True)
+    regrade_requested_at = models.DateTimeField(null=True, blank=True)
 
 class Question(models.Model):
     QUESTION_TYPES = (
@@ -32,6 +41,12 @@ class StudentAnswer(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     graded = models.BooleanField(default=False)
 
+    class Meta:
+        # 按 (学生, 作业) 查询答题记录：先定位学生，再连接题目表按作业过滤
+        indexes = [
+            models.Index(fields=['student', 'question'], name='answer_student_question_idx'),
+        ]
+
 class ScoreCorrectionLog(models.Model):
     answer = models.ForeignKey('StudentAnswer', on_delete=models.CASCADE)
     teacher = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -47,7 +62,8 @@ class StudentHomeworkResult(models.Model):
     total_score = models.FloatField(null=True, blank=True)  # 允许为null
     explanations = models.JSONField(default=list, blank=True)
     submitted_at = models.DateTimeField(auto_now_add=True)
-    status = models.CharField(max_length=20, default='graded')  # graded/pending
+    status = models.CharField(max_length=20, default='graded')  # graded/pending/grading
+    claimed_at = models.DateTimeField(null=True, blank=True)  # 被批改任务领取的时间，同时作为领取令牌
 
     class Meta:
         unique_together = ('homework', 'student')
@@ -67,9 +83,17 @@ class MistakeBook(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     wrong_times = models.IntegerField(default=0)  # 累计答错次数
     last_wrong_answer = models.TextField(blank=True, default='')
+    # 间隔复习（SM-2）：下次复习时间、复习间隔（天）、难度系数、连续答对次数
+    due_at = models.DateTimeField(default=timezone.now)
+    interval_days = models.IntegerField(default=0)
+    ease = models.FloatField(default=2.5)
+    repetitions = models.IntegerField(default=0)
 
     class Meta:
         unique_together = ('student', 'question')
+        indexes = [
+            models.Index(fields=['student', 'due_at'], name='mistake_student_due_idx'),
+        ]
 
 class SubjectiveCorrectionLog(models.Model):
     answer = models.ForeignKey('StudentAnswer', on_delete=models.CASCADE, related_name='correction_logs')
@@ -83,3 +107,65 @@ class SubjectiveCorrectionLog(models.Model):
 
     def __str__(self):
         return f"修正: 答案{self.answer_id} 题目{self.question_id} by {self.teacher_id}"
+
+class GradingCacheEntry(models.Model):
+    """
+    主观题 AI 批改结果缓存，key 为 (题目, 参考答案, 规范化后的学生答案, 满分, 模型) 的哈希
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=64)
+    score = models.FloatField()
+    comment = models.TextField(blank=True)
+    latency_ms = models.IntegerField(default=0)  # 生成该结果时平均每题的 AI 耗时
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # 按最近使用时间淘汰、按创建时间过期
+        indexes = [
+            models.Index(fields=['last_used_at'], name='grading_cache_used_idx'),
+            models.Index(fields=['created_at'], name='grading_cache_created_idx'),
+        ]
+
+class GradingRun(models.Model):
+    """
+    一次优惠时段内的夜间批改，记录调度状态、观测数据和预计完成时间
+    """
+    STATUS_CHOICES = (
+        ('running', '批改中'),
+        ('finished', '已清空'),
+        ('closed', '时段结束'),
+    )
+    started_at = models.DateTimeField(auto_now_add=True)
+    window_end = models.DateTimeField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='running')
+    concurrency = models.FloatField(default=1)  # 当前允许同时进行的批次数
+    dispatched_chunks = models.IntegerField(default=0)
+    completed_chunks = models.IntegerField(default=0)
+    graded_results = models.IntegerField(default=0)
+    failed_items = models.IntegerField(default=0)  # AI 批改失败的题数（限流、超时等）
+    chunk_seconds = models.FloatField(default=0)  # 已完成批次的累计耗时
+    # 上一轮调度时的累计值，用于计算两轮之间的增量
+    seen_chunks = models.IntegerField(default=0)
+    seen_failed_items = models.IntegerField(default=0)
+    seen_chunk_seconds = models.FloatField(default=0)
+    backlog = models.IntegerField(default=0)
+    projected_finish_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class QuestionHint(models.Model):
+    """
+    题目的 AI 解题思路缓存；text_hash 对应生成时的提示词，题目内容变化后自动失效
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='hint')
+    text_hash = models.CharField(max_length=64)
+    hint = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def bump_questions_version(sender, instance, **kwargs):
+    # 与题目的修改在同一事务中递增版本号，学生端题目缓存随之失效
+    Homework.objects.filter(id=instance.homework_id).update(questions_version=F('questions_version') + 1)
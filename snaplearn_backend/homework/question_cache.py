@@ -0,0 +1,46 @@
+"""
+作业题目列表缓存
+
+学生端作业列表里每份作业的题目 JSON（不含标准答案）按作业缓存，缓存键带上 Homework.questions_version。
+题目增删改时在同一事务里递增该版本号，列表查询随作业行一起读到版本号，旧版本的缓存自然失效；
+版本号存在数据库里，多个进程各自的本地缓存也不会读到过期数据。
+"""
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+
+QUESTIONS_CACHE_TIMEOUT = 24 * 3600
+
+
+def payload_key(homework):
+    return f'homework:{homework.id}:questions:v{homework.questions_version}'
+
+
+def question_payload(question):
+    return {
+        'id': question.id,
+        'question_type': question.question_type,
+        'text': question.text,
+        'options': question.options,
+        'score': question.score,
+    }
+
+
+def cached_questions(homeworks):
+    """
+    返回 {作业 id: 题目 JSON 列表}；命中缓存的作业不查询题目，其余作业一次 prefetch 取出后写回缓存
+    """
+    keys = {hw.id: payload_key(hw) for hw in homeworks}
+    cached = cache.get_many(list(keys.values()))
+    payloads = {i: cached[key] for i, key in keys.items() if key in cached}
+
+    missing = [hw for hw in homeworks if hw.id not in payloads]
+    if missing:
+        prefetch_related_objects(missing, 'questions')
+        fresh = {
+            hw.id: [question_payload(q) for q in sorted(hw.questions.all(), key=lambda q: q.id)]
+            for hw in missing
+        }
+        cache.set_many({keys[i]: payload for i, payload in fresh.items()}, QUESTIONS_CACHE_TIMEOUT)
+        payloads.update(fresh)
+    return payloads
+
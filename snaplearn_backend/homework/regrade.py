@@ -0,0 +1,144 @@
+"""
+标准答案修改后的全班重新判分
+
+按 id 分块读取受影响题目的已批改答案，客观题答案编码为选项位掩码后用 NumPy 一次比较整块，
+只把分数有变化的答案按 (分数, 评语) 分组批量写回；最后用一条带子查询的 UPDATE 重算作业总分。
+改为主观题或主观题的参考答案、分值修改后需要重新调用 AI 批改：这些答案清空得分，
+所在作业成绩退回待批改，由夜间批改任务重新批改。
+"""
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .grading import OBJECTIVE_TYPES, answer_key, answer_tokens, grade_objective, hashable, option_mask
+from .models import Homework, Question, StudentAnswer, StudentHomeworkResult
+from .totals import recompute_totals
+
+# 无法编码为位掩码的答案（非单字母选项）
+UNENCODABLE = -1
+
+
+@lru_cache(maxsize=4096)
+def encode_answer(question_type, answer):
+    """
+    学生答案编码为选项位掩码；单选题未选或选了多个选项时按不可编码处理，交给 grade_objective 判为错误
+    （编码为 0 会与空的标准答案相等）
+    """
+    tokens = answer_tokens(question_type, answer)
+    if question_type == 'single' and len(tokens) != 1:
+        return UNENCODABLE
+    mask = option_mask(tokens)
+    return UNENCODABLE if mask is None else mask
+
+
+def encode(question_type, answer):
+    try:
+        return encode_answer(question_type, hashable(answer))
+    except TypeError:
+        return UNENCODABLE
+
+
+def regrade_chunk(rows, questions):
+    """
+    rows 为 (answer_id, question_id, answer, score) 列表，返回分数有变化的答案 {(新分数, 评语): [答案 id, ...]}
+    """
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    old_scores = np.fromiter((r[3] if r[3] is not None else np.nan for r in rows), dtype=np.float64, count=len(rows))
+    answer_masks = np.fromiter(
+        (encode(questions[r[1]].question_type, r[2]) for r in rows), dtype=np.int64, count=len(rows)
+    )
+    key_masks = np.fromiter((questions[r[1]].key_mask for r in rows), dtype=np.int64, count=len(rows))
+    full_scores = np.fromiter((questions[r[1]].score for r in rows), dtype=np.float64, count=len(rows))
+
+    correct = (answer_masks == key_masks) & (key_masks != UNENCODABLE)
+    # 选项不是单个字母的题逐个判分
+    for i in np.flatnonzero((answer_masks == UNENCODABLE) | (key_masks == UNENCODABLE)):
+        correct[i] = grade_objective(questions[rows[i][1]], rows[i][2])
+    new_scores = np.where(correct, full_scores, 0.0)
+
+    changed = np.flatnonzero(new_scores != old_scores)
+    groups = {}
+    for i in changed:
+        groups.setdefault((float(new_scores[i]), "正确" if correct[i] else "错误"), []).append(int(ids[i]))
+    return groups
+
+
+def write_groups(groups, batch_size=1000):
+    """
+    变化的答案只有少数几种 (分数, 评语) 组合，按组合分组后用 UPDATE ... WHERE id IN (...) 写回，
+    比逐行 CASE WHEN 的 bulk_update 快得多
+    """
+    for (score, comment), ids in groups.items():
+        for i in range(0, len(ids), batch_size):
+            StudentAnswer.objects.filter(id__in=ids[i:i + batch_size]).update(score=score, comment=comment)
+
+
+def regrade_answers(question_ids, chunk_size=None):
+    """
+    重新判分给定题目中客观题的已批改答案，返回分数有变化的答案数
+    """
+    chunk_size = chunk_size or getattr(settings, 'REGRADE_CHUNK_SIZE', 5000)
+    questions = {q.id: q for q in Question.objects.filter(id__in=question_ids, question_type__in=OBJECTIVE_TYPES)}
+    for q in questions.values():
+        mask = answer_key(q).mask
+        q.key_mask = UNENCODABLE if mask is None else mask
+    if not questions:
+        return 0
+
+    updated = 0
+    last_id = 0
+    base = StudentAnswer.objects.filter(question_id__in=list(questions), graded=True).order_by('id')
+    while True:
+        # 按 id 分块（keyset），不用 OFFSET
+        rows = list(base.filter(id__gt=last_id).values_list('id', 'question_id', 'answer', 'score')[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        groups = regrade_chunk(rows, questions)
+        write_groups(groups)
+        updated += sum(len(ids) for ids in groups.values())
+    return updated
+
+
+def requeue_subjective(homework_id, question_ids):
+    """
+    给定题目中的主观题答案清空得分，相关学生已批改或正在批改的作业成绩退回待批改，返回清空的答案数；
+    清空 claimed_at 使正在进行的批改任务失去领取，不会按旧的参考答案写回结果
+    """
+    answers = StudentAnswer.objects.filter(
+        question_id__in=question_ids, question__homework_id=homework_id
+    ).exclude(question__question_type__in=OBJECTIVE_TYPES)
+    StudentHomeworkResult.objects.filter(
+        homework_id=homework_id, status__in=['graded', 'grading'], student_id__in=answers.values('student_id')
+    ).update(status='pending', total_score=None, claimed_at=None)
+    return answers.update(score=None, comment='', graded=False)
+
+
+def request_regrade(homework_id, question_ids):
+    """
+    在修改题目的同一事务中记下待重新判分的题目；任务投递失败时由定时任务按该记录补投
+    """
+    homework = Homework.objects.select_for_update().get(id=homework_id)
+    Homework.objects.filter(id=homework_id).update(
+        regrade_question_ids=sorted(set(homework.regrade_question_ids) | set(question_ids)),
+        regrade_requested_at=timezone.now(),
+    )
+
+
+def regrade_homework(homework_id, question_ids):
+    """
+    标准答案修改后重新判分并重算总分（连同作业上记录的待重新判分题目），完成后清除记录，
+    返回 (分数变化或待重新批改的答案数, 重算总分的成绩数)
+    """
+    with transaction.atomic():
+        homework = Homework.objects.select_for_update().filter(id=homework_id).first()
+        if homework is None:
+            return 0, 0
+        question_ids = sorted(set(question_ids) | set(homework.regrade_question_ids))
+        updated = regrade_answers(question_ids) + requeue_subjective(homework_id, question_ids)
+        totals = recompute_totals(homework_id)
+        Homework.objects.filter(id=homework_id).update(regrade_question_ids=[], regrade_requested_at=None)
+    return updated, totals
@@ -0,0 +1,59 @@
+"""
+错题集间隔复习（SM-2）
+
+每条错题记录保存下次复习时间 due_at、复习间隔（天）、难度系数 ease 和连续答对次数。
+答对时间隔按 1 天、6 天、上次间隔 × ease 增长，答错时连续次数清零、间隔回到 1 天；
+ease 按答题质量调整，最低 1.3。复习列表只按 (student, due_at) 索引取最早到期的几题。
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+MIN_EASE = 1.3
+# 答题质量 0-5：未传时答对按 4、答错按 1 计
+CORRECT_QUALITY = 4
+WRONG_QUALITY = 1
+# 连续答对该次数后从错题集移除
+MASTERED_REPETITIONS = 3
+
+SCHEDULE_FIELDS = ['due_at', 'interval_days', 'ease', 'repetitions']
+
+
+def quality_for(is_correct, quality=None):
+    """
+    答题质量：优先使用前端传入的 0-5 评分，否则按对错取默认值
+    """
+    if quality is None:
+        return CORRECT_QUALITY if is_correct else WRONG_QUALITY
+    return min(max(int(quality), 0), 5)
+
+
+def reschedule(mb, quality, now=None):
+    """
+    按 SM-2 更新错题记录的复习计划（不保存），返回是否已掌握
+    """
+    now = now or timezone.now()
+    if quality < 3:
+        mb.repetitions = 0
+        mb.interval_days = 1
+    else:
+        if mb.repetitions == 0:
+            mb.interval_days = 1
+        elif mb.repetitions == 1:
+            mb.interval_days = 6
+        else:
+            mb.interval_days = round(mb.interval_days * mb.ease)
+        mb.repetitions += 1
+    mb.ease = max(MIN_EASE, mb.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    mb.due_at = now + timedelta(days=mb.interval_days)
+    return mb.repetitions >= MASTERED_REPETITIONS
+
+
+def reset(mb, now=None):
+    """
+    在作业中再次答错：复习计划从头开始并立即到期，难度系数按答错下调
+    """
+    now = now or timezone.now()
+    reschedule(mb, WRONG_QUALITY, now)
+    mb.due_at = now
+
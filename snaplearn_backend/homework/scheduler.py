@@ -0,0 +1,72 @@
+"""
+主观题夜间批改调度
+
+DeepSeek 优惠时段（北京时间 00:30-08:30）内，由 Celery beat 每分钟触发一次 drain_grading_backlog：
+- 窗口开启后按提交时间从早到晚领取待批改作业，分批派发给 worker；
+- 并发批次数按 AIMD 调整：上一轮有批改失败（限流/超时）减半，延迟正常则加一；
+- 每轮记录待批改数量和预计完成时间（GradingRun），供管理接口查询；
+- 窗口关闭后不再派发，已派发但尚未开始的批次会退回待批改。
+"""
+from datetime import datetime, time, timedelta
+
+import pytz
+from django.conf import settings
+from django.utils import timezone
+
+DISCOUNT_TZ = pytz.timezone('Asia/Shanghai')
+DISCOUNT_START = time(0, 30)
+DISCOUNT_END = time(8, 30)
+
+
+def is_discount_time(now=None):
+    # DeepSeek 优惠时段：北京时间 00:30-08:30；GRADING_IGNORE_DISCOUNT_WINDOW 为真时视为全天都在时段内
+    if getattr(settings, 'GRADING_IGNORE_DISCOUNT_WINDOW', False):
+        return True
+    now = (now or timezone.now()).astimezone(DISCOUNT_TZ).time()
+    return DISCOUNT_START <= now <= DISCOUNT_END
+
+
+def window_bounds(now=None):
+    """
+    返回当天优惠时段的 (开始, 结束) 时间；GRADING_IGNORE_DISCOUNT_WINDOW 为真且当天时段已结束时返回下一个时段，
+    保证批次的截止时间总在之后
+    """
+    now = now or timezone.now()
+    day = now.astimezone(DISCOUNT_TZ).date()
+    if getattr(settings, 'GRADING_IGNORE_DISCOUNT_WINDOW', False) and now > DISCOUNT_TZ.localize(
+        datetime.combine(day, DISCOUNT_END)
+    ):
+        day += timedelta(days=1)
+    return (
+        DISCOUNT_TZ.localize(datetime.combine(day, DISCOUNT_START)),
+        DISCOUNT_TZ.localize(datetime.combine(day, DISCOUNT_END)),
+    )
+
+
+def plan_concurrency(current, completed, failures, avg_latency):
+    """
+    AIMD 调整并发批次数：有失败时乘性减半，平均批次耗时未超过目标时加一，否则保持
+    """
+    min_c = getattr(settings, 'GRADING_MIN_CONCURRENCY', 1)
+    max_c = getattr(settings, 'GRADING_MAX_CONCURRENCY', 16)
+    target = getattr(settings, 'GRADING_TARGET_CHUNK_SECONDS', 120)
+    if failures:
+        return max(min_c, current / 2)
+    if completed and avg_latency <= target:
+        return min(max_c, current + 1)
+    return current
+
+
+def project_finish(run, backlog, now):
+    """
+    按本轮已观测的吞吐量估算清空积压的时间；尚无完成批次时按当前并发和目标耗时估算
+    """
+    if not backlog:
+        return now
+    elapsed = (now - run.started_at).total_seconds()
+    if run.graded_results and elapsed > 0:
+        per_second = run.graded_results / elapsed
+    else:
+        chunk_size = getattr(settings, 'GRADING_CHUNK_SIZE', 20)
+        per_second = run.concurrency * chunk_size / getattr(settings, 'GRADING_TARGET_CHUNK_SECONDS', 120)
+    return now + timedelta(seconds=backlog / per_second)
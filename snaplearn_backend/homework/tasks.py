@@ -1,48 +1,287 @@
+import time
+from datetime import timedelta
+
 from celery import shared_task
-from .models import StudentHomeworkResult, StudentAnswer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
-import requests
+from django.utils.dateparse import parse_datetime
+from snaplearn_backend.celery import delay_best_effort
+from .models import Homework, StudentHomeworkResult, StudentAnswer, GradingRun, Question
+from .grading import grade_submissions, is_ai_failure
+from .scheduler import is_discount_time, window_bounds, plan_concurrency, project_finish
+from . import ai_client, grading_cache, hints, regrade, totals
+
+
+def release_stale_claims():
+    """
+    领取后超时仍未提交的作业（worker 崩溃等）重新放回待批改
+    """
+    timeout = getattr(settings, 'GRADING_CLAIM_TIMEOUT', 30 * 60)
+    return StudentHomeworkResult.objects.filter(
+        status='grading', claimed_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status='pending', claimed_at=None)
+
+
+def claim_pending_results(limit):
+    """
+    领取一批待批改作业：SKIP LOCKED 保证多个调度者并发领取时互不重复，返回 (ids, 领取时间)
+    """
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            StudentHomeworkResult.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('submitted_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            StudentHomeworkResult.objects.filter(id__in=ids).update(status='grading', claimed_at=claimed_at)
+    return ids, claimed_at
+
 
 @shared_task
 def batch_grade_pending_homeworks():
-    pendings = StudentHomeworkResult.objects.filter(status='pending')
-    for result in pendings:
-        answers = StudentAnswer.objects.filter(student=result.student, question__homework=result.homework)
-        total_score = 0
-        explanations = []
-        for answer in answers:
-            if answer.question.question_type in ['single', 'multiple']:
-                # 客观题直接判分
-                correct = answer.answer == answer.question.answer
-                score = answer.question.score if correct else 0
-                comment = "正确" if correct else "错误"
-                if not correct:
-                    explanations.append(f"题目：{answer.question.text}，你的答案：{answer.answer}，正确答案：{answer.question.answer}")
-            else:
-                # 主观题调用AI
-                ai_result = {}
-                try:
-                    ai_result = requests.post(
-                        "http://127.0.0.1:8001/api/grade/",
-                        json={
-                            "question": answer.question.text,
-                            "answer": answer.answer,
-                            "reference_answer": answer.question.answer,
-                            "max_score": answer.question.score
-                        }
-                    ).json()
-                except Exception:
-                    ai_result = {"score": 0, "comment": "AI批改失败"}
-                score = ai_result.get("score", 0)
-                comment = ai_result.get("comment", "")
-                if score < answer.question.score:
-                    explanations.append(f"题目：{answer.question.text}，AI评语：{comment}")
-            answer.score = score
-            answer.comment = comment
+    """
+    一次性领取全部待批改作业并分批分发给 worker 并行批改（不受优惠时段限制，供手动触发），返回分发的批次数
+    """
+    release_stale_claims()
+    chunk_size = getattr(settings, 'GRADING_CHUNK_SIZE', 20)
+    chunks = 0
+    while True:
+        ids, claimed_at = claim_pending_results(chunk_size)
+        if not ids:
+            return chunks
+        grade_homework_results.delay(ids, claimed_at.isoformat())
+        chunks += 1
+
+
+@shared_task
+def drain_grading_backlog():
+    """
+    优惠时段内每分钟执行一次的批改调度：按观测到的批次耗时和失败情况调整并发，
+    补足正在进行的批次，并记录积压和预计完成时间；时段外只关闭进行中的批改
+    """
+    now = timezone.now()
+    backlog = StudentHomeworkResult.objects.filter(status__in=['pending', 'grading'])
+    if not is_discount_time(now):
+        GradingRun.objects.filter(status='running').update(status='closed', backlog=backlog.count())
+        return 0
+
+    release_stale_claims()
+    window_end = window_bounds(now)[1]
+    GradingRun.objects.filter(status='running').exclude(window_end=window_end).update(status='closed')
+    run = GradingRun.objects.filter(window_end=window_end).order_by('-id').first()
+    if run is None:
+        run = GradingRun.objects.create(
+            window_end=window_end, concurrency=getattr(settings, 'GRADING_MIN_CONCURRENCY', 1)
+        )
+
+    completed = run.completed_chunks - run.seen_chunks
+    seconds = run.chunk_seconds - run.seen_chunk_seconds
+    run.concurrency = plan_concurrency(
+        run.concurrency, completed, run.failed_items - run.seen_failed_items,
+        seconds / completed if completed else 0,
+    )
+    run.seen_chunks, run.seen_failed_items, run.seen_chunk_seconds = (
+        run.completed_chunks, run.failed_items, run.chunk_seconds
+    )
+
+    chunk_size = getattr(settings, 'GRADING_CHUNK_SIZE', 20)
+    in_flight = backlog.filter(status='grading').values('claimed_at').distinct().count()
+    dispatched = 0
+    for _ in range(int(run.concurrency) - in_flight):
+        ids, claimed_at = claim_pending_results(chunk_size)
+        if not ids:
+            break
+        grade_homework_results.delay(
+            ids, claimed_at.isoformat(), run_id=run.id, deadline=window_end.isoformat()
+        )
+        dispatched += 1
+
+    run.dispatched_chunks += dispatched
+    run.backlog = backlog.count()
+    run.projected_finish_at = project_finish(run, run.backlog, now)
+    run.status = 'running' if run.backlog else 'finished'
+    # 只写调度器负责的字段，完成计数由批改任务用 F() 累加
+    run.save(update_fields=[
+        'concurrency', 'seen_chunks', 'seen_failed_items', 'seen_chunk_seconds',
+        'dispatched_chunks', 'backlog', 'projected_finish_at', 'status', 'updated_at',
+    ])
+    return dispatched
+
+
+@shared_task
+def grade_homework_results(result_ids, claimed_at, run_id=None, deadline=None):
+    """
+    批改一批已领取的作业；只提交仍由本次领取持有的作业，重复执行或领取过期后不会重复写入。
+    超过 deadline（优惠时段结束）才开始执行的批次直接退回待批改
+    """
+    if deadline and timezone.now() >= parse_datetime(deadline):
+        release_claims(result_ids, claimed_at)
+        return 0
+    started = time.monotonic()
+    results = list(StudentHomeworkResult.objects.filter(id__in=result_ids, status='grading', claimed_at=claimed_at))
+    if not results:
+        return 0
+    owners = Q()
+    for result in results:
+        owners |= Q(student_id=result.student_id, question__homework_id=result.homework_id)
+    answers_by_result = {(r.student_id, r.homework_id): [] for r in results}
+    # 只批改每道题最近一次提交的答案，与 totals 中总分的定义一致
+    for answer in totals.latest_answers().filter(owners).select_related('question').order_by('question_id', 'id'):
+        answers_by_result[(answer.student_id, answer.question.homework_id)].append(answer)
+    # 已批改的答案（老师人工修正、单题提交时已判分）保留原得分，只批改其余答案
+    ungraded = {key: [a for a in answers if not a.graded] for key, answers in answers_by_result.items()}
+
+    # 整批的主观题一起交给批量批改接口，结果按顺序取用
+    subjective = [
+        answer for answers in ungraded.values() for answer in answers
+        if answer.question.question_type == 'subjective'
+    ]
+    try:
+        ai_results = dict(zip((answer.id for answer in subjective), ai_client.grade_batch([
+            {
+                "question": answer.question.text,
+                "answer": answer.answer,
+                "reference_answer": answer.question.answer,
+                "max_score": answer.question.score
+            }
+            for answer in subjective
+        ])))
+    except ai_client.AIServiceUnavailable:
+        # AI 服务不可用（熔断或重试耗尽），整批退回待批改，由后续批次重新领取
+        release_claims([r.id for r in results], claimed_at)
+        report_chunk(run_id, started, 0, len(subjective))
+        return 0
+
+    # 个别题目批改失败的作业不记 0 分，退回待批改
+    failed = {
+        r.id for r in results
+        if any(is_ai_failure(ai_results[a.id]) for a in ungraded[(r.student_id, r.homework_id)]
+               if a.id in ai_results)
+    }
+    if failed:
+        release_claims(failed, claimed_at)
+        results = [r for r in results if r.id not in failed]
+
+    graded = grade_submissions([
+        [(a.question, a.answer, ai_results.get(a.id)) for a in ungraded[(r.student_id, r.homework_id)]]
+        for r in results
+    ])
+    for result, submission in zip(results, graded):
+        for answer, item in zip(ungraded[(result.student_id, result.homework_id)], submission.items):
+            answer.score = item.score
+            answer.comment = item.comment
             answer.graded = True
-            answer.save()
-            total_score += score
-        result.total_score = total_score
-        result.explanations = explanations
+        result.explanations = submission.explanations
         result.status = 'graded'
-        result.save()
\ No newline at end of file
+        result.claimed_at = None
+
+    with transaction.atomic():
+        # 提交前再次确认领取仍有效：期间被判定超时重新领取的作业交给新的任务处理
+        owned = set(
+            StudentHomeworkResult.objects.select_for_update()
+            .filter(id__in=[r.id for r in results], status='grading', claimed_at=claimed_at)
+            .values_list('id', flat=True)
+        )
+        results = [r for r in results if r.id in owned]
+        regraded = [answer for r in results for answer in ungraded[(r.student_id, r.homework_id)]]
+        # 批改期间被老师人工修正的答案不覆盖，总分按修正后的得分计算
+        corrected = dict(
+            StudentAnswer.objects.select_for_update()
+            .filter(id__in=[a.id for a in regraded], graded=True)
+            .values_list('id', 'score')
+        )
+        for answer in regraded:
+            answer.score = corrected.get(answer.id, answer.score)
+        for result in results:
+            result.total_score = sum(a.score or 0 for a in answers_by_result[(result.student_id, result.homework_id)])
+        StudentAnswer.objects.bulk_update(
+            [answer for answer in regraded if answer.id not in corrected], ['score', 'comment', 'graded']
+        )
+        StudentHomeworkResult.objects.bulk_update(
+            results, ['total_score', 'explanations', 'status', 'claimed_at']
+        )
+    report_chunk(run_id, started, len(results), sum(1 for r in ai_results.values() if is_ai_failure(r)))
+    return len(results)
+
+
+def release_claims(result_ids, claimed_at):
+    """
+    把仍由本次领取持有的作业退回待批改
+    """
+    StudentHomeworkResult.objects.filter(
+        id__in=result_ids, status='grading', claimed_at=claimed_at
+    ).update(status='pending', claimed_at=None)
+
+
+def report_chunk(run_id, started, graded, failed):
+    if run_id:
+        GradingRun.objects.filter(id=run_id).update(
+            completed_chunks=F('completed_chunks') + 1,
+            graded_results=F('graded_results') + graded,
+            failed_items=F('failed_items') + failed,
+            chunk_seconds=F('chunk_seconds') + (time.monotonic() - started),
+        )
+
+
+@shared_task
+def precompute_question_hints(homework_id):
+    """
+    后台为作业中还没有有效缓存的题目生成解题思路，返回生成的数量
+    """
+    if not getattr(settings, 'AI_HINT_PRECOMPUTE', True):
+        return 0
+    questions = [
+        q for q in Question.objects.filter(homework_id=homework_id).select_related('hint')
+        if hints.cached_hint(q) is None
+    ]
+
+    def generate(question):
+        try:
+            return ai_client.ask(hints.hint_prompt(question.text))
+        except Exception:
+            return None
+
+    generated = 0
+    for question, hint in zip(questions, ai_client.get_executor().map(generate, questions)):
+        if hint is not None:
+            hints.store_hint(question, hint)
+            generated += 1
+    return generated
+
+
+@shared_task
+def regrade_homework_answers(homework_id, question_ids):
+    """
+    教师修改标准答案后重新判分全班的客观题答案、主观题答案退回待批改，并重算总分
+    """
+    return regrade.regrade_homework(homework_id, question_ids)
+
+
+@shared_task
+def retry_pending_regrades():
+    """
+    重新投递请求后超过 REGRADE_RETRY_AFTER 秒仍未完成的重新判分（投递时消息队列不可用等），返回投递数
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'REGRADE_RETRY_AFTER', 300))
+    homework_ids = Homework.objects.filter(regrade_requested_at__lt=cutoff).values_list('id', flat=True)
+    return sum(delay_best_effort(regrade_homework_answers, homework_id, []) for homework_id in homework_ids)
+
+
+@shared_task
+def reconcile_homework_totals(homework_id=None):
+    """
+    核对已批改作业的总分是否等于各题最近一次答案得分之和，修复偏差，返回 (核对数, 偏差数)
+    """
+    return totals.reconcile(homework_id)
+
+
+@shared_task
+def evict_grading_cache():
+    """
+    定时淘汰主观题批改缓存中过期和超量的条目
+    """
+    return grading_cache.evict()
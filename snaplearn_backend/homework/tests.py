@@ -1,3 +1,983 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from rest_framework.test import APIClient
+
+from users.models import CustomUser
+from videos.models import Video
+from . import ai_client, grading, grading_cache, regrade, review, scheduler, tasks, totals
+from .models import Homework, Question, StudentAnswer, StudentHomeworkResult, MistakeBook, ScoreCorrectionLog, GradingCacheEntry, GradingRun, QuestionHint
+
+
+class HomeworkTestCase(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(
+            username='teacher', email='teacher@example.com', is_verified_teacher=True,
+        )
+        self.student = CustomUser.objects.create_user(username='student', email='student@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def create_homework(self, questions, title='作业'):
+        video = Video.objects.create(title=title, teacher=self.teacher, video_file='videos/lesson.mp4')
+        homework = Homework.objects.create(title=title, teacher=self.teacher, video=video)
+        for q in questions:
+            Question.objects.create(homework=homework, options=['A', 'B', 'C', 'D'], **q)
+        return homework
+
+    def submit(self, homework, answers):
+        return self.client.post(
+            f'/homework/submit_by_video/{homework.video_id}/', {'answers': answers}, format='json'
+        )
+
+
+class SubmitHomeworkTest(HomeworkTestCase):
+    def test_objective_homework_is_graded_and_mistakes_recorded(self):
+        homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': 'A', 'score': 5},
+            {'question_type': 'multiple', 'text': 'q2', 'answer': 'A,C', 'score': 5},
+            {'question_type': 'single', 'text': 'q3', 'answer': 'B', 'score': 5},
+        ])
+        q1, q2, q3 = homework.questions.order_by('id')
+        MistakeBook.objects.create(student=self.student, question=q1, wrong_times=2)
+
+        response = self.submit(homework, ['a', 'C, A', 'D'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_score'], 10)
+        self.assertEqual(len(response.data['explanations']), 1)
+        self.assertEqual(
+            list(MistakeBook.objects.filter(student=self.student).values_list('question_id', 'last_wrong_answer')),
+            [(q3.id, 'D')]
+        )
+        self.assertEqual(StudentAnswer.objects.filter(student=self.student, graded=True).count(), 3)
+        result = StudentHomeworkResult.objects.get(homework=homework, student=self.student)
+        self.assertEqual((result.total_score, result.status), (10, 'graded'))
+
+    def test_query_count_does_not_grow_with_question_count(self):
+        counts = []
+        for n in (5, 50):
+            homework = self.create_homework(
+                [{'question_type': 'single', 'text': f'q{i}', 'answer': 'A', 'score': 1} for i in range(n)],
+                title=f'作业{n}',
+            )
+            # 一半题目已在错题集中，一半答错：覆盖新增、更新、删除三种错题集写入
+            questions = list(homework.questions.order_by('id'))
+            for q in questions[::2]:
+                MistakeBook.objects.create(student=self.student, question=q)
+            answers = ['A' if i % 4 == 0 else 'B' for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.submit(homework, answers)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    @mock.patch('homework.views.is_discount_time', return_value=False)
+    def test_subjective_outside_discount_window_is_pending(self, _):
+        homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': 'A', 'score': 5},
+            {'question_type': 'subjective', 'text': 'q2', 'answer': '参考答案', 'score': 10},
+        ])
+        response = self.submit(homework, ['A', '我的答案'])
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(StudentAnswer.objects.filter(student=self.student, graded=False).count(), 2)
+        result = StudentHomeworkResult.objects.get(homework=homework, student=self.student)
+        self.assertEqual((result.total_score, result.status), (None, 'pending'))
+
+    @mock.patch('homework.views.is_discount_time', return_value=True)
+    def test_subjective_in_discount_window_is_graded_by_ai(self, _):
+        homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': 'A', 'score': 5},
+            {'question_type': 'subjective', 'text': 'q2', 'answer': '参考答案', 'score': 10},
+        ])
+        with mock.patch('homework.ai_client.get_session') as get_session:
+            get_session.return_value.post.return_value.json.return_value = {'score': 7, 'comment': '还不错'}
+            response = self.submit(homework, ['A', '我的答案'])
+        self.assertEqual(response.data['total_score'], 12)
+        self.assertEqual(response.data['explanations'], ['题目：q2，AI评语：还不错'])
+
+    @mock.patch('homework.views.is_discount_time', return_value=True)
+    def test_ai_outage_falls_back_to_pending(self, _):
+        homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': 'A', 'score': 5},
+            {'question_type': 'subjective', 'text': 'q2', 'answer': '参考答案', 'score': 10},
+        ])
+        with mock.patch('homework.ai_client.get_session') as get_session:
+            get_session.return_value.post.return_value.raise_for_status.side_effect = requests.HTTPError('503')
+            response = self.submit(homework, ['A', '我的答案'])
+        self.assertEqual(response.data['status'], 'pending')
+        result = StudentHomeworkResult.objects.get(homework=homework, student=self.student)
+        self.assertEqual((result.total_score, result.status), (None, 'pending'))
+        self.assertFalse(StudentAnswer.objects.filter(graded=True).exists())
+
+
+class AIClientTest(TestCase):
+    def items(self, n):
+        return [
+            {'question': f'q{i}', 'answer': f'a{i}', 'reference_answer': 'ref', 'max_score': 10}
+            for i in range(n)
+        ]
+
+    def test_grade_many_runs_concurrently_and_keeps_order(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_post(url, json, timeout):
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.pop()
+            if json['question'] == 'q2' and fail:
+                raise requests.Timeout()
+            response = mock.Mock()
+            response.json.return_value = {'score': int(json['question'][1:]), 'comment': json['answer']}
+            return response
+
+        fail = False
+        with mock.patch('homework.ai_client.get_session') as get_session:
+            get_session.return_value.post.side_effect = fake_post
+            results = ai_client.grade_many(self.items(5))
+            # 任一题调用失败时整体报告服务不可用，由调用方转为待批改，而不是记 0 分
+            fail = True
+            with self.assertRaises(ai_client.AIServiceUnavailable):
+                ai_client.grade_many([dict(item, answer='另一份答案') for item in self.items(5)])
+
+        self.assertGreater(max(peak), 1)
+        self.assertEqual([r['score'] for r in results], [0, 1, 2, 3, 4])
+        timeouts = {c.kwargs['timeout'] for c in get_session.return_value.post.call_args_list}
+        self.assertEqual(timeouts, {(3, 60)})
+
+    def test_grade_batch_splits_requests_and_flattens_in_order(self):
+        def fake_post(url, json, timeout):
+            response = mock.Mock()
+            if json['items'][0]['question'] == 'q0':
+                response.json.return_value = {'results': [{'score': 1, 'comment': 'ok'}] * len(json['items'])}
+            else:
+                response.raise_for_status.side_effect = requests.HTTPError('503')
+            return response
+
+        with mock.patch('homework.ai_client.get_session') as get_session, \
+                self.settings(AI_GRADE_BATCH_SIZE=3):
+            get_session.return_value.post.side_effect = fake_post
+            with self.assertRaises(ai_client.AIServiceUnavailable):
+                ai_client.grade_batch(self.items(5))
+        self.assertEqual(get_session.return_value.post.call_count, 2)
+        self.assertTrue(get_session.return_value.post.call_args.args[0].endswith('/api/grade_batch/'))
+
+
+class GradingEngineTest(HomeworkTestCase):
+    def question(self, question_type, answer):
+        return Question(question_type=question_type, text='q', answer=answer, score=5)
+
+    def test_answer_keys_are_normalized_and_cached(self):
+        multiple = self.question('multiple', ['A', 'c'])
+        for ans in ('a,c', 'C, A', 'A，C', ['c', 'a'], 'A C'):
+            self.assertTrue(grading.grade_objective(multiple, ans), ans)
+        for ans in ('A', 'A,B,C', '', None):
+            self.assertFalse(grading.grade_objective(multiple, ans), ans)
+        self.assertTrue(grading.grade_objective(self.question('multiple', 'B,D'), ['d', 'b']))
+        self.assertEqual(grading.answer_key(multiple).mask, 0b101)
+
+        single = self.question('single', ['B'])
+        self.assertTrue(grading.grade_objective(single, ' b '))
+        self.assertFalse(grading.grade_objective(single, ['A', 'B']))
+        self.assertTrue(grading.grade_objective(self.question('single', '正确'), '正确'))
+        self.assertIsNone(grading.answer_key(self.question('single', '正确')).mask)
+
+        grading.compile_answer.cache_clear()
+        for _ in range(3):
+            grading.grade_objective(multiple, 'A,C')
+        self.assertEqual(grading.compile_answer.cache_info().hits, 2)
+
+    def test_immediate_and_nightly_grading_agree(self):
+        homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': ['A'], 'score': 5},
+            {'question_type': 'multiple', 'text': 'q2', 'answer': ['A', 'C'], 'score': 5},
+            {'question_type': 'multiple', 'text': 'q3', 'answer': 'B,D', 'score': 5},
+            {'question_type': 'subjective', 'text': 'q4', 'answer': '参考答案', 'score': 10},
+        ])
+        answers = ['a', 'C,A', 'B', '我的答案']
+        with mock.patch('homework.views.is_discount_time', return_value=True), \
+                mock.patch('homework.ai_client.grade_many', return_value=[{'score': 6, 'comment': '一般'}]):
+            immediate = self.submit(homework, answers).data
+
+        other = CustomUser.objects.create_user(username='other', email='other@example.com')
+        self.client.force_authenticate(other)
+        with mock.patch('homework.views.is_discount_time', return_value=False):
+            self.submit(homework, answers)
+        ids, claimed_at = tasks.claim_pending_results(10)
+        with mock.patch('homework.ai_client.grade_batch', return_value=[{'score': 6, 'comment': '一般'}]):
+            tasks.grade_homework_results(ids, claimed_at)
+        nightly = StudentHomeworkResult.objects.get(student=other)
+
+        self.assertEqual(immediate['total_score'], 16)
+        self.assertEqual((nightly.total_score, nightly.explanations), (16, immediate['explanations']))
+        scores = lambda user: list(
+            StudentAnswer.objects.filter(student=user).order_by('question_id').values_list('score', 'comment')
+        )
+        self.assertEqual(scores(self.student), scores(other))
+
+
+class RegradeTest(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': 'A', 'score': 5},
+            {'question_type': 'multiple', 'text': 'q2', 'answer': ['A', 'C'], 'score': 5},
+            {'question_type': 'single', 'text': 'q3', 'answer': '正确', 'score': 5},
+            {'question_type': 'subjective', 'text': 'q4', 'answer': '参考答案', 'score': 10},
+        ])
+        self.students = [self.student] + [
+            CustomUser.objects.create_user(username=f's{i}', email=f's{i}@example.com') for i in range(3)
+        ]
+        submissions = [['A', 'A,C', '正确', 'x'], ['B', 'C,A', '错误', 'x'], ['b', 'A', '正确', 'x'], ['A,B', 'A,C', '', 'x']]
+        with mock.patch('homework.views.is_discount_time', return_value=True), \
+                mock.patch('homework.ai_client.grade_many', return_value=[{'score': 6, 'comment': '一般'}]):
+            for student, answers in zip(self.students, submissions):
+                self.client.force_authenticate(student)
+                self.submit(self.homework, answers)
+        # 第一名学生重新提交过一次，总分只按最近一次计算
+        with mock.patch('homework.views.is_discount_time', return_value=True), \
+                mock.patch('homework.ai_client.grade_many', return_value=[{'score': 8, 'comment': '好'}]):
+            self.client.force_authenticate(self.student)
+            self.submit(self.homework, ['B', 'A,C', '正确', 'y'])
+
+    def totals(self):
+        return [
+            StudentHomeworkResult.objects.get(homework=self.homework, student=s).total_score for s in self.students
+        ]
+
+    def update_video(self, payload, broker_down=False):
+        teacher = APIClient()
+        teacher.force_authenticate(self.teacher)
+        with mock.patch('videos.views.regrade_homework_answers') as regrade_task, \
+                mock.patch('videos.views.precompute_question_hints'), \
+                mock.patch('videos.views.generate_video_thumbnail') as thumbnail_task, \
+                self.captureOnCommitCallbacks(execute=True):
+            if broker_down:
+                regrade_task.delay.side_effect = thumbnail_task.delay.side_effect = OperationalError('broker down')
+            response = teacher.post(f'/videos/{self.homework.video_id}/update/', {
+                'homework_title': '作业', 'questions': json.dumps(payload, ensure_ascii=False),
+            })
+        self.assertEqual(response.status_code, 200)
+        return regrade_task
+
+    def edited_payload(self, **changes):
+        # 与前端一致：先取回作业（含题目 id），修改后整体提交
+        teacher = APIClient()
+        teacher.force_authenticate(self.teacher)
+        questions = teacher.get(f'/videos/{self.homework.video_id}/homework/').json()['questions']
+        for q in questions:
+            q.update(changes.get(q['text'], {}))
+        return questions
+
+    def test_update_video_edits_questions_in_place_and_regrades(self):
+        self.assertEqual(self.totals(), [18, 11, 11, 11])
+        questions = list(self.homework.questions.order_by('id'))
+        regrade_task = self.update_video(self.edited_payload(q1={'answer': 'B'}))
+        regrade_task.delay.assert_called_once_with(self.homework.id, [questions[0].id])
+        self.assertEqual(list(self.homework.questions.order_by('id').values_list('id', flat=True)),
+                         [q.id for q in questions])
+        self.assertEqual(StudentAnswer.objects.count(), 20)
+
+        self.assertEqual(tasks.regrade_homework_answers(self.homework.id, [questions[0].id]), (4, 4))
+        self.assertEqual(self.totals(), [23, 16, 16, 11])
+        scores = StudentAnswer.objects.filter(question=questions[0]).order_by('id').values_list('score', 'comment')
+        self.assertEqual(list(scores), [(0, '错误'), (5, '正确'), (5, '正确'), (0, '错误'), (5, '正确')])
+
+    def test_regrade_survives_broker_outage(self):
+        q1 = self.homework.questions.get(text='q1')
+        self.update_video(self.edited_payload(q1={'answer': 'B'}), broker_down=True)
+        self.homework.refresh_from_db()
+        self.assertEqual(self.homework.regrade_question_ids, [q1.id])
+        self.assertIsNotNone(self.homework.regrade_requested_at)
+
+        # 刚提交的请求不补投，超过 REGRADE_RETRY_AFTER 后由定时任务补投
+        with mock.patch('homework.tasks.regrade_homework_answers') as regrade_task:
+            self.assertEqual(tasks.retry_pending_regrades(), 0)
+            Homework.objects.filter(id=self.homework.id).update(
+                regrade_requested_at=timezone.now() - timedelta(minutes=10)
+            )
+            self.assertEqual(tasks.retry_pending_regrades(), 1)
+        regrade_task.delay.assert_called_once_with(self.homework.id, [])
+
+        self.assertEqual(tasks.regrade_homework_answers(self.homework.id, []), (4, 4))
+        self.assertEqual(self.totals(), [23, 16, 16, 11])
+        self.homework.refresh_from_db()
+        self.assertEqual((self.homework.regrade_question_ids, self.homework.regrade_requested_at), ([], None))
+
+    def test_questions_are_matched_by_id_only(self):
+        questions = list(self.homework.questions.order_by('id'))
+        q2_answers = set(StudentAnswer.objects.filter(question=questions[1]).values_list('id', flat=True))
+        # 删除第一题、其余题目倒序，并在最前面插入一道不带 id 的新题
+        payload = self.edited_payload()[1:][::-1]
+        payload.insert(0, {'question_type': 'single', 'text': '新题', 'options': ['A', 'B'], 'answer': 'A', 'score': 5})
+        regrade_task = self.update_video(payload)
+        regrade_task.delay.assert_called_once_with(self.homework.id, [])
+
+        remaining = dict(self.homework.questions.values_list('text', 'id'))
+        self.assertEqual(set(remaining), {'q2', 'q3', 'q4', '新题'})
+        self.assertEqual(remaining['q2'], questions[1].id)
+        self.assertEqual(set(StudentAnswer.objects.filter(question=questions[1]).values_list('id', flat=True)), q2_answers)
+        self.assertFalse(StudentAnswer.objects.filter(question_id=questions[0].id).exists())
+        self.assertFalse(StudentAnswer.objects.filter(question_id=remaining['新题']).exists())
+
+    def test_question_changed_to_subjective_is_requeued(self):
+        q1 = self.homework.questions.get(text='q1')
+        regrade_task = self.update_video(self.edited_payload(q1={'question_type': 'subjective', 'answer': '参考', 'options': []}))
+        regrade_task.delay.assert_called_once_with(self.homework.id, [q1.id])
+        self.assertEqual(tasks.regrade_homework_answers(self.homework.id, [q1.id]), (5, 0))
+        self.assertFalse(StudentAnswer.objects.filter(question=q1).exclude(score=None).exists())
+        self.assertEqual(
+            set(StudentHomeworkResult.objects.filter(homework=self.homework).values_list('status', 'total_score')),
+            {('pending', None)}
+        )
+
+    def test_vectorized_scores_match_scalar_grading(self):
+        Question.objects.filter(homework=self.homework, text='q3').update(answer='错误')
+        Question.objects.filter(homework=self.homework, text='q2').update(answer='A')
+        ids = list(self.homework.questions.values_list('id', flat=True))
+        regrade.regrade_answers(ids, chunk_size=3)
+        for answer in StudentAnswer.objects.select_related('question').exclude(question__question_type='subjective'):
+            correct = grading.grade_objective(answer.question, answer.answer)
+            self.assertEqual(answer.score, answer.question.score if correct else 0, answer.answer)
+
+
+    def test_degenerate_single_choice_key_matches_scalar_grading(self):
+        # 单选题标准答案为空时，未作答或多选的答案在两条判分路径上都是错误
+        Question.objects.filter(homework=self.homework, text__in=['q1', 'q3']).update(answer='')
+        questions = self.homework.questions.filter(text__in=['q1', 'q3'])
+        StudentAnswer.objects.filter(student=self.student, question__text='q1').update(answer='')
+        StudentAnswer.objects.filter(student=self.student, question__text='q3').update(answer=[])
+        regrade.regrade_answers(list(questions.values_list('id', flat=True)))
+        for answer in StudentAnswer.objects.select_related('question').filter(question__in=questions):
+            self.assertFalse(grading.grade_objective(answer.question, answer.answer), answer.answer)
+            self.assertEqual((answer.score, answer.comment), (0, '错误'), answer.answer)
+
+class TotalsTest(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': 'A', 'score': 5},
+            {'question_type': 'subjective', 'text': 'q2', 'answer': '参考答案', 'score': 10},
+        ])
+        self.other = CustomUser.objects.create_user(username='other', email='other@example.com')
+        for student, answers in ((self.student, ['B', 'x']), (self.student, ['A', 'y']), (self.other, ['A', 'z'])):
+            self.client.force_authenticate(student)
+            with mock.patch('homework.views.is_discount_time', return_value=True), \
+                    mock.patch('homework.ai_client.grade_many', return_value=[{'score': 6, 'comment': '一般'}]):
+                self.submit(self.homework, answers)
+        self.teacher_client = APIClient()
+        self.teacher_client.force_authenticate(self.teacher)
+
+    def total(self, student=None):
+        return StudentHomeworkResult.objects.get(homework=self.homework, student=student or self.student).total_score
+
+    def answers(self, text):
+        return list(StudentAnswer.objects.filter(student=self.student, question__text=text).order_by('id'))
+
+    def test_corrections_apply_deltas_without_reaggregating(self):
+        self.assertEqual(self.total(), 11)
+        old, latest = self.answers('q2')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.teacher_client.post('/homework/update_score/', {'answer_id': latest.id, 'new_score': 9})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('SUM(' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(self.total(), 14)
+        self.assertEqual(ScoreCorrectionLog.objects.get(answer=latest).old_score, 6)
+
+        # 已被重新提交取代的答案不影响总分
+        self.teacher_client.post('/homework/update_score/', {'answer_id': old.id, 'new_score': 0})
+        self.assertEqual(self.total(), 14)
+
+        response = self.teacher_client.post('/homework/correct_subjective/', {
+            'answer_id': latest.id, 'ai_score': 9, 'teacher_score': 10, 'teacher_comment': '很好',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.total(), self.total(self.other)), (15, 11))
+        self.assertEqual(
+            self.teacher_client.post('/homework/update_score/', {'answer_id': latest.id, 'new_score': 'x'}).status_code,
+            400,
+        )
+
+    def test_single_question_submit_applies_delta(self):
+        q1 = self.homework.questions.get(text='q1')
+        self.client.force_authenticate(self.student)
+        response = self.client.post(f'/homework/questions/{q1.id}/submit/', {'answer': 'B'}, format='json')
+        self.assertEqual((response.status_code, response.data['score']), (200, 0))
+        self.assertEqual(self.total(), 6)
+        response = self.client.post(f'/homework/questions/{q1.id}/submit/', {'answer': 'a'}, format='json')
+        self.assertEqual(response.data['score'], 5)
+        self.assertEqual(self.total(), 11)
+        self.assertEqual(totals.reconcile(dry_run=True), (2, 0))
+
+    def test_reconcile_repairs_drift(self):
+        StudentHomeworkResult.objects.filter(student=self.student).update(total_score=3)
+        StudentHomeworkResult.objects.filter(student=self.other).update(total_score=None)
+        out = StringIO()
+        call_command('reconcile_totals', '--dry-run', stdout=out)
+        self.assertIn('核对 2 份成绩，发现 2 份总分偏差', out.getvalue())
+        self.assertEqual(self.total(), 3)
+
+        self.assertEqual(totals.reconcile(batch_size=1), (2, 2))
+        self.assertEqual((self.total(), self.total(self.other)), (11, 11))
+        self.assertEqual(tasks.reconcile_homework_totals(self.homework.id), (2, 0))
+
+
+class GradingCacheTest(HomeworkTestCase):
+    def item(self, answer):
+        return {'question': '简述光合作用', 'answer': answer, 'reference_answer': '参考答案', 'max_score': 10}
+
+    def test_normalized_variants_share_a_key(self):
+        self.assertEqual(
+            grading_cache.cache_key(self.item('植物利用光能，合成有机物。')),
+            grading_cache.cache_key(self.item(' 植物利用光能 合成有机物 ')),
+        )
+        self.assertNotEqual(
+            grading_cache.cache_key(self.item('植物利用光能')),
+            grading_cache.cache_key(dict(self.item('植物利用光能'), max_score=5)),
+        )
+
+    @mock.patch('homework.views.is_discount_time', return_value=True)
+    def test_repeated_answers_are_graded_once(self, _):
+        homework = self.create_homework([
+            {'question_type': 'subjective', 'text': 'q1', 'answer': '参考答案', 'score': 10},
+            {'question_type': 'subjective', 'text': 'q1', 'answer': '参考答案', 'score': 10},
+        ])
+        with mock.patch('homework.ai_client.get_session') as get_session:
+            get_session.return_value.post.return_value.json.return_value = {'score': 6, 'comment': '一般'}
+            self.submit(homework, ['答案 A', '答案a'])
+            response = self.submit(homework, ['答案，A。', '答案A'])
+        self.assertEqual(get_session.return_value.post.call_count, 1)
+        self.assertEqual(response.data['total_score'], 12)
+
+        admin = CustomUser.objects.create_user(username='admin', email='admin@example.com', is_staff=True)
+        self.client.force_authenticate(admin)
+        stats = self.client.get('/homework/grading_cache/stats/').data
+        self.assertEqual((stats['entries'], stats['hits']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_failures_are_not_cached_and_size_is_bounded(self):
+        grading_cache.cached_grade([self.item('x')], lambda items: [
+            {'score': 0, 'comment': 'AI批改失败: 超时', 'error': '超时'}
+        ])
+        self.assertFalse(GradingCacheEntry.objects.exists())
+        with self.settings(AI_GRADING_CACHE_MAX_ENTRIES=2):
+            for answer in ('a', 'b', 'c'):
+                grading_cache.cached_grade([self.item(answer)], lambda items: [{'score': 1, 'comment': ''}])
+            grading_cache.cached_grade([self.item('b')], lambda items: self.fail('应命中缓存'))
+            # 写入时不淘汰，由定时任务统一淘汰
+            self.assertEqual(GradingCacheEntry.objects.count(), 3)
+            self.assertEqual(tasks.evict_grading_cache(), 1)
+        self.assertEqual(GradingCacheEntry.objects.count(), 2)
+        self.assertFalse(GradingCacheEntry.objects.filter(key=grading_cache.cache_key(self.item('a'))).exists())
+
+
+class PendingHomeworkTestCase(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.homework = self.create_homework([
+            {'question_type': 'single', 'text': 'q1', 'answer': 'A', 'score': 5},
+            {'question_type': 'subjective', 'text': 'q2', 'answer': '参考答案', 'score': 10},
+        ])
+        self.students = [
+            CustomUser.objects.create_user(username=f's{i}', email=f's{i}@example.com') for i in range(5)
+        ]
+        with mock.patch('homework.views.is_discount_time', return_value=False):
+            for i, student in enumerate(self.students):
+                self.client.force_authenticate(student)
+                self.submit(self.homework, ['a' if i % 2 else 'B', f'答案{i}'])
+
+
+class BatchGradingTest(PendingHomeworkTestCase):
+    def grade_all(self):
+        with mock.patch('homework.tasks.grade_homework_results') as task, \
+                self.settings(GRADING_CHUNK_SIZE=2):
+            chunks = tasks.batch_grade_pending_homeworks()
+        return chunks, [c.args for c in task.delay.call_args_list]
+
+    def test_coordinator_claims_disjoint_chunks(self):
+        chunks, calls = self.grade_all()
+        self.assertEqual(chunks, 3)
+        ids = [i for result_ids, _ in calls for i in result_ids]
+        self.assertEqual(sorted(ids), sorted(StudentHomeworkResult.objects.values_list('id', flat=True)))
+        self.assertFalse(StudentHomeworkResult.objects.filter(status='pending').exists())
+        self.assertEqual(self.grade_all()[0], 0)
+
+    def test_chunk_grades_with_constant_queries_and_is_idempotent(self):
+        _, calls = self.grade_all()
+        with mock.patch('homework.ai_client.grade_batch', side_effect=lambda items: [
+            {'score': 4, 'comment': '一般'} for _ in items
+        ]) as grade_batch:
+            # 读取作业 + 读取答案与题目 + 确认领取 + 查询人工修正 + 两次批量更新（另有两条 SAVEPOINT 语句）
+            with self.assertNumQueries(8):
+                self.assertEqual(tasks.grade_homework_results(*calls[0]), 2)
+            for args in calls[1:]:
+                tasks.grade_homework_results(*args)
+            # 重复投递的任务不会再次写入
+            self.assertEqual(tasks.grade_homework_results(*calls[0]), 0)
+        self.assertEqual(grade_batch.call_count, 3)
+        totals = dict(StudentHomeworkResult.objects.values_list('student__username', 'total_score'))
+        self.assertEqual(totals, {'s0': 4, 's1': 9, 's2': 4, 's3': 9, 's4': 4})
+        self.assertFalse(StudentAnswer.objects.filter(graded=False).exists())
+
+    def test_manual_corrections_are_kept(self):
+        q2 = self.homework.questions.get(text='q2')
+        teacher = APIClient()
+        teacher.force_authenticate(self.teacher)
+        before = StudentAnswer.objects.get(student=self.students[0], question=q2)
+        teacher.post('/homework/update_score/', {'answer_id': before.id, 'new_score': 9, 'comment': '老师批改'})
+        _, calls = self.grade_all()
+
+        during = []
+
+        def grade_batch(items):
+            # 第一批批改期间老师修正了其中一份答案
+            if not during:
+                during.append(StudentAnswer.objects.get(question=q2, answer=items[0]['answer']))
+                StudentAnswer.objects.filter(id=during[0].id).update(score=1, comment='人工', graded=True)
+            return [{'score': 4, 'comment': '一般'} for _ in items]
+
+        with mock.patch('homework.ai_client.grade_batch', side_effect=grade_batch) as batch:
+            for args in calls:
+                tasks.grade_homework_results(*args)
+        self.assertNotIn('答案0', [item['answer'] for c in batch.call_args_list for item in c.args[0]])
+        for answer, expected in ((before, (9, '老师批改')), (during[0], (1, '人工'))):
+            answer.refresh_from_db()
+            self.assertEqual((answer.score, answer.comment), expected)
+        totals = dict(StudentHomeworkResult.objects.values_list('student_id', 'total_score'))
+        self.assertEqual(totals[self.students[0].id], 9)
+        objective = 5 if self.students.index(during[0].student) % 2 else 0
+        self.assertEqual(totals[during[0].student_id], objective + 1)
+
+    def test_requeue_invalidates_in_flight_claims(self):
+        _, calls = self.grade_all()
+        q2 = self.homework.questions.get(text='q2')
+        self.assertEqual(regrade.requeue_subjective(self.homework.id, [q2.id]), 5)
+        self.assertEqual(
+            set(StudentHomeworkResult.objects.values_list('status', 'claimed_at')), {('pending', None)}
+        )
+        # 按旧参考答案进行中的批改不会写回结果
+        with mock.patch('homework.ai_client.grade_batch') as grade_batch:
+            self.assertEqual(tasks.grade_homework_results(*calls[0]), 0)
+        grade_batch.assert_not_called()
+        self.assertFalse(StudentAnswer.objects.filter(question=q2).exclude(score=None).exists())
+
+    def test_resubmission_grades_only_latest_answers(self):
+        # s0 重新提交后只按最近一次的答案批改和计分，与对账任务的总分定义一致
+        self.client.force_authenticate(self.students[0])
+        with mock.patch('homework.views.is_discount_time', return_value=False):
+            self.submit(self.homework, ['A', '新答案'])
+        _, calls = self.grade_all()
+        with mock.patch('homework.ai_client.grade_batch', side_effect=lambda items: [
+            {'score': 2, 'comment': '一般'} for _ in items
+        ]) as grade_batch:
+            for args in calls:
+                tasks.grade_homework_results(*args)
+        self.assertEqual(sum(len(c.args[0]) for c in grade_batch.call_args_list), 5)
+        self.assertEqual(
+            StudentHomeworkResult.objects.get(homework=self.homework, student=self.students[0]).total_score, 7
+        )
+        self.assertEqual(totals.reconcile(dry_run=True), (5, 0))
+
+    def test_ai_outage_returns_chunk_to_pending(self):
+        _, calls = self.grade_all()
+        with mock.patch('homework.ai_client.grade_batch', side_effect=ai_client.AIServiceUnavailable('熔断')):
+            self.assertEqual(tasks.grade_homework_results(*calls[0]), 0)
+        self.assertEqual(
+            set(StudentHomeworkResult.objects.filter(id__in=calls[0][0]).values_list('status', flat=True)),
+            {'pending'}
+        )
+        # 部分题目失败时只提交成功的作业
+        with mock.patch('homework.ai_client.grade_batch', return_value=[
+            {'score': 4, 'comment': '一般'}, {'score': 0, 'comment': 'AI批改失败: 超时', 'error': '超时'}
+        ]):
+            self.assertEqual(tasks.grade_homework_results(*calls[1]), 1)
+        statuses = StudentHomeworkResult.objects.filter(id__in=calls[1][0]).values_list('status', flat=True)
+        self.assertEqual(sorted(statuses), ['graded', 'pending'])
+        self.assertEqual(StudentAnswer.objects.filter(graded=True).count(), 2)
+
+    def test_stale_claims_are_released(self):
+        _, calls = self.grade_all()
+        StudentHomeworkResult.objects.filter(id__in=calls[0][0]).update(
+            claimed_at=timezone.now() - timedelta(hours=1)
+        )
+        chunks, new_calls = self.grade_all()
+        self.assertEqual((chunks, sorted(new_calls[0][0])), (1, sorted(calls[0][0])))
+        # 旧任务的领取已失效，不能再提交
+        with mock.patch('homework.ai_client.grade_batch', return_value=[]):
+            self.assertEqual(tasks.grade_homework_results(*calls[0]), 0)
+
+
+def beijing(hour, minute):
+    return scheduler.DISCOUNT_TZ.localize(datetime(2026, 10, 19, hour, minute))
+
+
+class GradingSchedulerTest(PendingHomeworkTestCase):
+    def tick(self, now):
+        with mock.patch('django.utils.timezone.now', return_value=now), \
+                mock.patch('homework.tasks.grade_homework_results') as task, \
+                self.settings(GRADING_CHUNK_SIZE=2):
+            dispatched = tasks.drain_grading_backlog()
+        calls = [(c.args, c.kwargs) for c in task.delay.call_args_list]
+        self.assertEqual(len(calls), dispatched)
+        return calls
+
+    def run_chunks(self, calls, now, score=4):
+        with mock.patch('django.utils.timezone.now', return_value=now), \
+                mock.patch('homework.ai_client.grade_batch', side_effect=lambda items: [
+                    {'score': score, 'comment': '一般' if score else 'AI批改失败'} for _ in items
+                ]):
+            for args, kwargs in calls:
+                tasks.grade_homework_results(*args, **kwargs)
+
+    def test_discount_window(self):
+        self.assertFalse(scheduler.is_discount_time(beijing(0, 29)))
+        self.assertTrue(scheduler.is_discount_time(beijing(0, 30)))
+        self.assertTrue(scheduler.is_discount_time(beijing(8, 30)))
+        self.assertFalse(scheduler.is_discount_time(beijing(8, 31)))
+        self.assertEqual(scheduler.window_bounds(beijing(3, 0)), (beijing(0, 30), beijing(8, 30)))
+
+    def test_ignoring_discount_window_dispatches_with_future_deadline(self):
+        with self.settings(GRADING_IGNORE_DISCOUNT_WINDOW=True):
+            self.assertEqual(scheduler.window_bounds(beijing(8, 30))[1], beijing(8, 30))
+            self.assertEqual(scheduler.window_bounds(beijing(14, 0))[1], beijing(8, 30) + timedelta(days=1))
+            calls = self.tick(beijing(14, 0))
+        self.assertEqual(len(calls), 1)
+        self.assertGreater(datetime.fromisoformat(calls[0][1]['deadline']), beijing(14, 0))
+        self.run_chunks(calls, beijing(14, 1))
+        self.assertEqual(StudentHomeworkResult.objects.filter(status='graded').count(), 2)
+
+    def test_plan_concurrency_is_aimd(self):
+        with self.settings(GRADING_MAX_CONCURRENCY=4, GRADING_TARGET_CHUNK_SECONDS=60):
+            self.assertEqual(scheduler.plan_concurrency(3, 2, 0, 10), 4)
+            self.assertEqual(scheduler.plan_concurrency(4, 2, 0, 10), 4)
+            self.assertEqual(scheduler.plan_concurrency(3, 2, 0, 90), 3)
+            self.assertEqual(scheduler.plan_concurrency(3, 0, 0, 0), 3)
+            self.assertEqual(scheduler.plan_concurrency(4, 2, 1, 10), 2)
+
+    def test_drain_adapts_concurrency_and_publishes_progress(self):
+        self.assertEqual(self.tick(beijing(0, 29)), [])
+        self.assertFalse(GradingRun.objects.exists())
+
+        first = self.tick(beijing(0, 30))
+        self.assertEqual(len(first), 1)
+        oldest = list(StudentHomeworkResult.objects.order_by('submitted_at', 'id').values_list('id', flat=True)[:2])
+        self.assertEqual(first[0][0][0], oldest)
+        self.assertEqual(first[0][1]['deadline'], beijing(8, 30).isoformat())
+        # 上一批尚未完成，不再派发
+        self.assertEqual(self.tick(beijing(0, 31)), [])
+
+        self.run_chunks(first, beijing(0, 31))
+        second = self.tick(beijing(0, 32))
+        self.assertEqual(len(second), 2)
+        run = GradingRun.objects.get()
+        self.assertEqual((run.concurrency, run.backlog, run.graded_results), (2, 3, 2))
+        self.assertLess(run.projected_finish_at, run.window_end)
+
+        # 批改失败的作业退回待批改，并发减半后重新派发
+        self.run_chunks(second, beijing(0, 33), score=0)
+        self.assertEqual(StudentHomeworkResult.objects.filter(status='pending').count(), 3)
+        third = self.tick(beijing(0, 34))
+        run.refresh_from_db()
+        self.assertEqual((len(third), run.concurrency, run.failed_items), (1, 1, 3))
+
+        self.run_chunks(third, beijing(0, 35))
+        self.run_chunks(self.tick(beijing(0, 36)), beijing(0, 36))
+        self.assertEqual(self.tick(beijing(0, 37)), [])
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.graded_results), ('finished', 5))
+
+        admin = CustomUser.objects.create_user(username='admin', email='admin@example.com', is_staff=True)
+        self.client.force_authenticate(admin)
+        data = self.client.get('/homework/grading_schedule/').data
+        self.assertEqual((data['backlog'], data['run']['status']), (0, 'finished'))
+
+    def test_window_close_stops_dispatch_and_returns_queued_chunks(self):
+        calls = self.tick(beijing(8, 29))
+        self.run_chunks(calls, beijing(8, 31))
+        self.assertFalse(StudentHomeworkResult.objects.filter(status='grading').exists())
+        self.assertEqual(StudentHomeworkResult.objects.filter(status='pending').count(), 5)
+        self.assertEqual(self.tick(beijing(8, 31)), [])
+        self.assertEqual(GradingRun.objects.get().status, 'closed')
+
+
+class HomeworkListTest(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.homeworks = []
+        for i, (subject, level) in enumerate([('math', 'high'), ('math', 'middle'), ('physics', 'high')]):
+            homework = self.create_homework([
+                {'question_type': 'single', 'text': f'{subject}{i}-1', 'answer': 'A', 'score': 5},
+                {'question_type': 'subjective', 'text': f'{subject}{i}-2', 'answer': '参考答案', 'score': 10},
+            ], title=f'作业{i}')
+            Video.objects.filter(id=homework.video_id).update(subject=subject, education_level=level)
+            self.homeworks.append(homework)
+
+    def list(self, **params):
+        return self.client.get('/homework/homeworks/', params).data
+
+    def test_paginated_filtered_and_without_answers(self):
+        data = self.list(page_size=2)
+        self.assertEqual((data['count'], data['page'], len(data['results'])), (3, 1, 2))
+        self.assertEqual([hw['title'] for hw in data['results']], ['作业2', '作业1'])
+        self.assertEqual([q['text'] for q in data['results'][0]['questions']], ['physics2-1', 'physics2-2'])
+        self.assertNotIn('answer', data['results'][0]['questions'][0])
+        self.assertEqual([hw['title'] for hw in self.list(page_size=2, page=2)['results']], ['作业0'])
+
+        self.assertEqual(self.list(subject='math')['count'], 2)
+        self.assertEqual(self.list(subject='math', education_level='high')['count'], 1)
+        self.assertEqual(self.list(education_level='middle,high')['count'], 3)
+        self.assertEqual(self.list(video_id=self.homeworks[1].video_id)['results'][0]['title'], '作业1')
+        self.assertEqual(self.list(teacher_id=self.student.id)['count'], 0)
+
+    def test_questions_are_cached_until_they_change(self):
+        # 计数 + 当前页作业 + 一次 prefetch 题目；命中缓存后不再查询题目
+        with self.assertNumQueries(3):
+            self.list()
+        with self.assertNumQueries(2):
+            first = self.list()
+
+        homework = self.homeworks[2]
+        Question.objects.create(homework=homework, question_type='single', text='新题', answer='B', options=['A', 'B'])
+        question = homework.questions.get(text='physics2-1')
+        question.text = '改过的题'
+        question.save()
+        with self.assertNumQueries(3):
+            data = self.list()
+        self.assertEqual([q['text'] for q in data['results'][0]['questions']], ['改过的题', 'physics2-2', '新题'])
+        self.assertEqual(data['results'][1:], first['results'][1:])
+
+        question.delete()
+        self.assertEqual(len(self.list()['results'][0]['questions']), 2)
+
+
+class MistakeReviewTest(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        homework = self.create_homework(
+            [{'question_type': 'single', 'text': f'q{i}', 'answer': 'A', 'score': 1} for i in range(15)]
+        )
+        self.questions = list(homework.questions.order_by('id'))
+        now = timezone.now()
+        # 前 12 题已到期（越靠前到期越早），后 3 题尚未到期
+        for i, q in enumerate(self.questions):
+            MistakeBook.objects.create(student=self.student, question=q, due_at=now + timedelta(hours=i - 11.5))
+
+    def review(self, question, is_correct, **extra):
+        return self.client.post(
+            '/homework/mistakebook/update/', {'question_id': question.id, 'is_correct': is_correct, **extra},
+            format='json',
+        )
+
+    def test_returns_earliest_due_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/homework/mistakebook/').data
+        self.assertEqual([item['text'] for item in data], [f'q{i}' for i in range(10)])
+        self.assertNotIn('answer', data[0])
+
+    def test_items_not_yet_due_are_not_returned(self):
+        MistakeBook.objects.filter(student=self.student, question__in=self.questions[:10]).delete()
+        data = self.client.get('/homework/mistakebook/').data
+        self.assertEqual([item['text'] for item in data], ['q10', 'q11'])
+        MistakeBook.objects.filter(student=self.student).update(due_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.client.get('/homework/mistakebook/').data, [])
+
+    def test_sm2_schedule(self):
+        q = self.questions[0]
+        mb = MistakeBook(ease=2.5, repetitions=0, interval_days=0)
+        now = timezone.now()
+        intervals = []
+        for _ in range(4):
+            review.reschedule(mb, 5, now)
+            intervals.append(mb.interval_days)
+        self.assertEqual(intervals, [1, 6, 16, 45])
+        self.assertAlmostEqual(mb.ease, 2.9)
+        self.assertFalse(review.reschedule(mb, 1, now))
+        self.assertEqual((mb.repetitions, mb.interval_days), (0, 1))
+        self.assertAlmostEqual(mb.ease, 2.36)
+        self.assertEqual(mb.due_at, now + timedelta(days=1))
+
+        response = self.review(q, False)
+        mb = MistakeBook.objects.get(student=self.student, question=q)
+        self.assertEqual((mb.wrong_times, mb.repetitions, mb.interval_days), (1, 0, 1))
+        self.assertEqual(response.data['due_at'], mb.due_at)
+        for mastered in (False, False, True):
+            self.assertEqual(self.review(q, True).data['mastered'], mastered)
+        self.assertFalse(MistakeBook.objects.filter(student=self.student, question=q).exists())
+        self.assertEqual(self.review(self.questions[1], True, quality='x').status_code, 400)
+
+    def test_wrong_again_in_homework_resets_schedule(self):
+        homework = self.questions[0].homework
+        MistakeBook.objects.filter(student=self.student).update(
+            repetitions=2, interval_days=6, due_at=timezone.now() + timedelta(days=6)
+        )
+        self.submit(homework, ['B'] + ['A'] * 14)
+        mb = MistakeBook.objects.get(student=self.student)
+        self.assertEqual((mb.question_id, mb.repetitions, mb.interval_days), (self.questions[0].id, 0, 1))
+        self.assertLessEqual(mb.due_at, timezone.now())
+
+
+class QuestionHintTest(HomeworkTestCase):
+    def setUp(self):
+        super().setUp()
+        self.homework = self.create_homework([
+            {'question_type': 'subjective', 'text': '证明勾股定理', 'answer': '略', 'score': 10},
+            {'question_type': 'single', 'text': '1+1=?', 'answer': 'B', 'score': 5},
+        ])
+        self.question = self.homework.questions.order_by('id').first()
+
+    def ask_help(self):
+        return self.client.post(f'/homework/questions/{self.question.id}/ai_help/')
+
+    def test_hint_is_cached_until_question_changes(self):
+        with mock.patch('homework.ai_client.ask', side_effect=['思路一', '思路二']) as ask:
+            self.assertEqual(self.ask_help().data, {'hint': '思路一', 'times': 1})
+            self.assertEqual(self.ask_help().data, {'hint': '思路一', 'times': 2})
+            self.assertEqual(ask.call_count, 1)
+
+            self.question.text = '用面积法证明勾股定理'
+            self.question.save()
+            self.assertEqual(self.ask_help().data['hint'], '思路二')
+        self.assertIn('面积法', ask.call_args.args[0])
+
+    def test_precompute_fills_missing_hints(self):
+        with mock.patch('homework.ai_client.ask', side_effect=lambda prompt: prompt[-6:]) as ask:
+            self.assertEqual(tasks.precompute_question_hints(self.homework.id), 2)
+            self.assertEqual(tasks.precompute_question_hints(self.homework.id), 0)
+            self.assertEqual(ask.call_count, 2)
+            self.assertEqual(self.ask_help().data['hint'], '证明勾股定理')
+        self.assertEqual(QuestionHint.objects.count(), 2)
+
+    def test_upload_schedules_precompute(self):
+        self.teacher_client = APIClient()
+        self.teacher_client.force_authenticate(self.teacher)
+        with mock.patch('homework.views.precompute_question_hints') as task, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.teacher_client.post('/homework/upload/', {
+                'title': '新作业',
+                'questions': [{'question_type': 'subjective', 'text': 'q', 'answer': 'a'}],
+            }, format='json')
+        task.delay.assert_called_once_with(Homework.objects.get(title='新作业').id)
+
+    def test_precompute_is_skipped_when_broker_is_down(self):
+        # 预生成解题思路只是优化，消息队列不可用时已写入的作业和题目照常返回成功
+        self.teacher_client = APIClient()
+        self.teacher_client.force_authenticate(self.teacher)
+        with mock.patch('homework.views.precompute_question_hints') as task:
+            task.delay.side_effect = OperationalError('broker down')
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.teacher_client.post('/homework/upload/', {
+                    'title': '新作业',
+                    'questions': [{'question_type': 'subjective', 'text': 'q', 'answer': 'a'}],
+                }, format='json')
+            self.assertLess(response.status_code, 300)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.teacher_client.post(f'/homework/{self.homework.id}/add_question/', {
+                    'question_type': 'single', 'text': '新题', 'options': ['A', 'B'], 'answer': 'A',
+                }, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(task.delay.call_count, 2)
+        self.assertTrue(Homework.objects.filter(title='新作业').exists())
+        self.assertTrue(self.homework.questions.filter(text='新题').exists())
+
+    def stream_help(self):
+        response = self.client.post(
+            f'/homework/questions/{self.question.id}/ai_help/stream/', HTTP_ACCEPT='text/event-stream'
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_stream_proxies_tokens_and_fills_cache(self):
+        upstream = mock.Mock()
+        upstream.iter_lines.return_value = [
+            line.encode('utf-8') for line in [
+                'data: {"delta": "先画"}', '', 'data: {"delta": "辅助线"}', '', 'event: done', 'data: {}', '',
+            ]
+        ]
+        with mock.patch('homework.ai_client.get_session') as get_session:
+            get_session.return_value.post.return_value = upstream
+            body = self.stream_help()
+        self.assertEqual(body, (
+            'data: {"delta": "先画"}\n\n'
+            'data: {"delta": "辅助线"}\n\n'
+            'event: done\ndata: {"times": 1}\n\n'
+        ))
+        self.assertEqual(QuestionHint.objects.get(question=self.question).hint, '先画辅助线')
+
+        with mock.patch('homework.ai_client.ask_stream') as ask_stream:
+            body = self.stream_help()
+        ask_stream.assert_not_called()
+        self.assertTrue(body.startswith('data: {"delta": "先画辅助线"}\n\n'))
+
+    def test_stream_error_is_not_cached(self):
+        upstream = mock.Mock()
+        upstream.iter_lines.return_value = [b'data: {"delta": "x"}', b'', b'event: error', b'data: {"error": "429"}', b'']
+        with mock.patch('homework.ai_client.get_session') as get_session:
+            get_session.return_value.post.return_value = upstream
+            body = self.stream_help()
+        self.assertTrue(body.endswith('event: error\ndata: {"error": "429"}\n\n'))
+        self.assertFalse(QuestionHint.objects.exists())
+
+
+class GradingLoadTestCommandTest(TransactionTestCase):
+    def fake_post(self, url, json, timeout):
+        response = mock.Mock()
+        if url.endswith('/api/grade_batch/'):
+            response.json.return_value = {'results': [{'score': 6, 'comment': '模拟'} for _ in json['items']]}
+        else:
+            response.json.return_value = {'score': 6, 'comment': '模拟'}
+        return response
+
+    def loadtest(self, **options):
+        out = StringIO()
+        with mock.patch('homework.ai_client.get_session') as get_session:
+            get_session.return_value.post.side_effect = self.fake_post
+            # 测试库是共享缓存的内存 SQLite，并发写入会直接报表锁定，这里只用一个 worker
+            call_command('grading_loadtest', stdout=out, stderr=StringIO(), concurrency=1, **options)
+        return out.getvalue(), get_session.return_value.post
+
+    def test_replays_submissions_and_cleans_up(self):
+        output, post = self.loadtest(submissions=4, subjective=2)
+        self.assertEqual(post.call_count, 8)
+        self.assertIn('失败：0', output)
+        self.assertIn('p99', output)
+
+        output, post = self.loadtest(submissions=5, mode='batch', distinct_answers=1)
+        self.assertEqual(post.call_count, 1)
+        self.assertIn('失败：0', output)
+
+        self.assertFalse(CustomUser.objects.exists())
+        self.assertFalse(GradingCacheEntry.objects.exists())
+
+    def test_min_throughput_gate(self):
+        with self.assertRaises(CommandError):
+            self.loadtest(submissions=2, min_throughput=10 ** 9)
+
+    def test_failed_seed_is_cleaned_up(self):
+        with mock.patch('homework.models.Question.objects.bulk_create', side_effect=RuntimeError('磁盘已满')):
+            with self.assertRaises(RuntimeError):
+                self.loadtest(submissions=3)
+        self.assertFalse(CustomUser.objects.exists())
+        self.assertFalse(Homework.objects.exists())
+
+    @mock.patch('homework.scheduler.timezone.now', return_value=beijing(12, 0))
+    def test_respects_discount_window_on_request(self, _):
+        output, post = self.loadtest(submissions=2, subjective=1, respect_discount_window=True)
+        self.assertEqual(post.call_count, 0)
+        self.assertIn('失败：2', output)
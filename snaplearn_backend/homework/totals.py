@@ -0,0 +1,92 @@
+"""
+作业总分维护
+
+StudentHomeworkResult.total_score 等于学生每道题最近一次提交的答案得分之和。
+修改单个答案的得分时不再重新汇总，而是用一条带 F() 的 UPDATE 把分差加到总分上（只在该答案仍是
+该题最近一次提交时）；对账任务定期按同一定义批量核对总分，修复偏差。
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Abs, Coalesce
+
+from .models import StudentAnswer, StudentHomeworkResult
+
+# 浮点分差累加允许的误差
+TOLERANCE = 1e-6
+
+
+def latest_answers():
+    """
+    每个学生每道题最近一次提交的答案
+    """
+    return StudentAnswer.objects.exclude(
+        Exists(StudentAnswer.objects.filter(
+            student_id=OuterRef('student_id'), question_id=OuterRef('question_id'), id__gt=OuterRef('id')
+        ))
+    )
+
+
+def expected_total():
+    """
+    外层为 StudentHomeworkResult 时，按答案重新汇总的总分
+    """
+    total = latest_answers().filter(
+        student_id=OuterRef('student_id'), question__homework_id=OuterRef('homework_id')
+    ).values('student_id').annotate(total=Sum('score')).values('total')
+    return Coalesce(Subquery(total, output_field=FloatField()), Value(0.0))
+
+
+def apply_score_change(answer, old_score):
+    """
+    答案得分改变后把分差加到作业总分上：一条 UPDATE，与答案数量无关；
+    该答案已被之后的提交取代或作业尚未批改完成时不影响总分
+    """
+    delta = (answer.score or 0) - (old_score or 0)
+    if not delta:
+        return 0
+    newer = StudentAnswer.objects.filter(
+        student_id=answer.student_id, question_id=answer.question_id, id__gt=answer.id
+    )
+    return StudentHomeworkResult.objects.filter(
+        ~Exists(newer), homework_id=answer.question.homework_id, student_id=answer.student_id, status='graded',
+    ).update(total_score=Coalesce(F('total_score'), Value(0.0)) + delta)
+
+
+def recompute_totals(homework_id):
+    """
+    一条 UPDATE 重算作业所有已批改成绩的总分
+    """
+    return StudentHomeworkResult.objects.filter(homework_id=homework_id, status='graded').update(
+        total_score=expected_total()
+    )
+
+
+def reconcile(homework_id=None, batch_size=None, dry_run=False):
+    """
+    按 id 分块核对已批改成绩的总分，与按答案汇总的结果不一致的批量修复，返回 (核对数, 偏差数)
+    """
+    batch_size = batch_size or getattr(settings, 'TOTALS_RECONCILE_BATCH_SIZE', 2000)
+    results = StudentHomeworkResult.objects.filter(status='graded').order_by('id')
+    if homework_id is not None:
+        results = results.filter(homework_id=homework_id)
+    checked = drifted = 0
+    last_id = 0
+    while True:
+        ids = list(results.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        checked += len(ids)
+        with transaction.atomic():
+            stale = (
+                StudentHomeworkResult.objects.filter(id__in=ids)
+                .annotate(expected=expected_total())
+                .annotate(drift=Abs(F('total_score') - F('expected')))
+                .filter(Q(total_score__isnull=True) | Q(drift__gt=TOLERANCE))
+            )
+            stale_ids = list(stale.values_list('id', flat=True))
+            drifted += len(stale_ids)
+            if stale_ids and not dry_run:
+                StudentHomeworkResult.objects.filter(id__in=stale_ids).update(total_score=expected_total())
+    return checked, drifted
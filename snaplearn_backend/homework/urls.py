@@ -7,6 +7,7 @@ urlpatterns = [
     path('upload/', views.UploadHomeworkView.as_view()),          # 教师上传作业
     path('questions/<int:question_id>/submit/', views.SubmitAnswerView.as_view()),
     path('questions/<int:question_id>/ai_help/', views.AIHelpView.as_view()),
+    path('questions/<int:question_id>/ai_help/stream/', views.AIHelpStreamView.as_view()),
     path('questions/<int:question_id>/ai_feedback/', views.AIHelpFeedbackView.as_view()),
     path('mistakebook/', views.get_mistake_book),
     path('mistakebook/update/', views.update_mistake_book),
@@ -15,6 +16,9 @@ urlpatterns = [
     path('homework/<int:homework_id>/student/<int:student_id>/', views.homework_student_detail),
     path('submit_by_video/<int:video_id>/', views.submit_homework_by_video, name='submit_homework_by_video'),
     path('<int:homework_id>/add_question/', add_question, name='add_question'),
+    path('update_score/', views.update_score, name='update_score'),
     path('correct_subjective/', views.correct_subjective_answer, name='correct_subjective_answer'),
     path('my_scores/', views.my_scores, name='my_scores'),
+    path('grading_schedule/', views.grading_schedule_status, name='grading_schedule_status'),
+    path('grading_cache/stats/', views.grading_cache_stats, name='grading_cache_stats'),
 ]
\ No newline at end of file
@@ -1,26 +1,26 @@
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from .models import Homework, Question, StudentAnswer, StudentAIHelpRecord, StudentHomeworkResult, MistakeBook, SubjectiveCorrectionLog
+from .models import Homework, Question, StudentAnswer, StudentAIHelpRecord, StudentHomeworkResult, MistakeBook, ScoreCorrectionLog, SubjectiveCorrectionLog, GradingRun
 from .serializers import HomeworkSerializer, StudentAnswerSerializer, StudentHomeworkResultSerializer
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-import requests
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+import json
+from . import ai_client, grading_cache, hints, question_cache, review, totals
+from .tasks import precompute_question_hints
+from .grading import grade_objective, grade_submission
+from .scheduler import is_discount_time, window_bounds
 from django.db.models import Q
-import random
 from django.utils import timezone
 from videos.models import Video
-from datetime import datetime, time, timedelta
-import pytz
-
-def is_discount_time():
-    # DeepSeek 优惠时段：北京时间 00:30-08:30
-    tz = pytz.timezone('Asia/Shanghai')
-    now = datetime.now(tz).time()
-    return time(0, 30) <= now <= time(8, 30)
+from snaplearn_backend.celery import delay_best_effort
 
 class UploadHomeworkView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -45,42 +45,76 @@ class UploadHomeworkView(APIView):
                     answer=q['answer'],
                     score=q.get('score', 5)
                 )
+            transaction.on_commit(lambda: delay_best_effort(precompute_question_hints, hw.id))
         return Response({'msg': '作业上传成功'})
 
+# 作业列表分页参数
+HOMEWORK_PAGE_SIZE = 10
+HOMEWORK_MAX_PAGE_SIZE = 50
+
+
+def filter_homeworks(params):
+    """
+    按请求参数（subject/education_level/video_id/teacher_id）过滤作业，学科和学历取自作业所属的视频
+    """
+    qs = Homework.objects.all()
+    subject = params.get('subject')
+    education_level = params.get('education_level')
+    video_id = params.get('video_id')
+    teacher_id = params.get('teacher_id')
+    if subject:
+        qs = qs.filter(video__subject=subject)
+    # 支持学历等级多选
+    if education_level:
+        levels = [x.strip() for x in education_level.split(',') if x.strip()]
+        if levels:
+            qs = qs.filter(video__education_level__in=levels)
+    if video_id and str(video_id).isdigit():
+        qs = qs.filter(video_id=int(video_id))
+    if teacher_id and str(teacher_id).isdigit():
+        qs = qs.filter(teacher_id=int(teacher_id))
+    return qs.order_by('-created_at', '-id')
+
+
+def paginate_homeworks(request, queryset):
+    """
+    按 page/page_size 分页，返回 (当前页的作业列表, 分页信息)
+    """
+    try:
+        page_size = min(max(int(request.GET.get('page_size', HOMEWORK_PAGE_SIZE)), 1), HOMEWORK_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = HOMEWORK_PAGE_SIZE
+    paginator = Paginator(queryset, page_size)
+    page_obj = paginator.get_page(request.GET.get('page', 1))
+    return list(page_obj), {'count': paginator.count, 'page': page_obj.number, 'page_size': page_size}
+
+
 class HomeworkListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # 学生端只返回题目，不含标准答案
-        homeworks = Homework.objects.all()
+        # 学生端只返回题目，不含标准答案；题目一次 prefetch 取出
+        homeworks, page = paginate_homeworks(request, filter_homeworks(request.GET).prefetch_related('questions'))
         serializer = HomeworkSerializer(homeworks, many=True)
-        return Response(serializer.data)
+        return Response({**page, 'results': serializer.data})
 
 class HomeworkListStudentView(APIView):
+    """
+    学生端作业列表：GET /homework/homeworks/?subject=&education_level=a[,b]&video_id=&teacher_id=&page=&page_size=
+    只返回题目，不含标准答案；每份作业的题目 JSON 走缓存，题目变化后才重建
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # 只返回题目，不含标准答案
-        homeworks = Homework.objects.all().order_by('-created_at')
-        data = []
-        for hw in homeworks:
-            questions = hw.questions.all()
-            qlist = []
-            for q in questions:
-                qlist.append({
-                    'id': q.id,
-                    'question_type': q.question_type,
-                    'text': q.text,
-                    'options': q.options,
-                    'score': getattr(q, 'score', 5)
-                })
-            data.append({
-                'id': hw.id,
-                'title': hw.title,
-                'description': hw.description,
-                'questions': qlist
-            })
-        return Response(data)
+        homeworks, page = paginate_homeworks(request, filter_homeworks(request.GET))
+        questions = question_cache.cached_questions(homeworks)
+        data = [{
+            'id': hw.id,
+            'title': hw.title,
+            'description': hw.description,
+            'questions': questions[hw.id]
+        } for hw in homeworks]
+        return Response({**page, 'results': data})
 
 class SubmitAnswerView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -91,49 +125,107 @@ class SubmitAnswerView(APIView):
         student = request.user
         # 客观题自动判分
         if question.question_type in ['single', 'multiple']:
-            is_correct = answer == question.answer
-            score = 1.0 if is_correct else 0.0
+            is_correct = grade_objective(question, answer)
+            score = question.score if is_correct else 0
             comment = "正确" if is_correct else "错误"
         else:
             # 主观题调用AI
             ans_str = answer if isinstance(answer, str) else str(answer)
             ref_str = question.answer if isinstance(question.answer, str) else str(question.answer)
-            ai_result = requests.post(
-                "http://127.0.0.1:8001/api/grade/",
-                json={
-                    "question": question.text,
-                    "answer": ans_str,
-                    "reference_answer": ref_str,
-                    "max_score": question.score  # 传递题目分数
-                }
-            ).json()
+            try:
+                ai_result = ai_client.grade_answer(
+                    question=question.text,
+                    answer=ans_str,
+                    reference_answer=ref_str,
+                    max_score=question.score  # 传递题目分数
+                )
+            except ai_client.AIServiceUnavailable:
+                return Response({'error': 'AI批改服务暂不可用，请稍后重试'}, status=503)
             score = ai_result.get("score", 0)
             comment = ai_result.get("comment", "")
-        student_answer = StudentAnswer.objects.create(
-            question=question,
-            student=student,
-            answer=answer,
-            score=score,
-            comment=comment,
-            graded=True,
-        )
+        with transaction.atomic():
+            # 新答案取代该题上一次的答案，总分按两者的分差调整
+            previous = (
+                StudentAnswer.objects.select_for_update()
+                .filter(question=question, student=student).order_by('-id').first()
+            )
+            student_answer = StudentAnswer.objects.create(
+                question=question,
+                student=student,
+                answer=answer,
+                score=score,
+                comment=comment,
+                graded=True,
+            )
+            totals.apply_score_change(student_answer, previous.score if previous else None)
         return Response(StudentAnswerSerializer(student_answer).data)
 
 class AIHelpView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, question_id):
-        question = get_object_or_404(Question, id=question_id)
+        question = get_object_or_404(Question.objects.select_related('hint'), id=question_id)
         student = request.user
         record, _ = StudentAIHelpRecord.objects.get_or_create(student=student, question=question)
         record.times += 1
         record.save()
-        # 只输出解题思路
-        ai_response = requests.post(
-            "http://127.0.0.1:8001/api/ask/",
-            json={"question": f"请只给出解题思路，不要直接给答案。题目：{question.text}"}
-        ).json()
-        return Response({"hint": ai_response["answer"], "times": record.times})
+        try:
+            hint = hints.get_hint(question)
+        except ai_client.AIServiceUnavailable:
+            return Response({'error': 'AI服务暂不可用，请稍后重试', 'times': record.times}, status=503)
+        return Response({"hint": hint, "times": record.times})
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    让 Accept: text/event-stream 的请求通过内容协商，实际响应由 StreamingHttpResponse 输出
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event(data, 'error').encode('utf-8')
+
+
+def sse_event(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder)}\n\n"
+
+
+class AIHelpStreamView(APIView):
+    """
+    流式获取解题思路（Server-Sent Events）：每段为 data: {"delta": "..."}，结束时发送 event: done。
+    有缓存时一次性返回，否则转发 AI 服务的流式输出，完整结果写入缓存
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request, question_id):
+        question = get_object_or_404(Question.objects.select_related('hint'), id=question_id)
+        record, _ = StudentAIHelpRecord.objects.get_or_create(student=request.user, question=question)
+        record.times += 1
+        record.save()
+
+        def events():
+            hint = hints.cached_hint(question)
+            if hint is not None:
+                yield sse_event({"delta": hint})
+            else:
+                parts = []
+                try:
+                    for delta in ai_client.ask_stream(hints.hint_prompt(question.text)):
+                        parts.append(delta)
+                        yield sse_event({"delta": delta})
+                except Exception as e:
+                    yield sse_event({"error": str(e)}, 'error')
+                    return
+                hints.store_hint(question, ''.join(parts))
+            yield sse_event({"times": record.times}, 'done')
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream; charset=utf-8')
+        response['Cache-Control'] = 'no-cache'
+        # 关闭 nginx 缓冲，保证首个 token 立即送达
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class AIHelpFeedbackView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -147,17 +239,22 @@ class AIHelpFeedbackView(APIView):
         # 可扩展：将 record.times 反馈给 AI 系统
         return Response({"msg": "反馈已记录", "times": record.times})
 
+MISTAKE_REVIEW_SIZE = 10
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_mistake_book(request):
+    """
+    返回已到期的错题，最早到期的在前（按 (student, due_at) 索引取前几条，题目随错题一次查出）；
+    尚未到复习时间的错题不返回
+    """
     user = request.user
-    mistakes = MistakeBook.objects.filter(student=user)
-    all_mistakes = list(mistakes)
-    # 保证不重复且数量逻辑
-    if len(all_mistakes) > 10:
-        selected = random.sample(all_mistakes, 10)
-    else:
-        selected = all_mistakes
+    selected = (
+        MistakeBook.objects.filter(student=user, due_at__lte=timezone.now())
+        .select_related('question')
+        .order_by('due_at', 'id')[:MISTAKE_REVIEW_SIZE]
+    )
     data = []
     for mb in selected:
         q = mb.question
@@ -170,6 +267,7 @@ def get_mistake_book(request):
             "score": q.score,
             "wrong_times": mb.wrong_times,
             "last_wrong_answer": mb.last_wrong_answer,
+            "due_at": mb.due_at,
         })
     return Response(data)
 
@@ -177,22 +275,27 @@ def get_mistake_book(request):
 @permission_classes([permissions.IsAuthenticated])
 def update_mistake_book(request):
     """
-    用户答题后更新错题集（前端每答对一题调用，传question_id和is_correct）
+    用户复习错题后更新复习计划（前端每答一题调用，传question_id、is_correct，可选 quality 0-5）
     """
     user = request.user
     qid = request.data.get('question_id')
     is_correct = request.data.get('is_correct')
+    try:
+        quality = review.quality_for(is_correct, request.data.get('quality'))
+    except (TypeError, ValueError):
+        return Response({"error": "quality 应为 0-5 的整数"}, status=400)
     try:
         mb = MistakeBook.objects.get(student=user, question_id=qid)
-        if is_correct:
-            # 答对一次就删除:
-            mb.delete()
-        else:
-            mb.wrong_times += 1  # 累计答错次数
-            mb.save()
-        return Response({"msg": "ok"})
     except MistakeBook.DoesNotExist:
         return Response({"msg": "not found"}, status=404)
+    if not is_correct:
+        mb.wrong_times += 1  # 累计答错次数
+    if review.reschedule(mb, quality):
+        # 连续答对多次视为已掌握，移出错题集
+        mb.delete()
+        return Response({"msg": "ok", "mastered": True})
+    mb.save(update_fields=['wrong_times'] + review.SCHEDULE_FIELDS)
+    return Response({"msg": "ok", "mastered": False, "due_at": mb.due_at})
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -240,6 +343,58 @@ def homework_student_detail(request, homework_id, student_id):
     except StudentHomeworkResult.DoesNotExist:
         return Response({"error": "未找到作业"}, status=404)
 
+def save_graded_answers(user, graded):
+    """
+    批量写入判分结果并同步错题集，查询次数与题目数量无关
+    graded: [(question, answer, score, comment, is_correct), ...]
+    """
+    question_ids = [q.id for q, _, _, _, _ in graded]
+    existing = {
+        mb.question_id: mb
+        for mb in MistakeBook.objects.filter(student=user, question_id__in=question_ids)
+    }
+    to_create, to_update, to_delete = [], [], []
+    for q, ans, score, comment, correct in graded:
+        mb = existing.get(q.id)
+        if correct:
+            if mb:
+                to_delete.append(q.id)
+        elif mb:
+            mb.wrong_times = 0
+            mb.last_wrong_answer = str(ans)
+            review.reset(mb)
+            to_update.append(mb)
+        else:
+            to_create.append(MistakeBook(student=user, question=q, wrong_times=0, last_wrong_answer=str(ans)))
+    if to_delete:
+        MistakeBook.objects.filter(student=user, question_id__in=to_delete).delete()
+    if to_create:
+        MistakeBook.objects.bulk_create(to_create)
+    if to_update:
+        MistakeBook.objects.bulk_update(to_update, ['wrong_times', 'last_wrong_answer'] + review.SCHEDULE_FIELDS)
+    StudentAnswer.objects.bulk_create([
+        StudentAnswer(question=q, student=user, answer=ans, score=score, comment=comment, graded=True)
+        for q, ans, score, comment, correct in graded
+    ])
+
+
+def save_pending_submission(homework, user, submitted):
+    """
+    保存为待批改：答案不判分，作业结果状态置为 pending
+    """
+    with transaction.atomic():
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(question=q, student=user, answer=ans, score=None, comment='', graded=False)
+            for q, ans in submitted
+        ])
+        StudentHomeworkResult.objects.update_or_create(
+            homework=homework, student=user,
+            defaults={
+                'total_score': None, 'explanations': [], 'status': 'pending',
+                'submitted_at': timezone.now(), 'claimed_at': None,
+            }
+        )
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def submit_homework_by_video(request, video_id):
@@ -252,141 +407,52 @@ def submit_homework_by_video(request, video_id):
         return Response({'error': '未找到该视频对应的作业'}, status=404)
     user = request.user
     answers = request.data.get('answers', {})
-    total_score = 0
-    explanations = []
     # 兼容前端传数组或dict
     if isinstance(answers, list):
         answer_map = {str(idx): ans for idx, ans in enumerate(answers)}
     else:
         answer_map = answers
 
-    # 判断是否包含主观题
     questions = list(homework.questions.all())
+    submitted = [
+        (q, answer_map.get(str(idx)) or answer_map.get(str(q.id)) or '')
+        for idx, q in enumerate(questions)
+    ]
     has_subjective = any(q.question_type == 'subjective' for q in questions)
 
-    # 如果没有主观题，直接批改所有题目
-    if not has_subjective:
-        for idx, q in enumerate(questions):
-            ans = answer_map.get(str(idx)) or answer_map.get(str(q.id)) or ''
-            correct = False
-            if q.question_type == 'single':
-                correct = (str(ans).strip().upper() == str(q.answer).strip().upper())
-            elif q.question_type == 'multiple':
-                ans_set = set([x.strip().upper() for x in str(ans).split(',') if x.strip()])
-                std_set = set([x.strip().upper() for x in str(q.answer).split(',') if x.strip()])
-                correct = ans_set == std_set and len(ans_set) == len(std_set)
-            score = q.score if correct else 0
-            comment = "正确" if correct else "错误"
-            if not correct:
-                explanations.append(f"题目：{q.text}，你的答案：{ans}，正确答案：{q.answer}")
-            mb, created = MistakeBook.objects.get_or_create(student=user, question=q)
-            if correct:
-                mb.delete()
-            else:
-                mb.wrong_times = 0
-                mb.last_wrong_answer = str(ans)
-                mb.save()
-            StudentAnswer.objects.create(
-                question=q,
-                student=user,
-                answer=ans,
-                score=score,
-                comment=comment,
-                graded=True,
-            )
-            total_score += score
-        StudentHomeworkResult.objects.update_or_create(
-            homework=homework, student=user,
-            defaults={'total_score': total_score, 'explanations': explanations, 'status': 'graded'}
-        )
-        return Response({
-            "total_score": total_score,
-            "explanations": explanations
-        })
+    # 有主观题且不在优惠时段，保存为待批改
+    if has_subjective and not is_discount_time():
+        save_pending_submission(homework, user, submitted)
+        return Response({'msg': '已提交，成绩将在优惠时段批改后可查询', 'status': 'pending'})
 
-    # 有主观题，判断是否在优惠时段
-    if is_discount_time():
-        for idx, q in enumerate(questions):
-            ans = answer_map.get(str(idx)) or answer_map.get(str(q.id)) or ''
-            if q.question_type in ['single', 'multiple']:
-                correct = False
-                if q.question_type == 'single':
-                    correct = (str(ans).strip().upper() == str(q.answer).strip().upper())
-                else:
-                    ans_set = set([x.strip().upper() for x in str(ans).split(',') if x.strip()])
-                    std_set = set([x.strip().upper() for x in str(q.answer).split(',') if x.strip()])
-                    correct = ans_set == std_set and len(ans_set) == len(std_set)
-                score = q.score if correct else 0
-                comment = "正确" if correct else "错误"
-                if not correct:
-                    explanations.append(f"题目：{q.text}，你的答案：{ans}，正确答案：{q.answer}")
-                mb, created = MistakeBook.objects.get_or_create(student=user, question=q)
-                if correct:
-                    mb.delete()
-                else:
-                    mb.wrong_times = 0
-                    mb.last_wrong_answer = str(ans)
-                    mb.save()
-            else:
-                # 主观题，调用AI
-                ai_result = {}
-                try:
-                    ai_result = requests.post(
-                        "http://127.0.0.1:8001/api/grade/",
-                        json={
-                            "question": q.text,
-                            "answer": ans,
-                            "reference_answer": q.answer,
-                            "max_score": q.score  # 传递题目分数
-                        }
-                    ).json()
-                except Exception:
-                    ai_result = {"score": 0, "comment": "AI批改失败"}
-                score = ai_result.get("score", 0)
-                comment = ai_result.get("comment", "")
-                if score < q.score:
-                    explanations.append(f"题目：{q.text}，AI评语：{comment}")
-                mb, created = MistakeBook.objects.get_or_create(student=user, question=q)
-                if score == q.score:
-                    mb.delete()
-                else:
-                    mb.wrong_times = 0
-                    mb.last_wrong_answer = str(ans)
-                    mb.save()
-            StudentAnswer.objects.create(
-                question=q,
-                student=user,
-                answer=ans,
-                score=score,
-                comment=comment,
-                graded=True,
-            )
-            total_score += score
+    # 主观题并发交给 AI 批改，结果按题目顺序合并；AI 调用放在事务之外，避免长时间占用数据库事务
+    subjective = [(q, ans) for q, ans in submitted if q.question_type == 'subjective']
+    try:
+        ai_results = iter(ai_client.grade_many([
+            {"question": q.text, "answer": ans, "reference_answer": q.answer, "max_score": q.score}
+            for q, ans in subjective
+        ]))
+    except ai_client.AIServiceUnavailable:
+        # AI 服务不可用时不记 0 分，转为待批改，由夜间批改任务重新批改
+        save_pending_submission(homework, user, submitted)
+        return Response({'msg': '已提交，AI批改繁忙，成绩将稍后批改完成后可查询', 'status': 'pending'})
+
+    result = grade_submission([
+        (q, ans, next(ai_results) if q.question_type == 'subjective' else None) for q, ans in submitted
+    ])
+    total_score, explanations = result.total_score, result.explanations
+    graded = [(q, ans, item.score, item.comment, item.correct) for (q, ans), item in zip(submitted, result.items)]
+
+    with transaction.atomic():
+        save_graded_answers(user, graded)
         StudentHomeworkResult.objects.update_or_create(
             homework=homework, student=user,
             defaults={'total_score': total_score, 'explanations': explanations, 'status': 'graded'}
         )
-        return Response({
-            "total_score": total_score,
-            "explanations": explanations
-        })
-    else:
-        # 非优惠时段，保存为待批改
-        for idx, q in enumerate(questions):
-            ans = answer_map.get(str(idx)) or answer_map.get(str(q.id)) or ''
-            StudentAnswer.objects.create(
-                question=q,
-                student=user,
-                answer=ans,
-                score=None,
-                comment='',
-                graded=False,
-            )
-        StudentHomeworkResult.objects.update_or_create(
-            homework=homework, student=user,
-            defaults={'total_score': None, 'explanations': [], 'status': 'pending', 'submitted_at': timezone.now()}
-        )
-        return Response({'msg': '已提交，成绩将在优惠时段批改后可查询', 'status': 'pending'})
+    return Response({
+        "total_score": total_score,
+        "explanations": explanations
+    })
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -398,39 +464,36 @@ def update_score(request):
     answer_id = request.data.get('answer_id')
     new_score = request.data.get('new_score')
     comment = request.data.get('comment', '')
+    if not hasattr(user, 'is_verified_teacher') or not user.is_verified_teacher:
+        return Response({'error': '无权限'}, status=403)
     try:
-        ans = StudentAnswer.objects.get(id=answer_id)
-        if not hasattr(user, 'is_verified_teacher') or not user.is_verified_teacher:
-            return Response({'error': '无权限'}, status=403)
+        new_score = float(new_score)
+    except (TypeError, ValueError):
+        return Response({'error': '分数无效'}, status=400)
+    with transaction.atomic():
+        try:
+            # 锁住答案行，并发修正时分差按顺序累加
+            ans = StudentAnswer.objects.select_for_update().select_related('question').get(id=answer_id)
+        except StudentAnswer.DoesNotExist:
+            return Response({'error': '答题不存在'}, status=404)
         old_score = ans.score
         old_comment = ans.comment
-        ans.score = float(new_score)
+        ans.score = new_score
         ans.comment = comment
         ans.graded = True
-        ans.save()
+        ans.save(update_fields=['score', 'comment', 'graded'])
         # 记录修正日志
         ScoreCorrectionLog.objects.create(
             answer=ans,
             teacher=user,
-            old_score=old_score,
+            old_score=old_score or 0,
             new_score=ans.score,
             old_comment=old_comment,
             new_comment=comment,
         )
-        # 自动更新总分
-        try:
-            result = StudentHomeworkResult.objects.get(homework=ans.question.homework, student=ans.student)
-            total = StudentAnswer.objects.filter(
-                question__homework=ans.question.homework,
-                student=ans.student
-            ).aggregate(s=models.Sum('score'))['s'] or 0
-            result.total_score = total
-            result.save()
-        except StudentHomeworkResult.DoesNotExist:
-            pass
-        return Response({'msg': 'ok'})
-    except StudentAnswer.DoesNotExist:
-        return Response({'error': '答题不存在'}, status=404)
+        # 分差直接加到总分上，不重新汇总
+        totals.apply_score_change(ans, old_score)
+    return Response({'msg': 'ok'})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -454,6 +517,7 @@ def add_question(request, homework_id):
         answer=data.get('answer'),
         score=data.get('score', 5),
     )
+    transaction.on_commit(lambda: delay_best_effort(precompute_question_hints, homework.id))
     return Response({'msg': '题目添加成功', 'question_id': q.id})
 
 @api_view(['POST'])
@@ -472,26 +536,29 @@ def correct_subjective_answer(request):
     ai_comment = data.get('ai_comment')
     teacher_score = data.get('teacher_score')
     teacher_comment = data.get('teacher_comment')
-    if not answer_id:
+    if not answer_id or teacher_score is None:
         return Response({'error': '缺少参数'}, status=400)
     try:
-        answer = StudentAnswer.objects.get(id=answer_id)
-        # 记录修正日志
-        SubjectiveCorrectionLog.objects.create(
-            answer=answer,
-            question=answer.question,
-            ai_score=ai_score,
-            teacher_score=teacher_score,
-            ai_comment=ai_comment,
-            teacher_comment=teacher_comment,
-            teacher=user,
-            corrected_at=timezone.now()
-        )
-        # 更新当前作业题目的得分和评语
-        answer.score = teacher_score
-        answer.comment = teacher_comment
-        answer.graded = True
-        answer.save()
+        with transaction.atomic():
+            answer = StudentAnswer.objects.select_for_update().select_related('question').get(id=answer_id)
+            # 记录修正日志
+            SubjectiveCorrectionLog.objects.create(
+                answer=answer,
+                question=answer.question,
+                ai_score=ai_score,
+                teacher_score=teacher_score,
+                ai_comment=ai_comment,
+                teacher_comment=teacher_comment,
+                teacher=user,
+                corrected_at=timezone.now()
+            )
+            # 更新当前作业题目的得分和评语，分差同步到作业总分
+            old_score = answer.score
+            answer.score = float(teacher_score)
+            answer.comment = teacher_comment
+            answer.graded = True
+            answer.save(update_fields=['score', 'comment', 'graded'])
+            totals.apply_score_change(answer, old_score)
         return Response({'message': '修正成功'})
     except Exception as e:
         return Response({'error': str(e)}, status=500)
@@ -514,3 +581,41 @@ def my_scores(request):
             'explanations': r.explanations if hasattr(r, 'explanations') else [],
         })
     return Response(data)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def grading_cache_stats(request):
+    """
+    主观题批改缓存统计：条目数、命中次数、命中率、累计节省的 AI 耗时
+    """
+    return Response(grading_cache.stats())
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def grading_schedule_status(request):
+    """
+    夜间批改调度状态：当前积压、最近一次批改的并发与预计完成时间
+    """
+    now = timezone.now()
+    run = GradingRun.objects.order_by('-id').first()
+    data = {
+        'in_window': is_discount_time(now),
+        'window_end': window_bounds(now)[1],
+        'backlog': StudentHomeworkResult.objects.filter(status__in=['pending', 'grading']).count(),
+        'run': None,
+    }
+    if run:
+        data['run'] = {
+            'status': run.status,
+            'started_at': run.started_at,
+            'window_end': run.window_end,
+            'concurrency': run.concurrency,
+            'dispatched_chunks': run.dispatched_chunks,
+            'completed_chunks': run.completed_chunks,
+            'graded_results': run.graded_results,
+            'failed_items': run.failed_items,
+            'backlog': run.backlog,
+            'projected_finish_at': run.projected_finish_at,
+            'finishes_in_window': run.projected_finish_at is not None and run.projected_finish_at <= run.window_end,
+        }
+    return Response(data)
@@ -0,0 +1,25 @@
+import logging
+import os
+
+from celery import Celery
+from kombu.exceptions import OperationalError as BrokerError
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'snaplearn_backend.settings')
+
+app = Celery('snaplearn_backend')
+# 从 Django settings 中读取以 CELERY_ 开头的配置
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+def delay_best_effort(task, *args):
+    """
+    投递只起优化作用的后台任务（预生成解题思路、补生成封面等）：消息队列不可用时记录日志后跳过，
+    不影响已经写入的数据和请求结果。返回是否投递成功
+    """
+    try:
+        task.delay(*args)
+    except BrokerError as e:
+        logging.warning(f"后台任务 {getattr(task, 'name', task)} 投递失败，已跳过: {e}")
+        return False
+    return True
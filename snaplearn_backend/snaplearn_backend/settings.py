@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -129,6 +131,10 @@ STATIC_URL = 'static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# 媒体文件浏览器缓存时间（秒），过期后通过 ETag/Last-Modified 协商
+MEDIA_CACHE_MAX_AGE = 3600
+# 设置为 nginx 中 internal location 的前缀（如 '/protected-media/'）后，媒体文件由 nginx 通过 X-Accel-Redirect 直接发送
+MEDIA_ACCEL_REDIRECT_PREFIX = None
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -157,3 +163,61 @@ REST_FRAMEWORK = {
         'users.authentication.BearerTokenAuthentication',
     ],
 }
+
+# Celery：视频转码等耗时任务交给 worker 异步执行
+CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# AI 批改/答疑服务（ai_backend）
+AI_BACKEND_URL = 'http://127.0.0.1:8001'
+# (连接超时, 读取超时)，单位秒
+AI_REQUEST_TIMEOUT = (3, 60)
+# 单个进程同时发往 AI 服务的最大请求数
+AI_GRADING_MAX_WORKERS = 8
+# 夜间批量批改：每个请求包含的题数及其超时
+AI_GRADE_BATCH_SIZE = 50
+AI_BATCH_REQUEST_TIMEOUT = (3, 300)
+# 主观题批改缓存：模型名参与缓存 key，更换模型后旧结果自动失效
+AI_GRADING_MODEL = 'gpt-3.5-turbo'
+AI_GRADING_CACHE_TTL = 30 * 24 * 3600
+AI_GRADING_CACHE_MAX_ENTRIES = 100000
+# 夜间批改：每个批改任务领取的作业数，领取超过该秒数未提交视为失败并重新放回待批改
+GRADING_CHUNK_SIZE = 20
+GRADING_CLAIM_TIMEOUT = 30 * 60
+# 夜间批改调度：并发批次数上下限，以及单个批次的目标耗时（秒），超过则不再增加并发
+GRADING_MIN_CONCURRENCY = 1
+GRADING_MAX_CONCURRENCY = 16
+GRADING_TARGET_CHUNK_SECONDS = 120
+# 为真时不受优惠时段限制，主观题随时即时批改（压测、开发环境）
+GRADING_IGNORE_DISCOUNT_WINDOW = False
+# 修改标准答案后重新判分：每次读取的答案数
+REGRADE_CHUNK_SIZE = 5000
+# 重新判分请求超过该秒数仍未完成时由定时任务重新投递
+REGRADE_RETRY_AFTER = 300
+# 作业总分对账：每次核对的成绩数
+TOTALS_RECONCILE_BATCH_SIZE = 2000
+# 每分钟触发一次调度，优惠时段外直接返回
+CELERY_BEAT_SCHEDULE = {
+    'drain-grading-backlog': {
+        'task': 'homework.tasks.drain_grading_backlog',
+        'schedule': crontab(minute='*', hour='0-8'),
+    },
+    'retry-pending-regrades': {
+        'task': 'homework.tasks.retry_pending_regrades',
+        'schedule': crontab(minute='*/5'),
+    },
+    # 批改缓存的淘汰不放在写入路径上，定时执行
+    'evict-grading-cache': {
+        'task': 'homework.tasks.evict_grading_cache',
+        'schedule': crontab(minute=15),
+    },
+    # 夜间批改结束后核对并修复作业总分
+    'reconcile-homework-totals': {
+        'task': 'homework.tasks.reconcile_homework_totals',
+        'schedule': crontab(minute=30, hour=9),
+    },
+}
+# 新建/更新作业后在后台预先生成各题的 AI 解题思路
+AI_HINT_PRECOMPUTE = True
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from .views import parse_range_header
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CONTENT = bytes(range(256)) * 400  # 100 KB
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ServeMediaTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(MEDIA_ROOT, 'videos'), exist_ok=True)
+        cls.path = os.path.join(MEDIA_ROOT, 'videos', 'lesson.mp4')
+        with open(cls.path, 'wb') as f:
+            f.write(CONTENT)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_response_has_validators(self):
+        response = self.client.get('/media/videos/lesson.mp4')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.body(response), CONTENT)
+
+    def test_range_returns_partial_content(self):
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(CONTENT)}')
+        self.assertEqual(response['Content-Length'], '1000')
+        self.assertEqual(self.body(response), CONTENT[1000:2000])
+
+    def test_suffix_and_open_ended_ranges(self):
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_RANGE='bytes=-100')
+        self.assertEqual(self.body(response), CONTENT[-100:])
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_RANGE='bytes=102000-')
+        self.assertEqual(self.body(response), CONTENT[102000:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_RANGE=f'bytes={len(CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_conditional_requests(self):
+        first = self.client.get('/media/videos/lesson.mp4')
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_stale_if_range_ignores_range(self):
+        response = self.client.get('/media/videos/lesson.mp4', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_and_traversal_paths_404(self):
+        self.assertEqual(self.client.get('/media/videos/missing.mp4').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/videos/').status_code, 404)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_accel_redirect_hands_off_to_nginx(self):
+        response = self.client.get('/media/videos/lesson.mp4')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/videos/lesson.mp4')
+        self.assertEqual(response.content, b'')
+
+
+class ParseRangeHeaderTest(SimpleTestCase):
+    def test_parse(self):
+        self.assertEqual(parse_range_header('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range_header('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(parse_range_header('bytes=-2000', 1000), (0, 999))
+        self.assertIsNone(parse_range_header('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range_header('items=0-1', 1000))
+        with self.assertRaises(ValueError):
+            parse_range_header('bytes=10-5', 1000)
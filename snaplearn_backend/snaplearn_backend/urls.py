@@ -15,9 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from . import views
 
 urlpatterns = [
@@ -28,7 +27,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),  # 只注册一次Django后台
     path('adminapi/', include('admin.urls')),  # 如果有自定义admin接口，建议用adminapi或其它避免冲突
     path('homework/', include('homework.urls')),
+    # 媒体文件（视频、HLS 切片、封面、头像），支持 Range 与条件请求
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), views.serve_media, name='serve_media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
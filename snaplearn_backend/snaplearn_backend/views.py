@@ -1,4 +1,22 @@
-from django.http import JsonResponse
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# HLS 播放列表和切片的 MIME 类型，部分系统的 mimetypes 库未登记
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
 
 def default_view(request):
     """
@@ -9,4 +27,113 @@ def default_view(request):
     response["Access-Control-Allow-Origin"] = "*"
     response["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
     response["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-    return response
\ No newline at end of file
+    return response
+
+
+class FileRange:
+    """
+    只读取文件中 [start, start + length) 区间的文件对象包装。
+    保留 fileno()，gunicorn 等服务器可据此配合 Content-Length 用 os.sendfile 零拷贝发送。
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+        file.seek(start)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range_header(header, size):
+    """
+    解析单段 Range 头，返回 (start, end)（闭区间）。
+    无法解析或多段请求返回 None（按完整文件响应），区间无法满足时抛出 ValueError
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 表示最后 500 字节
+        length = int(last)
+        if length == 0:
+            raise ValueError('unsatisfiable range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('unsatisfiable range')
+    return start, min(end, size - 1)
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    生产环境的媒体文件服务：支持 Range 断点/拖动、ETag 与 If-Modified-Since 条件请求。
+    配置 MEDIA_ACCEL_REDIRECT_PREFIX 后直接交给 nginx 的 internal location 发送。
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('文件不存在')
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('文件不存在')
+    if not os.path.isfile(full_path):
+        raise Http404('文件不存在')
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', None)
+    if accel_prefix:
+        response = HttpResponse()
+        response['Content-Type'] = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path)
+        return response
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and size and (not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified):
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    f = open(full_path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(FileRange(f, start, end - start + 1), status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(f)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 0)}"
+    return response
@@ -0,0 +1,123 @@
+"""
+视频信息流查询层
+
+列表接口只需要少量字段：用一次联表的 .values() 投影取出视频和教师信息，
+文件类字段直接由存储层拼接 URL，不逐行访问 teacher 外键，也不访问文件系统。
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from .models import Video
+from .search import search_videos
+
+FEED_FIELDS = (
+    'id', 'title', 'description', 'video_file', 'hls_manifest', 'thumbnail',
+    'created_at', 'subject', 'education_level',
+    'teacher_id', 'teacher__username', 'teacher__avatar',
+)
+
+# 允许客户端使用的排序字段
+FEED_ORDERINGS = ('-created_at', 'created_at', '-id', 'id', 'title', '-title')
+# 游标分页只支持默认排序，按 (created_at, id) 作为键
+CURSOR_ORDERING = '-created_at'
+# 每页条数默认值和上限
+FEED_PAGE_SIZE = 10
+FEED_MAX_PAGE_SIZE = 50
+
+
+def filter_feed(params, queryset=None):
+    """
+    按请求参数（education_level/subject/teacher_id/search）过滤视频；带 search 时按相关度排序
+    """
+    qs = Video.objects.all() if queryset is None else queryset
+    education_level = params.get('education_level')
+    subject = params.get('subject')
+    teacher_id = params.get('teacher_id')
+    search = params.get('search', '').strip()
+    # 支持学历等级多选
+    if education_level:
+        levels = [x.strip() for x in education_level.split(',') if x.strip()]
+        if levels:
+            qs = qs.filter(education_level__in=levels)
+    # 学科筛选为 subject 字段精确匹配
+    if subject:
+        qs = qs.filter(subject=subject)
+    if teacher_id and str(teacher_id).isdigit():
+        qs = qs.filter(teacher_id=int(teacher_id))
+    # 全文检索，结果按相关度排序
+    if search:
+        qs = search_videos(qs, search)
+    return qs
+
+
+def feed_rows(queryset):
+    """
+    联表投影：返回只含列表所需字段的字典行
+    """
+    return queryset.values(*FEED_FIELDS)
+
+
+def media_url(name):
+    return default_storage.url(name) if name else ''
+
+
+def serialize_feed_row(row, request=None):
+    """
+    把投影行转换为接口返回的字典；缩略图转为绝对 URL
+    """
+    thumb_url = media_url(row['thumbnail'])
+    if thumb_url and request is not None and not thumb_url.startswith('http'):
+        thumb_url = request.build_absolute_uri(thumb_url)
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'video_url': media_url(row['video_file']),
+        'manifest_url': media_url(row['hls_manifest']),
+        'teacher_id': row['teacher_id'],
+        'teacher_name': row['teacher__username'],
+        'teacher_avatar': media_url(row['teacher__avatar']),
+        'created_at': row['created_at'],
+        'thumbnail_url': thumb_url,
+        'subject': row['subject'],
+        'education_level': row['education_level'],
+    }
+
+
+def encode_cursor(row):
+    """
+    把一行的 (created_at, id) 编码为不透明的游标字符串
+    """
+    raw = json.dumps([row['created_at'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标，格式不合法时抛出 ValueError
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(pk)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def keyset_page(queryset, cursor, page_size):
+    """
+    游标（keyset）分页：按 (created_at, id) 倒序，用 WHERE 条件代替 OFFSET，且不执行 COUNT(*)。
+    返回 (当前页的投影行, 下一页游标或 None)
+    """
+    qs = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    # 多取一行用来判断是否还有下一页
+    rows = list(feed_rows(qs)[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
@@ -0,0 +1,129 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from homework.models import Homework, Question, StudentAnswer
+from users.models import CustomUser, EducationChoices
+from videos.models import Video
+
+SUBJECTS = ['math', 'physics', 'chemistry', 'english', 'history', 'biology']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = '灌入测试数据，对比信息流和答题查询在复合索引建立前后的执行计划与耗时（结束后回滚全部数据）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--videos', type=int, default=20000)
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=20, help='每条查询重复执行次数')
+
+    def handle(self, *args, **options):
+        # SQLite 不允许在事务中途关闭外键检查，而事务内的 schema 变更需要先关闭
+        connection.disable_constraint_checking()
+        try:
+            with transaction.atomic():
+                self.seed(options['videos'], options['students'])
+                self.analyze()
+                queries = self.queries()
+                indexed = [(Video, idx) for idx in Video._meta.indexes] + \
+                          [(StudentAnswer, idx) for idx in StudentAnswer._meta.indexes]
+
+                self.drop_indexes(indexed)
+                self.analyze()
+                self.stdout.write(self.style.MIGRATE_HEADING('=== 建立复合索引之前 ==='))
+                self.report(queries, options['repeat'])
+
+                self.create_indexes(indexed)
+                self.analyze()
+                self.stdout.write(self.style.MIGRATE_HEADING('=== 建立复合索引之后 ==='))
+                self.report(queries, options['repeat'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write(self.style.SUCCESS('基准测试完成，测试数据已回滚'))
+        finally:
+            connection.enable_constraint_checking()
+
+    def seed(self, n_videos, n_students):
+        self.stdout.write(f'灌入 {n_videos} 个视频、{n_students} 名学生的答题数据...')
+        suffix = random.randint(0, 10 ** 9)
+        teachers = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench_t{suffix}_{i}', email=f'bench_t{i}@example.com', is_verified_teacher=True)
+            for i in range(50)
+        ])
+        students = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench_s{suffix}_{i}', email=f'bench_s{i}@example.com')
+            for i in range(n_students)
+        ])
+        levels = [choice.value for choice in EducationChoices]
+        now = timezone.now()
+        videos = Video.objects.bulk_create([
+            Video(
+                title=f'bench video {i}',
+                teacher=random.choice(teachers),
+                video_file=f'videos/bench_{i}.mp4',
+                subject=random.choice(SUBJECTS),
+                education_level=random.choice(levels),
+            )
+            for i in range(n_videos)
+        ], batch_size=1000)
+        # created_at 为 auto_now_add，创建时传入的值会被覆盖，插入后再按分钟错开
+        for i, video in enumerate(videos):
+            video.created_at = now - timedelta(minutes=i)
+        Video.objects.bulk_update(videos, ['created_at'], batch_size=1000)
+        homeworks = Homework.objects.bulk_create([
+            Homework(title=f'bench homework {v.id}', teacher=v.teacher, video=v) for v in videos[:200]
+        ])
+        questions = Question.objects.bulk_create([
+            Question(homework=hw, question_type='single', text='q', options=['A', 'B'], answer='A')
+            for hw in homeworks for _ in range(10)
+        ], batch_size=1000)
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(question=q, student=s, answer='A', score=5, graded=True)
+            for s in students for q in random.sample(questions, min(len(questions), 50))
+        ], batch_size=1000)
+        self.sample_teacher = teachers[0]
+        self.sample_student = students[0]
+        self.sample_homework = homeworks[0]
+
+    def queries(self):
+        return [
+            ('默认信息流 -created_at', Video.objects.order_by('-created_at', '-id')[:10]),
+            ('学历多选 + 学科', Video.objects.filter(
+                education_level__in=['high', 'middle'], subject='math').order_by('-created_at')[:10]),
+            ('学科', Video.objects.filter(subject='physics').order_by('-created_at')[:10]),
+            ('教师主页', Video.objects.filter(teacher_id=self.sample_teacher.id).order_by('-created_at')[:10]),
+            ('学生作业答题详情', StudentAnswer.objects.filter(
+                student_id=self.sample_student.id, question__homework_id=self.sample_homework.id)),
+        ]
+
+    def report(self, queries, repeat):
+        for label, qs in queries:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                list(qs.all())
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            self.stdout.write(self.style.HTTP_INFO(f'-- {label}（平均 {elapsed:.2f} ms）'))
+            self.stdout.write(qs.explain())
+
+    def drop_indexes(self, indexed):
+        with connection.schema_editor(atomic=False) as editor:
+            for model, index in indexed:
+                editor.remove_index(model, index)
+
+    def create_indexes(self, indexed):
+        with connection.schema_editor(atomic=False) as editor:
+            for model, index in indexed:
+                editor.add_index(model, index)
+
+    def analyze(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
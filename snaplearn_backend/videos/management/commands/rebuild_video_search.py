@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from videos.models import Video
+from videos.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = '重建视频全文检索索引'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.uninstall()
+        backend.install()
+        count = 0
+        for video_id, title, description in Video.objects.values_list('id', 'title', 'description').iterator():
+            backend.index(video_id, title, description)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'已重建 {count} 个视频的检索索引'))
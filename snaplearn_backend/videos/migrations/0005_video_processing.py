@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 20:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0004_delete_discountcode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='duration',
+            field=models.FloatField(blank=True, help_text='视频时长（秒）', null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='processing_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='status',
+            field=models.CharField(choices=[('processing', '处理中'), ('ready', '已就绪'), ('failed', '处理失败')], default='ready', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='VideoRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(max_length=10)),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '转码中'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=16)),
+                ('progress', models.FloatField(default=0, help_text='转码进度 0~1')),
+                ('file_path', models.CharField(blank=True, default='', help_text='相对 MEDIA_ROOT 的路径', max_length=255)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='videos.video')),
+            ],
+            options={
+                'unique_together': {('video', 'resolution')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0005_video_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='hls_manifest',
+            field=models.FileField(blank=True, default='', help_text='HLS 主播放列表', max_length=255, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='videorendition',
+            name='file_path',
+            field=models.CharField(blank=True, default='', help_text='子播放列表相对 MEDIA_ROOT 的路径', max_length=255),
+        ),
+    ]
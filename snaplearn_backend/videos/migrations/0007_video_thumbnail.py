@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0006_video_hls_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='thumbnail',
+            field=models.FileField(blank=True, default='', help_text='视频封面', max_length=255, upload_to=''),
+        ),
+    ]
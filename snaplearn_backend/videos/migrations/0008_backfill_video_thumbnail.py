@@ -0,0 +1,34 @@
+import os
+
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_thumbnails(apps, schema_editor):
+    """
+    为已有视频回填 thumbnail 字段：沿用旧约定 thumbnails/<视频文件名>.jpg，文件存在才写入
+    """
+    Video = apps.get_model('videos', 'Video')
+    batch = []
+    for video in Video.objects.filter(thumbnail='').exclude(video_file='').only('id', 'video_file').iterator():
+        base, ext = os.path.splitext(os.path.basename(video.video_file.name))
+        name = f"thumbnails/{base}.jpg"
+        if os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+            video.thumbnail = name
+            batch.append(video)
+        if len(batch) >= 500:
+            Video.objects.bulk_update(batch, ['thumbnail'])
+            batch = []
+    if batch:
+        Video.objects.bulk_update(batch, ['thumbnail'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0007_video_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_thumbnails, migrations.RunPython.noop),
+    ]
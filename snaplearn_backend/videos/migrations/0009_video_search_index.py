@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    按数据库类型创建全文检索表，并为已有视频建立检索文档
+    """
+    from videos.search import get_search_backend
+    backend = get_search_backend(schema_editor.connection)
+    backend.install()
+    Video = apps.get_model('videos', 'Video')
+    for video_id, title, description in Video.objects.values_list('id', 'title', 'description').iterator():
+        backend.index(video_id, title, description)
+
+
+def drop_search_index(apps, schema_editor):
+    from videos.search import get_search_backend
+    get_search_backend(schema_editor.connection).uninstall()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0008_backfill_video_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
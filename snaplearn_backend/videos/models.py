@@ -1,10 +1,13 @@
 import os
 import subprocess
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.text import get_valid_filename
 from users.models import CustomUser, EducationChoices
+from .search import get_search_backend
 
 
 def validate_video_file(value):
@@ -37,12 +40,7 @@ def validate_video_duration(value):
             raise ValidationError("文件路径不安全，拒绝访问")
 
         # 使用 FFmpeg 获取视频时长
-        result = subprocess.run(
-            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT
-        )
-        duration = float(result.stdout)
+        duration = probe_video_duration(file_path)
 
         if duration > 600:  # 10 分钟 = 600 秒
             raise ValidationError("视频时长不能超过 10 分钟")
@@ -58,45 +56,134 @@ def calculate_target_size(duration, base_size_mb=5, size_per_second_mb=0.075, ma
     return min(target_size, max_size_mb)
 
 
-def generate_multi_bitrate_versions(input_file_path, output_dir, duration):
+# 多码率转码规格
+RESOLUTIONS = {
+    "1080p": {"width": 1920, "height": 1080, "base_size_mb": 20},
+    "720p": {"width": 1280, "height": 720, "base_size_mb": 10},
+    "480p": {"width": 854, "height": 480, "base_size_mb": 5},
+}
+
+
+def probe_video_duration(file_path):
     """
-    使用 FFmpeg 为视频生成多码率版本，并动态调整目标大小
+    使用 ffprobe 获取视频时长（秒）
     """
-    resolutions = {
-        "1080p": {"width": 1920, "height": 1080, "base_size_mb": 20},
-        "720p": {"width": 1280, "height": 720, "base_size_mb": 10},
-        "480p": {"width": 854, "height": 480, "base_size_mb": 5},
-    }
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', file_path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True
+    )
+    return float(result.stdout)
 
-    output_files = {}
 
-    for resolution, settings in resolutions.items():
-        # 动态计算目标大小
-        target_size_mb = calculate_target_size(duration, base_size_mb=settings["base_size_mb"])
-        target_size = target_size_mb * 1024 * 1024  # 转换为字节
-        target_bitrate = (target_size * 8) / duration  # 比特率 = 文件大小（字节） * 8 / 时长（秒）
-
-        output_file_path = os.path.join(output_dir, f"{resolution}.mp4")
-        try:
-            subprocess.run([
-                "ffmpeg", "-i", input_file_path,
-                "-vf", f"scale={settings['width']}:{settings['height']}",
-                "-b:v", f"{int(target_bitrate)}k",
-                "-bufsize", f"{int(target_bitrate)}k",
-                "-maxrate", f"{int(target_bitrate)}k",
-                "-c:v", "libx264",
-                "-c:a", "aac",
-                "-preset", "medium",
-                output_file_path
-            ], check=True)
-            output_files[resolution] = output_file_path
-        except subprocess.CalledProcessError as e:
-            raise Exception(f"生成 {resolution} 版本失败: {str(e)}")
+def generate_thumbnail(video_path, thumb_path):
+    """
+    截取视频第 1 秒的画面作为封面
+    """
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    subprocess.run([
+        "ffmpeg", "-y", "-i", video_path, "-ss", "00:00:01", "-vframes", "1", "-f", "image2", thumb_path
+    ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return thumb_path
+
+
+# HLS 切片时长（秒），每个切片都以关键帧开头，便于播放器在码率间切换
+HLS_SEGMENT_SECONDS = 4
+HLS_AUDIO_KBPS = 128
+
+
+def rendition_video_kbps(resolution, duration):
+    """
+    根据视频时长计算某个码率版本的目标视频码率（kbps）
+    """
+    duration = max(duration or 0, 1)
+    # 动态计算目标大小
+    target_size_mb = calculate_target_size(duration, base_size_mb=RESOLUTIONS[resolution]["base_size_mb"])
+    target_size = target_size_mb * 1024 * 1024  # 转换为字节
+    return int((target_size * 8) / duration / 1000)  # 比特率 = 文件大小（字节） * 8 / 时长（秒）
+
+
+def transcode_rendition(input_file_path, output_dir, resolution, duration, progress_callback=None):
+    """
+    使用 FFmpeg 生成单个码率版本的 HLS 切片和子播放列表，progress_callback 接收 0~1 的进度
+    返回子播放列表路径：<output_dir>/<resolution>/index.m3u8
+    """
+    spec = RESOLUTIONS[resolution]
+    duration = max(duration or 0, 1)
+    target_kbps = rendition_video_kbps(resolution, duration)
+
+    rendition_dir = os.path.join(output_dir, resolution)
+    os.makedirs(rendition_dir, exist_ok=True)
+    playlist_path = os.path.join(rendition_dir, "index.m3u8")
+    cmd = [
+        "ffmpeg", "-y", "-i", input_file_path,
+        "-vf", f"scale={spec['width']}:{spec['height']}",
+        "-b:v", f"{target_kbps}k",
+        "-bufsize", f"{target_kbps}k",
+        "-maxrate", f"{target_kbps}k",
+        "-c:v", "libx264",
+        "-c:a", "aac",
+        "-b:a", f"{HLS_AUDIO_KBPS}k",
+        "-preset", "medium",
+        # 在每个切片边界强制关键帧，保证各码率切片对齐
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(rendition_dir, "seg_%05d.ts"),
+        "-progress", "pipe:1", "-nostats",
+        playlist_path
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in process.stdout:
+        # -progress 输出形如 out_time_us=1234567 的键值对
+        key, _, value = line.strip().partition('=')
+        if progress_callback and key in ('out_time_us', 'out_time_ms') and value.isdigit():
+            progress_callback(min(int(value) / 1000000 / duration, 1.0))
+    if process.wait() != 0:
+        raise Exception(f"生成 {resolution} 版本失败: ffmpeg 退出码 {process.returncode}")
+    return playlist_path
+
+
+def write_master_playlist(output_dir, resolutions, duration):
+    """
+    为已完成的码率版本生成 HLS 主播放列表（自适应码率清单），低码率在前以便弱网快速起播
+    """
+    entries = sorted(
+        ((rendition_video_kbps(r, duration) + HLS_AUDIO_KBPS, r) for r in resolutions if r in RESOLUTIONS)
+    )
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for kbps, resolution in entries:
+        spec = RESOLUTIONS[resolution]
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={kbps * 1000},RESOLUTION={spec['width']}x{spec['height']}")
+        lines.append(f"{resolution}/index.m3u8")
+    os.makedirs(output_dir, exist_ok=True)
+    master_path = os.path.join(output_dir, "master.m3u8")
+    with open(master_path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return master_path
+
 
+def generate_multi_bitrate_versions(input_file_path, output_dir, duration):
+    """
+    使用 FFmpeg 为视频生成多码率 HLS 版本和主播放列表，并动态调整目标大小
+    """
+    output_files = {}
+    for resolution in RESOLUTIONS:
+        output_files[resolution] = transcode_rendition(input_file_path, output_dir, resolution, duration)
+    output_files["master"] = write_master_playlist(output_dir, output_files.keys(), duration)
     return output_files
 
 
 class Video(models.Model):
+    STATUS_CHOICES = (
+        ('processing', '处理中'),
+        ('ready', '已就绪'),
+        ('failed', '处理失败'),
+    )
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     teacher = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE)
@@ -119,45 +206,66 @@ class Video(models.Model):
         blank=True, null=True,  # 允许为空，便于迁移
         default=''
     )
+    # 转码流水线状态
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='ready')
+    duration = models.FloatField(blank=True, null=True, help_text="视频时长（秒）")
+    hls_manifest = models.FileField(max_length=255, blank=True, default='', help_text="HLS 主播放列表")
+    thumbnail = models.FileField(max_length=255, blank=True, default='', help_text="视频封面")
+    processing_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        # 与信息流的筛选/排序组合匹配：默认按时间倒序（含游标分页的 id 次序键）、按学科、学历+学科、教师筛选
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='video_created_idx'),
+            models.Index(fields=['subject', '-created_at'], name='video_subject_created_idx'),
+            models.Index(fields=['education_level', 'subject', '-created_at'], name='video_level_subject_idx'),
+            models.Index(fields=['teacher', '-created_at'], name='video_teacher_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def hls_dir(self):
+        # HLS 切片与播放列表存放目录
+        return os.path.join(settings.MEDIA_ROOT, "hls", str(self.id))
+
+    @property
+    def default_thumbnail_name(self):
+        # 缩略图与视频同名，放在 thumbnails/ 目录下
+        base, ext = os.path.splitext(os.path.basename(self.video_file.name))
+        return f"thumbnails/{base}.jpg"
+
+    @property
+    def thumbnail_path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.default_thumbnail_name)
+
     @property
     def thumbnail_url(self):
-        # 假设缩略图与视频同名，放在thumbnails/目录下
-        if self.video_file:
-            import os
-            from django.conf import settings
-            base, ext = os.path.splitext(os.path.basename(self.video_file.name))
-            thumb_path = f"thumbnails/{base}.jpg"
-            full_thumb_path = os.path.join(settings.MEDIA_ROOT, thumb_path)
-            if os.path.exists(full_thumb_path):
-                # 确保返回以 /media/ 开头的相对路径
-                return (settings.MEDIA_URL or '/media/') + thumb_path
-            # 调试用：输出缩略图不存在的路径
-            # print(f"缩略图不存在: {full_thumb_path}")
-        return ''
-
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # 自动生成缩略图
-        if self.video_file:
-            import os
-            from django.conf import settings
-            base, ext = os.path.splitext(os.path.basename(self.video_file.name))
-            thumb_path = os.path.join(settings.MEDIA_ROOT, "thumbnails", f"{base}.jpg")
-            video_path = self.video_file.path
-            if not os.path.exists(thumb_path):
-                os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
-                try:
-                    subprocess.run([
-                        "ffmpeg", "-i", video_path, "-ss", "00:00:01", "-vframes", "1", thumb_path
-                    ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                except subprocess.CalledProcessError as e:
-                    print(f"生成缩略图失败: {e.stderr.decode('utf-8')}")
-                except Exception as e:
-                    print(f"生成缩略图失败: {e}")
+        # 缩略图路径由转码流水线写入 thumbnail 字段，读取时不访问文件系统
+        return self.thumbnail.url if self.thumbnail else ''
+
+
+class VideoRendition(models.Model):
+    STATUS_CHOICES = (
+        ('pending', '排队中'),
+        ('running', '转码中'),
+        ('done', '已完成'),
+        ('failed', '失败'),
+    )
+    video = models.ForeignKey('videos.Video', on_delete=models.CASCADE, related_name='renditions')
+    resolution = models.CharField(max_length=10)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='pending')
+    progress = models.FloatField(default=0, help_text="转码进度 0~1")
+    file_path = models.CharField(max_length=255, blank=True, default='', help_text="子播放列表相对 MEDIA_ROOT 的路径")
+    error = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('video', 'resolution')
+
+    def __str__(self):
+        return f"{self.video_id} - {self.resolution} ({self.status})"
 
 
 class VideoAccess(models.Model):
@@ -166,4 +274,17 @@ class VideoAccess(models.Model):
     purchased_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user.username} - {self.video.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.video.title}"
+
+
+@receiver(post_save, sender=Video)
+def update_video_search_index(sender, instance, update_fields=None, **kwargs):
+    # 只在标题/简介可能变化时重建该视频的检索文档
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    get_search_backend().index(instance.id, instance.title, instance.description)
+
+
+@receiver(post_delete, sender=Video)
+def remove_video_search_index(sender, instance, **kwargs):
+    get_search_backend().remove(instance.id)
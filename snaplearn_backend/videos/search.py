@@ -0,0 +1,199 @@
+"""
+视频标题/简介全文检索
+
+按数据库类型选择实现：
+- SQLite：FTS5 虚拟表，bm25 排序
+- PostgreSQL：tsvector + GIN 索引排序，pg_trgm 三元组索引加速子串匹配
+- 其它数据库：退回 icontains
+
+中文等 CJK 文本没有空格分词，入库前统一切成单字 + 二元组（n-gram），
+查询时切成二元组做 AND 匹配，不依赖数据库自带的中文分词。
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+CJK_RANGES = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+TOKEN_RE = re.compile(rf'[{CJK_RANGES}]+|[^\W_{CJK_RANGES}]+')
+CJK_RE = re.compile(rf'[{CJK_RANGES}]+')
+
+SEARCH_TABLE = 'videos_video_search'
+
+
+def tokenize(text, for_query=False):
+    """
+    把文本切成检索词：拉丁文按单词，CJK 连续片段按单字 + 二元组。
+    查询时 CJK 只取二元组（单字查询取单字），减少候选集
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer((text or '').lower()):
+        run = match.group()
+        if not CJK_RE.fullmatch(run):
+            tokens.append(run)
+            continue
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if for_query:
+            tokens.extend(bigrams or [run])
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    return tokens
+
+
+def index_text(text):
+    return ' '.join(tokenize(text))
+
+
+class SearchBackend:
+    """
+    默认实现：不建索引，退回 icontains 子串匹配
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def index(self, video_id, title, description):
+        pass
+
+    def remove(self, video_id):
+        pass
+
+    def search(self, queryset, query):
+        return queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    SQLite FTS5 实现：rowid 即视频 id，按 bm25 排序（标题权重更高）
+    """
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                f"USING fts5(title, description, tokenize='unicode61')"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index(self, video_id, title, description):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [video_id])
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, description) VALUES (%s, %s, %s)",
+                [video_id, index_text(title), index_text(description)]
+            )
+
+    def remove(self, video_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [video_id])
+
+    def match_expression(self, query):
+        terms = []
+        for token in tokenize(query, for_query=True):
+            # 拉丁单词做前缀匹配，便于边输入边搜索
+            terms.append(f'"{token}"' if CJK_RE.fullmatch(token) else f'"{token}"*')
+        return ' '.join(terms)
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match])
+        ).annotate(search_rank=RawSQL(
+            f"SELECT -bm25({SEARCH_TABLE}, 10.0, 1.0) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id",
+            [match]
+        )).order_by('-search_rank', '-id')
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    PostgreSQL 实现：n-gram 文本存入独立表，生成列 tsvector 走 GIN 索引，
+    原文上的 pg_trgm GIN 索引让子串匹配也能用上索引
+    """
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                f"video_id bigint PRIMARY KEY REFERENCES videos_video(id) ON DELETE CASCADE, "
+                f"raw text NOT NULL, "
+                f"document text NOT NULL, "
+                f"vector tsvector GENERATED ALWAYS AS ("
+                f"setweight(to_tsvector('simple', split_part(document, E'\\n', 1)), 'A') || "
+                f"setweight(to_tsvector('simple', split_part(document, E'\\n', 2)), 'B')) STORED)"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_vector ON {SEARCH_TABLE} USING gin (vector)")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_raw_trgm ON {SEARCH_TABLE} USING gin (raw gin_trgm_ops)"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index(self, video_id, title, description):
+        raw = f"{title or ''}\n{description or ''}".lower()
+        document = f"{index_text(title)}\n{index_text(description)}"
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (video_id, raw, document) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (video_id) DO UPDATE SET raw = EXCLUDED.raw, document = EXCLUDED.document",
+                [video_id, raw, document]
+            )
+
+    def remove(self, video_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE video_id = %s", [video_id])
+
+    def tsquery(self, query):
+        terms = []
+        for token in tokenize(query, for_query=True):
+            terms.append(f"'{token}'" if CJK_RE.fullmatch(token) else f"'{token}':*")
+        return ' & '.join(terms)
+
+    def search(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        pattern = '%' + query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT video_id FROM {SEARCH_TABLE} "
+            f"WHERE vector @@ to_tsquery('simple', %s) OR raw LIKE %s",
+            [tsquery, pattern]
+        )).annotate(search_rank=RawSQL(
+            f"SELECT ts_rank(vector, to_tsquery('simple', %s)) + similarity(raw, %s) "
+            f"FROM {SEARCH_TABLE} WHERE video_id = {table}.id",
+            [tsquery, query.lower()]
+        )).order_by('-search_rank', '-id')
+
+
+def get_search_backend(connection=None):
+    connection = connection or default_connection
+    if connection.vendor == 'sqlite':
+        return SQLiteFTS5Backend(connection)
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend(connection)
+    return SearchBackend(connection)
+
+
+def search_videos(queryset, query):
+    """
+    在 queryset 范围内检索，结果按相关度排序
+    """
+    return get_search_backend().search(queryset, query)
@@ -1,10 +1,98 @@
+import os
+import time
 from celery import shared_task
-from .models import Video
+from django.conf import settings
+from .models import (
+    Video, VideoRendition, RESOLUTIONS,
+    probe_video_duration, generate_thumbnail, transcode_rendition, write_master_playlist,
+)
+
 
 @shared_task
 def process_video(video_id):
     """
-    异步处理视频压缩和多码率生成
+    视频处理流水线入口：探测时长、生成缩略图，然后把各码率转码任务分发给 worker 并行执行
+    """
+    video = Video.objects.get(id=video_id)
+    video_path = video.video_file.path
+    try:
+        duration = probe_video_duration(video_path)
+    except Exception as e:
+        Video.objects.filter(id=video_id).update(status='failed', processing_error=f"探测视频失败: {e}")
+        return
+    Video.objects.filter(id=video_id).update(duration=duration)
+
+    if not video.thumbnail:
+        try:
+            if not os.path.exists(video.thumbnail_path):
+                generate_thumbnail(video_path, video.thumbnail_path)
+            Video.objects.filter(id=video_id).update(thumbnail=video.default_thumbnail_name)
+        except Exception as e:
+            print(f"生成缩略图失败: {e}")
+
+    for resolution in RESOLUTIONS:
+        VideoRendition.objects.update_or_create(
+            video_id=video_id, resolution=resolution,
+            defaults={'status': 'pending', 'progress': 0, 'error': ''}
+        )
+    for resolution in RESOLUTIONS:
+        transcode_video_rendition.delay(video_id, resolution)
+
+
+@shared_task
+def generate_video_thumbnail(video_id):
+    """
+    为已有视频补生成缩略图
+    """
+    video = Video.objects.get(id=video_id)
+    if not os.path.exists(video.thumbnail_path):
+        generate_thumbnail(video.video_file.path, video.thumbnail_path)
+    Video.objects.filter(id=video_id).update(thumbnail=video.default_thumbnail_name)
+
+
+@shared_task
+def transcode_video_rendition(video_id, resolution):
+    """
+    转码单个码率版本，并实时记录进度
     """
     video = Video.objects.get(id=video_id)
-    video.save()  # 调用 save 方法生成多码率版本
\ No newline at end of file
+    rendition = VideoRendition.objects.filter(video_id=video_id, resolution=resolution)
+    rendition.update(status='running', progress=0)
+
+    last_report = {'progress': 0, 'at': 0}
+
+    def report(progress):
+        # 限制写库频率：进度每增加 5% 或每隔 2 秒才更新一次
+        now = time.monotonic()
+        if progress - last_report['progress'] >= 0.05 or now - last_report['at'] >= 2:
+            rendition.update(progress=progress)
+            last_report.update(progress=progress, at=now)
+
+    try:
+        output_path = transcode_rendition(video.video_file.path, video.hls_dir, resolution, video.duration, report)
+        rendition.update(
+            status='done', progress=1,
+            file_path=os.path.relpath(output_path, settings.MEDIA_ROOT),
+        )
+    except Exception as e:
+        rendition.update(status='failed', error=str(e))
+    finalize_video_processing(video_id)
+
+
+def finalize_video_processing(video_id):
+    """
+    所有码率版本都结束后生成 HLS 主播放列表并更新视频状态；由最后完成的转码任务触发，可重复调用
+    """
+    renditions = VideoRendition.objects.filter(video_id=video_id)
+    if renditions.filter(status__in=['pending', 'running']).exists():
+        return
+    done = list(renditions.filter(status='done').values_list('resolution', flat=True))
+    if done:
+        video = Video.objects.get(id=video_id)
+        master_path = write_master_playlist(video.hls_dir, done, video.duration)
+        Video.objects.filter(id=video_id, status='processing').update(
+            status='ready', hls_manifest=os.path.relpath(master_path, settings.MEDIA_ROOT),
+        )
+    else:
+        errors = '; '.join(renditions.values_list('error', flat=True))
+        Video.objects.filter(id=video_id, status='processing').update(status='failed', processing_error=errors)
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import importlib
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from kombu.exceptions import OperationalError
+from rest_framework.test import APIClient
+
+from homework.models import Homework
+from users.models import CustomUser
+from .models import Video, VideoRendition, RESOLUTIONS, write_master_playlist
+from .search import tokenize
+from . import tasks
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class VideoTestCase(TestCase):
+    def setUp(self):
+        self.teacher = CustomUser.objects.create_user(
+            username='teacher', email='teacher@example.com', password='password123',
+            is_verified_teacher=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def create_video(self, **kwargs):
+        defaults = {
+            'title': '测试视频',
+            'teacher': self.teacher,
+            'video_file': SimpleUploadedFile('lesson.mp4', b'fake video'),
+            'subject': 'math',
+            'education_level': 'high',
+        }
+        defaults.update(kwargs)
+        return Video.objects.create(**defaults)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class VideoUploadBrokerDownTest(TransactionTestCase):
+    def test_upload_returns_503_when_broker_is_down(self):
+        teacher = CustomUser.objects.create_user(
+            username='teacher', email='teacher@example.com', is_verified_teacher=True,
+        )
+        client = APIClient()
+        client.force_authenticate(teacher)
+        with mock.patch('videos.views.process_video') as process_video:
+            process_video.delay.side_effect = OperationalError('broker down')
+            response = client.post('/videos/upload/', {
+                'title': '一元二次方程',
+                'video_file': SimpleUploadedFile('lesson.mp4', b'fake video'),
+                'subject': 'math',
+                'education_level': 'high',
+            })
+        self.assertEqual(response.status_code, 503)
+        video = Video.objects.get(id=response.json()['video_id'])
+        self.assertEqual(video.status, 'failed')
+
+    def test_hint_precompute_outage_does_not_fail_upload(self):
+        teacher = CustomUser.objects.create_user(
+            username='teacher', email='teacher@example.com', is_verified_teacher=True,
+        )
+        client = APIClient()
+        client.force_authenticate(teacher)
+        with mock.patch('videos.views.process_video'), \
+                mock.patch('videos.views.precompute_question_hints') as precompute, \
+                mock.patch('builtins.print') as printed:
+            precompute.delay.side_effect = OperationalError('broker down')
+            response = client.post('/videos/upload/', {
+                'title': '一元二次方程',
+                'video_file': SimpleUploadedFile('lesson.mp4', b'fake video'),
+                'subject': 'math',
+                'education_level': 'high',
+                'homework_title': '课后作业',
+                'questions': '[{"question_type": "single", "text": "q", "options": ["A", "B"], "answer": "A"}]',
+            })
+        self.assertEqual(response.status_code, 201)
+        precompute.delay.assert_called_once()
+        # 作业已经创建，不能再报"作业创建失败"
+        self.assertFalse(any('作业创建失败' in str(c) for c in printed.call_args_list))
+        self.assertEqual(Homework.objects.get(video_id=response.json()['video_id']).questions.count(), 1)
+
+
+class VideoProcessingPipelineTest(VideoTestCase):
+    def test_upload_returns_processing_and_enqueues_pipeline(self):
+        with mock.patch('videos.views.process_video') as process_video, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/videos/upload/', {
+                'title': '一元二次方程',
+                'video_file': SimpleUploadedFile('lesson.mp4', b'fake video'),
+                'subject': 'math',
+                'education_level': 'high',
+            })
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['status'], 'processing')
+        process_video.delay.assert_called_once_with(body['video_id'])
+
+    def test_broker_failure_after_commit_marks_video_failed(self):
+        # 外层还有事务时视频行提交后才投递，投递失败把视频标记为处理失败
+        with mock.patch('videos.views.process_video') as process_video, \
+                self.captureOnCommitCallbacks(execute=True):
+            process_video.delay.side_effect = OperationalError('broker down')
+            response = self.client.post('/videos/upload/', {
+                'title': '一元二次方程',
+                'video_file': SimpleUploadedFile('lesson.mp4', b'fake video'),
+                'subject': 'math',
+                'education_level': 'high',
+            })
+        video = Video.objects.get(id=response.json()['video_id'])
+        self.assertEqual(video.status, 'failed')
+        self.assertIn('broker down', video.processing_error)
+
+    def test_process_video_fans_out_one_task_per_rendition(self):
+        video = self.create_video(status='processing')
+        with mock.patch('videos.tasks.probe_video_duration', return_value=42.0), \
+                mock.patch('videos.tasks.generate_thumbnail'), \
+                mock.patch('videos.tasks.transcode_video_rendition') as transcode:
+            tasks.process_video(video.id)
+        video.refresh_from_db()
+        self.assertEqual(video.duration, 42.0)
+        self.assertEqual(transcode.delay.call_count, len(RESOLUTIONS))
+        self.assertEqual(video.renditions.filter(status='pending').count(), len(RESOLUTIONS))
+
+    def test_probe_failure_marks_video_failed(self):
+        video = self.create_video(status='processing')
+        with mock.patch('videos.tasks.probe_video_duration', side_effect=Exception('bad file')):
+            tasks.process_video(video.id)
+        video.refresh_from_db()
+        self.assertEqual(video.status, 'failed')
+        self.assertIn('bad file', video.processing_error)
+
+    def test_video_ready_after_last_rendition_finishes(self):
+        video = self.create_video(status='processing', duration=10)
+        for resolution in RESOLUTIONS:
+            VideoRendition.objects.create(video=video, resolution=resolution)
+
+        def fake_transcode(input_path, output_dir, resolution, duration, progress_callback):
+            progress_callback(0.5)
+            return os.path.join(output_dir, resolution, 'index.m3u8')
+
+        with mock.patch('videos.tasks.transcode_rendition', side_effect=fake_transcode):
+            for resolution in RESOLUTIONS:
+                video.refresh_from_db()
+                self.assertEqual(video.status, 'processing')
+                tasks.transcode_video_rendition(video.id, resolution)
+        video.refresh_from_db()
+        self.assertEqual(video.status, 'ready')
+
+        response = self.client.get(f'/videos/{video.id}/processing/')
+        self.assertEqual(response.status_code, 200)
+        renditions = response.json()['renditions']
+        self.assertEqual({r['status'] for r in renditions}, {'done'})
+        self.assertEqual({r['progress'] for r in renditions}, {1})
+
+
+class HLSPackagingTest(VideoTestCase):
+    def test_master_playlist_lists_lowest_bitrate_first(self):
+        output_dir = tempfile.mkdtemp(dir=MEDIA_ROOT)
+        master = write_master_playlist(output_dir, ['1080p', '480p', '720p'], 120)
+        with open(master) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], '#EXTM3U')
+        playlists = [line for line in lines if not line.startswith('#')]
+        self.assertEqual(playlists, ['480p/index.m3u8', '720p/index.m3u8', '1080p/index.m3u8'])
+
+    def test_manifest_url_in_feed_after_processing(self):
+        video = self.create_video(status='processing', duration=10)
+        VideoRendition.objects.create(video=video, resolution='480p', status='done')
+        tasks.finalize_video_processing(video.id)
+        video.refresh_from_db()
+        self.assertEqual(video.status, 'ready')
+        self.assertEqual(video.hls_manifest.name, f'hls/{video.id}/master.m3u8')
+        self.assertTrue(os.path.exists(video.hls_manifest.path))
+
+        response = self.client.get('/videos/')
+        result = response.json()['results'][0]
+        self.assertEqual(result['manifest_url'], f'/media/hls/{video.id}/master.m3u8')
+
+
+class FeedQueryTest(VideoTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(12):
+            teacher = CustomUser.objects.create_user(
+                username=f'teacher{i}', email=f'teacher{i}@example.com', avatar=f'avatars/t{i}.png',
+            )
+            self.create_video(title=f'视频{i}', teacher=teacher, thumbnail=f'thumbnails/v{i}.jpg')
+
+    def test_query_count_is_constant_regardless_of_page_size(self):
+        # COUNT(*) + 一次联表投影查询
+        for page_size in (1, 5, 12):
+            with self.assertNumQueries(2):
+                response = self.client.get('/videos/', {'page_size': page_size})
+            self.assertEqual(len(response.json()['results']), page_size)
+
+    def test_feed_row_payload(self):
+        with mock.patch('os.path.exists') as exists:
+            response = self.client.get('/videos/', {'page_size': 1})
+        exists.assert_not_called()
+        result = response.json()['results'][0]
+        self.assertEqual(result['title'], '视频11')
+        self.assertEqual(result['teacher_name'], 'teacher11')
+        self.assertEqual(result['teacher_avatar'], '/media/avatars/t11.png')
+        self.assertEqual(result['thumbnail_url'], 'http://testserver/media/thumbnails/v11.jpg')
+        self.assertTrue(result['video_url'].startswith('/media/videos/lesson'))
+
+
+class ThumbnailFieldTest(VideoTestCase):
+    def test_backfill_migration_uses_existing_thumbnail_files(self):
+        with_thumb = self.create_video()
+        without_thumb = self.create_video()
+        os.makedirs(os.path.dirname(with_thumb.thumbnail_path), exist_ok=True)
+        open(with_thumb.thumbnail_path, 'wb').close()
+
+        migration = importlib.import_module('videos.migrations.0008_backfill_video_thumbnail')
+        migration.backfill_thumbnails(apps, None)
+
+        with_thumb.refresh_from_db()
+        without_thumb.refresh_from_db()
+        self.assertEqual(with_thumb.thumbnail.name, with_thumb.default_thumbnail_name)
+        self.assertEqual(without_thumb.thumbnail.name, '')
+
+    def test_favorites_do_not_touch_filesystem(self):
+        for i in range(3):
+            self.teacher.favorite_videos.add(self.create_video(thumbnail=f'thumbnails/f{i}.jpg'))
+        with mock.patch('os.path.exists') as exists, self.assertNumQueries(1):
+            response = self.client.get('/videos/favorites/')
+        exists.assert_not_called()
+        results = response.json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(r['thumbnail_url'].startswith('http://testserver/media/thumbnails/') for r in results))
+
+
+class KeysetPaginationTest(VideoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.videos = [self.create_video(title=f'视频{i}') for i in range(7)]
+        # 制造相同的 created_at，验证 id 作为次序键
+        same_time = self.videos[3].created_at
+        Video.objects.filter(id__in=[v.id for v in self.videos[2:5]]).update(created_at=same_time)
+
+    def test_cursor_walks_every_video_once_without_count(self):
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            with self.assertNumQueries(1):
+                body = self.client.get('/videos/', {'cursor': cursor, 'page_size': 2}).json()
+            self.assertNotIn('count', body)
+            seen.extend(r['id'] for r in body['results'])
+            cursor = body['next']
+        expected = list(Video.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_ordering_and_cursor_are_rejected(self):
+        self.assertEqual(self.client.get('/videos/', {'ordering': 'teacher__password'}).status_code, 400)
+        self.assertEqual(self.client.get('/videos/', {'ordering': 'title', 'cursor': ''}).status_code, 400)
+        self.assertEqual(self.client.get('/videos/', {'cursor': 'not-a-cursor'}).status_code, 400)
+
+    def test_page_size_is_validated_and_clamped(self):
+        self.assertEqual(self.client.get('/videos/', {'cursor': '', 'page_size': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/videos/', {'page_size': '2.5'}).status_code, 400)
+        for page_size, expected in (('0', 1), ('-3', 1), ('1000', 50)):
+            body = self.client.get('/videos/', {'cursor': '', 'page_size': page_size}).json()
+            self.assertEqual(body['page_size'], expected)
+            self.assertEqual(len(body['results']), min(expected, 7))
+            self.assertEqual(body['next'] is None, expected >= 7)
+
+
+class VideoSearchTest(VideoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quadratic = self.create_video(title='一元二次方程', description='配方法与求根公式')
+        self.linear = self.create_video(title='函数入门', description='从一次方程到一元二次方程的过渡')
+        self.english = self.create_video(title='English Grammar', description='present perfect tense')
+
+    def search(self, query, **params):
+        params['search'] = query
+        return [r['id'] for r in self.client.get('/videos/', params).json()['results']]
+
+    def test_tokenize_uses_cjk_ngrams(self):
+        self.assertEqual(tokenize('二次方程', for_query=True), ['二次', '次方', '方程'])
+        self.assertEqual(tokenize('方', for_query=True), ['方'])
+        self.assertEqual(tokenize('Hello 世界'), ['hello', '世', '界', '世界'])
+
+    def test_cjk_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search('二次方程'), [self.quadratic.id, self.linear.id])
+        self.assertEqual(self.search('求根'), [self.quadratic.id])
+        self.assertEqual(self.search('方'), [self.quadratic.id, self.linear.id])
+
+    def test_latin_prefix_search(self):
+        self.assertEqual(self.search('gramm'), [self.english.id])
+        self.assertEqual(self.search('PERFECT tense'), [self.english.id])
+
+    def test_explicit_ordering_overrides_relevance(self):
+        self.assertEqual(self.search('方程', ordering='-created_at'), [self.linear.id, self.quadratic.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.quadratic.title = '勾股定理'
+        self.quadratic.description = '直角三角形三边关系'
+        self.quadratic.save()
+        self.assertEqual(self.search('勾股'), [self.quadratic.id])
+        self.assertEqual(self.search('求根'), [])
+        self.quadratic.delete()
+        self.assertEqual(self.search('勾股'), [])
@@ -6,6 +6,7 @@ urlpatterns = [
     path('', views.list_videos, name='list_videos'),  # 新增：支持 GET /videos/
     path('manage/', views.list_uploaded_videos),
     path('upload/', views.upload_video),
+    path('<int:video_id>/processing/', views.video_processing_status, name='video_processing_status'),  # 转码进度查询
     path('<int:video_id>/homework/', views.video_homework, name='video_homework'),
     path('<int:video_id>/submit_homework/', submit_homework_by_video, name='submit_homework_by_video'),
     path('favorites/', views.favorites_videos, name='favorites_videos'),  # 新增收藏视频接口
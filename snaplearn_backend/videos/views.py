@@ -1,19 +1,39 @@
+import os
 from django.http import JsonResponse
 from django.core.exceptions import ValidationError
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db import transaction
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from .models import Video
+from .tasks import process_video, generate_video_thumbnail
+from .feed import (
+    FEED_ORDERINGS, CURSOR_ORDERING, FEED_PAGE_SIZE, FEED_MAX_PAGE_SIZE,
+    filter_feed, feed_rows, serialize_feed_row, keyset_page,
+)
 from users.models import CustomUser
 from django.conf import settings
 
 from homework.models import Homework, Question
+from homework.regrade import request_regrade
+from homework.tasks import precompute_question_hints, regrade_homework_answers
+from snaplearn_backend.celery import BrokerError, delay_best_effort
 
 # Create your views here.
 
+def enqueue_processing(video_id):
+    """
+    把视频交给转码流水线；消息队列不可用时把视频标记为处理失败，返回是否投递成功
+    """
+    try:
+        process_video.delay(video_id)
+    except BrokerError as e:
+        Video.objects.filter(id=video_id).update(status='failed', processing_error=f"转码任务投递失败: {e}")
+        return False
+    return True
+
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -55,38 +75,24 @@ def upload_video(request):
             education_level=education_level
         )
         video.full_clean()  # 调用模型层校验（如文件大小/格式等）
-        video.save()
-        # 保存自定义封面或自动生成
-        import os
-        base, ext = os.path.splitext(os.path.basename(video.video_file.name))
-        thumb_dir = os.path.join(settings.MEDIA_ROOT, "thumbnails")
-        os.makedirs(thumb_dir, exist_ok=True)
-        thumb_path = os.path.join(thumb_dir, f"{base}.jpg")
-        if thumbnail:
-            with open(thumb_path, 'wb+') as f:
-                for chunk in thumbnail.chunks():
-                    f.write(chunk)
-        else:
-            # 自动用视频第一帧生成封面
-            try:
-                video_path = video.video_file.path
-                import subprocess
-                # 确保 ffmpeg 路径正确，且加上 -y 覆盖参数
-                cmd = [
-                    "ffmpeg",
-                    "-y",
-                    "-i", video_path,
-                    "-ss", "00:00:01",
-                    "-vframes", "1",
-                    "-f", "image2",
-                    thumb_path
-                ]
-                # 使用 check=True 让异常抛出
-                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"ffmpeg error: {e.stderr.decode('utf-8')}")
-            except Exception as e:
-                print(f"自动生成视频封面失败: {e}")
+        video.status = 'processing'
+        queued = []
+        with transaction.atomic():
+            video.save()
+            # 保存自定义封面；未上传封面时由转码流水线自动截帧生成
+            if thumbnail:
+                os.makedirs(os.path.dirname(video.thumbnail_path), exist_ok=True)
+                with open(video.thumbnail_path, 'wb+') as f:
+                    for chunk in thumbnail.chunks():
+                        f.write(chunk)
+                video.thumbnail = video.default_thumbnail_name
+                video.save(update_fields=['thumbnail'])
+            # 探测、截图、多码率转码均交给 Celery worker，请求立即返回；视频行提交后再投递
+            transaction.on_commit(lambda: queued.append(enqueue_processing(video.id)))
+        if queued == [False]:
+            return JsonResponse(
+                {'error': '视频处理服务暂不可用，请稍后重新上传', 'video_id': video.id, 'status': 'failed'}, status=503
+            )
 
         # 新增：同步创建作业内容
         homework_title = request.POST.get('homework_title')
@@ -111,15 +117,43 @@ def upload_video(request):
                         answer=q.get('answer', ''),
                         score=q.get('score', 5)
                     )
+                transaction.on_commit(lambda: delay_best_effort(precompute_question_hints, hw.id))
             except Exception as e:
                 print(f"作业创建失败: {e}")
 
-        return JsonResponse({'message': '视频上传成功', 'video_id': video.id}, status=201)
+        return JsonResponse({'message': '视频上传成功', 'video_id': video.id, 'status': video.status}, status=201)
     except ValidationError as e:
         return JsonResponse({'error': e.message_dict if hasattr(e, 'message_dict') else str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': f'上传失败: {str(e)}'}, status=500)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def video_processing_status(request, video_id):
+    """
+    查询视频转码流水线状态及各码率版本的进度
+    """
+    try:
+        video = Video.objects.get(id=video_id)
+    except Video.DoesNotExist:
+        return JsonResponse({'error': '视频不存在'}, status=404)
+    renditions = [
+        {
+            'resolution': r.resolution,
+            'status': r.status,
+            'progress': r.progress,
+            'error': r.error,
+        }
+        for r in video.renditions.order_by('id')
+    ]
+    return JsonResponse({
+        'video_id': video.id,
+        'status': video.status,
+        'duration': video.duration,
+        'error': video.processing_error,
+        'renditions': renditions,
+    }, status=200)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def view_video(request, video_id):
@@ -148,6 +182,7 @@ def list_uploaded_videos(request):
                 'is_free': video.is_free,
                 'price': video.price,
                 'created_at': video.created_at,
+                'status': video.status,
             }
             for video in videos
         ]
@@ -215,6 +250,11 @@ def delete_video(request, video_id):
                 os.remove(thumb_path)
             except Exception:
                 pass
+        # 删除转码产物
+        hls_dir = os.path.join(settings.MEDIA_ROOT, "hls", str(video_id))
+        if os.path.isdir(hls_dir):
+            import shutil
+            shutil.rmtree(hls_dir, ignore_errors=True)
         # 更新学科分类相关数据（如无视频则可做额外处理）
         from .models import Video as VideoModel
         remain_count = VideoModel.objects.filter(subject=subject, education_level=education_level).count()
@@ -244,39 +284,17 @@ def update_video(request, video_id):
         video.subject = request.POST.get('subject', video.subject)
         video.education_level = request.POST.get('education_level', video.education_level)
         video.save()
-        # 保存自定义封面或自动生成
-        import os
-        base, ext = os.path.splitext(os.path.basename(video.video_file.name))
-        thumb_dir = os.path.join(settings.MEDIA_ROOT, "thumbnails")
-        os.makedirs(thumb_dir, exist_ok=True)
-        thumb_path = os.path.join(thumb_dir, f"{base}.jpg")
+        # 保存自定义封面；封面缺失时异步补生成
+        thumb_path = video.thumbnail_path
         if thumbnail:
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
             with open(thumb_path, 'wb+') as f:
                 for chunk in thumbnail.chunks():
                     f.write(chunk)
-        elif not os.path.exists(thumb_path):
-            try:
-                video_path = video.video_file.path
-                if not os.path.exists(video_path):
-                    print(f"视频文件不存在，无法生成封面: {video_path}")
-                else:
-                    import subprocess
-                    cmd = [
-                        "ffmpeg",
-                        "-y",
-                        "-i", video_path,
-                        "-ss", "00:00:01",
-                        "-vframes", "1",
-                        "-f", "image2",
-                        thumb_path
-                    ]
-                    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-            except FileNotFoundError as e:
-                print(f"ffmpeg 未安装或找不到: {e}")
-            except subprocess.CalledProcessError as e:
-                print(f"ffmpeg error: {e.stderr.decode('utf-8')}")
-            except Exception as e:
-                print(f"自动生成视频封面失败: {e}")
+            video.thumbnail = video.default_thumbnail_name
+            video.save(update_fields=['thumbnail'])
+        elif not video.thumbnail:
+            transaction.on_commit(lambda: delay_best_effort(generate_video_thumbnail, video.id))
 
         # 新增：同步更新作业内容
         homework_title = request.POST.get('homework_title')
@@ -286,27 +304,24 @@ def update_video(request, video_id):
             try:
                 import json
                 questions = json.loads(questions_json)
-                hw, created = Homework.objects.get_or_create(video=video, defaults={
-                    'title': homework_title,
-                    'description': homework_description or '',
-                    'teacher': request.user,
-                })
-                if not created:
-                    hw.title = homework_title
-                    hw.description = homework_description or ''
-                    hw.teacher = request.user
-                    hw.save()
-                    # 删除原有题目
-                    hw.questions.all().delete()
-                for q in questions:
-                    Question.objects.create(
-                        homework=hw,
-                        question_type=q.get('question_type'),
-                        text=q.get('text'),
-                        options=q.get('options', []),
-                        answer=q.get('answer', ''),
-                        score=q.get('score', 5)
-                    )
+                with transaction.atomic():
+                    hw, created = Homework.objects.get_or_create(video=video, defaults={
+                        'title': homework_title,
+                        'description': homework_description or '',
+                        'teacher': request.user,
+                    })
+                    if not created:
+                        hw.title = homework_title
+                        hw.description = homework_description or ''
+                        hw.teacher = request.user
+                        hw.save(update_fields=['title', 'description', 'teacher'])
+                    # 原有题目原地更新，保留学生的答题记录；标准答案或分值变化时重新判分全班答案。
+                    # 待重新判分的题目与题目修改一起提交，投递失败时由定时任务补投
+                    regrade_ids, removed = sync_questions(hw, questions)
+                    if regrade_ids or removed:
+                        request_regrade(hw.id, regrade_ids)
+                        transaction.on_commit(lambda: delay_best_effort(regrade_homework_answers, hw.id, regrade_ids))
+                    transaction.on_commit(lambda: delay_best_effort(precompute_question_hints, hw.id))
             except Exception as e:
                 print(f"作业更新失败: {e}")
 
@@ -314,62 +329,86 @@ def update_video(request, video_id):
     except Video.DoesNotExist:
         return JsonResponse({'error': '视频不存在或无权限更新'}, status=404)
 
+QUESTION_FIELDS = ('question_type', 'text', 'options', 'answer', 'score')
+# 这些字段变化会影响已有答案的得分
+GRADING_FIELDS = ('question_type', 'answer', 'score')
+
+
+def sync_questions(homework, questions):
+    """
+    按提交的题目列表更新作业题目：只按 id 对应原有题目并原地更新，不带 id 的视为新题；
+    原有题目不在列表中的删除（按位置对应会在删除或调整顺序后把答案挂到别的题上）。
+    返回 (判分相关字段有变化的题目 id 列表, 删除的题目数)
+    """
+    existing = list(homework.questions.order_by('id'))
+    by_id = {q.id: q for q in existing}
+    matched = set()
+    regrade_ids = []
+    for data in questions:
+        values = {
+            'question_type': data.get('question_type'),
+            'text': data.get('text'),
+            'options': data.get('options', []),
+            'answer': data.get('answer', ''),
+            'score': data.get('score', 5),
+        }
+        qid = str(data.get('id') or '')
+        question = by_id.get(int(qid)) if qid.isdigit() else None
+        if question is None or question.id in matched:
+            Question.objects.create(homework=homework, **values)
+            continue
+        matched.add(question.id)
+        changed = [f for f in QUESTION_FIELDS if getattr(question, f) != values[f]]
+        if changed:
+            for field in changed:
+                setattr(question, field, values[field])
+            question.save(update_fields=changed)
+            if set(changed) & set(GRADING_FIELDS):
+                regrade_ids.append(question.id)
+    removed = [q.id for q in existing if q.id not in matched]
+    if removed:
+        Question.objects.filter(id__in=removed).delete()
+    return regrade_ids, len(removed)
+
 @api_view(['GET'])
 def list_videos(request):
     """
     支持 GET /videos/?education_level=xxx[,yyy,...]&subject=xxx&ordering=-created_at&teacher_id=xxx&search=xxx
+    传 cursor 参数（首页传空字符串）时改用游标分页：返回 next 游标，不返回 count
     """
     print("收到 /videos/ 请求 method:", request.method, "path:", request.path, "GET:", request.GET)  # 调试用
     if request.method == 'GET':
-        education_level = request.GET.get('education_level')
-        subject = request.GET.get('subject')
+        # 搜索时默认按相关度排序，显式传 ordering 则按指定字段排序
+        relevance = bool(request.GET.get('search', '').strip()) and 'ordering' not in request.GET
         ordering = request.GET.get('ordering', '-created_at')
-        teacher_id = request.GET.get('teacher_id')
-        search = request.GET.get('search', '').strip()
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 10))
-
-        qs = Video.objects.all()
-        # 支持学历等级多选
-        if education_level:
-            levels = [x.strip() for x in education_level.split(',') if x.strip()]
-            if levels:
-                qs = qs.filter(education_level__in=levels)
-        # 修正：学科筛选应为 subject 字段精确匹配
-        if subject:
-            qs = qs.filter(subject=subject)
-        if teacher_id:
-            if str(teacher_id).isdigit():
-                qs = qs.filter(teacher__id=int(teacher_id))
-        # 新增：模糊搜索
-        if search:
-            qs = qs.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search)
-            )
-        qs = qs.order_by(ordering)
-        paginator = Paginator(qs, page_size)
+        try:
+            page = int(request.GET.get('page', 1))
+            page_size = min(max(int(request.GET.get('page_size', FEED_PAGE_SIZE)), 1), FEED_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'page 和 page_size 必须是整数'}, status=400)
+
+        if ordering not in FEED_ORDERINGS:
+            return JsonResponse({'error': f"不支持的排序方式，可选: {', '.join(FEED_ORDERINGS)}"}, status=400)
+
+        if 'cursor' in request.GET:
+            if ordering != CURSOR_ORDERING:
+                return JsonResponse({'error': f'游标分页仅支持 {CURSOR_ORDERING} 排序'}, status=400)
+            try:
+                rows, next_cursor = keyset_page(filter_feed(request.GET), request.GET['cursor'], page_size)
+            except ValueError:
+                return JsonResponse({'error': '无效的游标'}, status=400)
+            return JsonResponse({
+                'results': [serialize_feed_row(row, request) for row in rows],
+                'next': next_cursor,
+                'page_size': page_size,
+            }, status=200)
+
+        qs = filter_feed(request.GET)
+        if not relevance:
+            qs = qs.order_by(ordering)
+        paginator = Paginator(feed_rows(qs), page_size)
         page_obj = paginator.get_page(page)
-        results = []
-        for v in page_obj:
-            # 修复缩略图URL为绝对路径
-            thumb_url = getattr(v, 'thumbnail_url', '') if hasattr(v, 'thumbnail_url') else ''
-            if thumb_url:
-                if not thumb_url.startswith('http'):
-                    thumb_url = request.build_absolute_uri(thumb_url)
-            results.append({
-                'id': v.id,
-                'title': v.title,
-                'description': v.description,
-                'video_url': v.video_file.url if v.video_file else '',
-                'teacher_id': v.teacher.id,
-                'teacher_name': v.teacher.username,
-                'teacher_avatar': v.teacher.avatar.url if v.teacher.avatar else '',
-                'created_at': v.created_at,
-                'thumbnail_url': thumb_url,
-                'subject': v.subject,  # 补充返回 subject 字段，便于前端学科分类
-                'education_level': v.education_level,  # 补充返回学历等级
-            })
+        results = [serialize_feed_row(row, request) for row in page_obj]
         return JsonResponse({
             'count': paginator.count,
             'results': results,
@@ -393,25 +432,7 @@ def favorite_videos(request):
     if not hasattr(CustomUser, 'favorite_videos'):
         CustomUser.add_to_class('favorite_videos', models.ManyToManyField(Video, related_name='favorited_by', blank=True))
     if request.method == 'GET':
-        videos = user.favorite_videos.all()
-        results = []
-        for v in videos:
-            # 修复缩略图URL为绝对路径
-            thumb_url = getattr(v, 'thumbnail_url', '') if hasattr(v, 'thumbnail_url') else ''
-            if thumb_url:
-                if not thumb_url.startswith('http'):
-                    thumb_url = request.build_absolute_uri(thumb_url)
-            results.append({
-                'id': int(v.id),
-                'title': v.title,
-                'description': v.description,
-                'video_url': v.video_file.url if v.video_file else '',
-                'teacher_id': int(v.teacher.id),
-                'teacher_name': v.teacher.username,
-                'teacher_avatar': v.teacher.avatar.url if v.teacher.avatar else '',
-                'created_at': v.created_at,
-                'thumbnail_url': thumb_url,
-            })
+        results = [serialize_feed_row(row, request) for row in feed_rows(user.favorite_videos.all())]
         return JsonResponse({'results': results}, status=200)
     elif request.method == 'POST':
         video_id = request.data.get('video_id') or (request.data['video_id'] if 'video_id' in request.data else None)
@@ -460,20 +481,7 @@ def favorites_videos(request):
     # 如果没有，返回空列表即可
     results = []
     if hasattr(user, 'favorite_videos'):
-        videos = user.favorite_videos.all()
-        for v in videos:
-            results.append({
-                'id': v.id,
-                'title': v.title,
-                'description': v.description,
-                'video_url': v.video_file.url if v.video_file else '',
-                'thumbnail_url': v.thumbnail_url if hasattr(v, 'thumbnail_url') else '',
-                'teacher_id': v.teacher.id if v.teacher else None,
-                'teacher_name': v.teacher.username if v.teacher else '',
-                'teacher_avatar': v.teacher.avatar.url if v.teacher and v.teacher.avatar else '',
-                'created_at': v.created_at,
-                # ...可补充其它字段...
-            })
+        results = [serialize_feed_row(row, request) for row in feed_rows(user.favorite_videos.all())]
     return Response({'results': results})
 
 @api_view(['GET'])
@@ -484,13 +492,14 @@ def video_homework(request, video_id):
     """
     try:
         hw = Homework.objects.get(video_id=video_id)
-        questions = hw.questions.all()
+        questions = hw.questions.order_by('id')
         data = {
             "id": hw.id,  # 新增
             "title": hw.title,
             "description": hw.description,
             "questions": [
                 {
+                    "id": q.id,
                     "question_type": q.question_type,
                     "text": q.text,
                     "options": q.options,